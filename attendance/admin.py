@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Attendance
+from .models import (
+    Attendance, SchoolHoliday, AttendanceJob,
+    StudentMonthlyAttendance, ClassDailyAttendance, ClassMonthlyAttendance,
+)
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
@@ -9,6 +12,8 @@ class AttendanceAdmin(admin.ModelAdmin):
     search_fields = ('student__name', 'date')
     date_hierarchy = 'date'
     raw_id_fields = ('student',)
+    # Counting the whole table on every page is too slow - use the rollups for totals
+    show_full_result_count = False
     
     fieldsets = (
         ('Basic Information', {
@@ -38,4 +43,64 @@ class AttendanceAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         """Optimize queryset by prefetching related objects"""
-        return super().get_queryset(request).select_related('student')
\ No newline at end of file
+        return super().get_queryset(request).select_related('student')
+
+
+@admin.register(SchoolHoliday)
+class SchoolHolidayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name')
+    search_fields = ('name',)
+    date_hierarchy = 'date'
+
+
+@admin.register(AttendanceJob)
+class AttendanceJobAdmin(admin.ModelAdmin):
+    list_display = ('year', 'month', 'status', 'processed_students', 'total_students',
+                    'school_days', 'created_by', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('job_id', 'year', 'month', 'status', 'total_students', 'processed_students',
+                       'school_days', 'error', 'created_by', 'created_at', 'updated_at')
+    
+    def has_add_permission(self, request):
+        """Jobs are started from the Route Management page"""
+        return False
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """Rollups are maintained from attendance records and are read-only here"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def attendance_rate(self, obj):
+        """Attendance rate as a percentage"""
+        rate = obj.attendance_rate
+        return f"{rate:.0%}" if rate is not None else "-"
+    attendance_rate.short_description = "Rate"
+
+
+@admin.register(StudentMonthlyAttendance)
+class StudentMonthlyAttendanceAdmin(RollupAdmin):
+    list_display = ('student', 'month', 'school_days', 'present_days', 'absent_days', 'attendance_rate')
+    list_filter = ('month', 'student__class_grade')
+    search_fields = ('student__name',)
+    list_select_related = ('student',)
+
+
+@admin.register(ClassDailyAttendance)
+class ClassDailyAttendanceAdmin(RollupAdmin):
+    list_display = ('class_grade', 'date', 'present', 'absent', 'attendance_rate')
+    list_filter = ('class_grade',)
+    date_hierarchy = 'date'
+
+
+@admin.register(ClassMonthlyAttendance)
+class ClassMonthlyAttendanceAdmin(RollupAdmin):
+    list_display = ('class_grade', 'month', 'school_days', 'present', 'absent', 'attendance_rate')
+    list_filter = ('class_grade', 'month')
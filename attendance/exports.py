@@ -0,0 +1,71 @@
+"""
+Attendance history exports (see core.export).
+"""
+from datetime import timedelta
+
+from django.db.models import F
+
+from core.export import CHUNK_SIZE
+from students.models import Student
+from .models import Attendance
+from .school_calendar import school_days_between
+
+FIELDS = ['date', 'student_id', 'student_name', 'class_grade', 'presence']
+
+
+def attendance_rows(start, end, class_grade=None):
+    """
+    Attendance of every student from start to end (inclusive), ordered by
+    date and student name and read one day at a time. In sparse mode the
+    present rows are filled in from the active students.
+
+    Args:
+        start (datetime.date): First date to export
+        end (datetime.date): Last date to export
+        class_grade (str): Only export students of this class
+
+    Yields:
+        dicts with the keys in FIELDS
+    """
+    if Attendance.is_sparse():
+        yield from _sparse_rows(start, end, class_grade)
+        return
+
+    records = Attendance.objects.all()
+    if class_grade:
+        records = records.filter(student__class_grade=class_grade)
+    # One query per day: sorting a day's records is quick, while sorting the whole range
+    # by (date, name) would hold back the first row until every record had been read
+    date = start
+    while date <= end:
+        yield from (
+            records
+            .filter(date=date)
+            .order_by('student__name')
+            .values('date', 'student_id', 'presence',
+                    student_name=F('student__name'), class_grade=F('student__class_grade'))
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        date += timedelta(days=1)
+
+
+def _sparse_rows(start, end, class_grade):
+    """attendance_rows() for sparse mode"""
+    students = Student.objects.filter(is_active=True).order_by('name')
+    if class_grade:
+        students = students.filter(class_grade=class_grade)
+
+    for date in school_days_between(start, end + timedelta(days=1)):
+        absent = set(
+            Attendance.objects
+            .filter(date=date, presence=False)
+            .values_list('student_id', flat=True)
+        )
+        for student in students.values('student_id', 'name', 'class_grade').iterator(chunk_size=CHUNK_SIZE):
+            yield {
+                'date': date,
+                'student_id': student['student_id'],
+                'student_name': student['name'],
+                'class_grade': student['class_grade'],
+                'presence': student['student_id'] not in absent,
+            }
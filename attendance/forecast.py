@@ -0,0 +1,152 @@
+"""
+Attendance forecasting.
+
+Predicts each student's chance of being present on a future date from
+their recent attendance history, so a provisional plan can be built
+before the day's attendance is known.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from django.db.models import Sum
+
+from .models import Attendance, StudentMonthlyAttendance
+from .school_calendar import school_days_between
+
+# How much history is used for a prediction
+HISTORY_WEEKS = 8
+
+# Records on the same weekday as the predicted date count this much more
+SAME_WEEKDAY_WEIGHT = 3.0
+
+# Weight of a record drops by this factor for every week of age
+WEEKLY_DECAY = 0.8
+
+# Students with little history are pulled towards their long-run presence
+# rate from the monthly rollups, or this rate when there is none
+PRIOR_PRESENCE = 0.9
+PRIOR_WEIGHT = 1.0
+PRIOR_MONTHS = 6
+
+# Students at or above this probability are planned as present
+PRESENCE_THRESHOLD = 0.5
+
+
+def predict_presence(date, student_ids=None):
+    """
+    Predict the probability that each student is present on a date.
+    Uses a day-of-week-weighted, exponentially decaying moving presence rate.
+
+    Args:
+        date (datetime.date): Date to predict
+        student_ids: Optional iterable of student IDs to limit the prediction to
+
+    Returns:
+        dict mapping student_id to a probability between 0 and 1.
+        Students without any history in the window are not included.
+    """
+    start = date - timedelta(weeks=HISTORY_WEEKS)
+    records = Attendance.objects.filter(date__gte=start, date__lt=date)
+    if student_ids is not None:
+        records = records.filter(student_id__in=student_ids)
+
+    if Attendance.is_sparse():
+        return _predict_from_absences(date, start, records, student_ids)
+
+    rows = list(records.values_list('student_id', 'date', 'presence'))
+    if not rows:
+        return {}
+
+    ids, dates, presence = zip(*rows)
+    students, index = np.unique(np.array(ids, dtype=object), return_inverse=True)
+
+    weights = _record_weights(date, dates)
+    present_weight = np.bincount(index, weights=weights * np.array(presence, dtype=float),
+                                 minlength=len(students))
+    total_weight = np.bincount(index, weights=weights, minlength=len(students))
+    prior = _prior_rates(start, students)
+    rates = (present_weight + PRIOR_WEIGHT * prior) / (total_weight + PRIOR_WEIGHT)
+
+    return dict(zip(students, rates.tolist()))
+
+
+def _prior_rates(start, students):
+    """
+    Long-run presence rate of each student over the months before the
+    history window, read from the monthly rollups.
+
+    Args:
+        start (datetime.date): First day of the history window
+        students: Array of student IDs
+
+    Returns:
+        Array of rates aligned with `students`
+    """
+    window_month = start.replace(day=1)
+    first_month = (window_month - timedelta(days=31 * PRIOR_MONTHS)).replace(day=1)
+    totals = {
+        student_id: (present, days)
+        for student_id, present, days in (
+            StudentMonthlyAttendance.objects
+            .filter(student_id__in=list(students), month__gte=first_month, month__lt=window_month)
+            .values_list('student_id')
+            .annotate(present=Sum('present_days'), days=Sum('school_days'))
+        )
+    }
+    return np.array([
+        totals[student_id][0] / totals[student_id][1]
+        if student_id in totals and totals[student_id][1] else PRIOR_PRESENCE
+        for student_id in students
+    ])
+
+
+def _record_weights(date, dates):
+    """Weight of the records on each of `dates` for a prediction on `date`"""
+    age_days = np.array([(date - d).days for d in dates], dtype=float)
+    same_weekday = np.array([d.weekday() == date.weekday() for d in dates])
+    return WEEKLY_DECAY ** (age_days / 7) * np.where(same_weekday, SAME_WEEKDAY_WEIGHT, 1.0)
+
+
+def _predict_from_absences(date, start, records, student_ids):
+    """
+    predict_presence() for sparse attendance, where only absences are stored.
+    Every school day in the window counts as present unless an absence exists.
+    """
+    days = school_days_between(start, date)
+    rows = list(records.filter(presence=False).values_list('student_id', 'date'))
+    if student_ids is None:
+        student_ids = {student_id for student_id, _ in rows}
+    student_ids = list(student_ids)
+    if not student_ids or not days:
+        return {}
+
+    students = np.array(student_ids, dtype=object)
+    position = {student_id: i for i, student_id in enumerate(student_ids)}
+    absent_weight = np.zeros(len(students))
+    if rows:
+        ids, dates = zip(*rows)
+        np.add.at(absent_weight, [position[student_id] for student_id in ids], _record_weights(date, dates))
+
+    total_weight = _record_weights(date, days).sum()
+    prior = _prior_rates(start, students)
+    rates = (total_weight - absent_weight + PRIOR_WEIGHT * prior) / (total_weight + PRIOR_WEIGHT)
+
+    return dict(zip(students, rates.tolist()))
+
+
+def predicted_present_ids(date, student_ids):
+    """
+    IDs of the students expected to be present on a date.
+    Students without history are assumed present.
+
+    Args:
+        date (datetime.date): Date to predict
+        student_ids: IDs of the students to consider
+    """
+    student_ids = list(student_ids)
+    rates = predict_presence(date, student_ids)
+    return [
+        student_id for student_id in student_ids
+        if rates.get(student_id, PRIOR_PRESENCE) >= PRESENCE_THRESHOLD
+    ]
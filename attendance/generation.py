@@ -0,0 +1,66 @@
+"""
+Bulk generation of attendance records.
+"""
+from datetime import date as date_cls
+
+from django.db import transaction
+
+from students.models import Student
+from . import presence_cache, rollups
+from .models import Attendance
+from .school_calendar import school_days
+
+# Students handled per chunk when generating attendance in the background
+CHUNK_SIZE = 200
+
+
+def generate_monthly_attendance(year, month, user=None, overwrite=True,
+                                chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Mark every active student present on every school day of a month.
+    Rows are built in memory and written with batched upserts, one
+    transaction per chunk of students. Weekends and holidays are skipped.
+    In sparse attendance mode presence is implied and nothing is written.
+
+    Args:
+        year (int): Year to mark attendance for
+        month (int): Month to mark attendance for (1-12)
+        user: User who is marking attendance
+        overwrite (bool): Reset existing records to present; when False
+            existing records are skipped
+        chunk_size (int): Number of students written per transaction
+        progress: Optional callable(processed_students, total_students)
+            invoked after every chunk
+
+    Returns:
+        Tuple of (number of students, number of school days, records written)
+    """
+    student_ids = list(Student.objects.filter(is_active=True).values_list('student_id', flat=True))
+    days = school_days(year, month)
+    written = 0
+
+    if Attendance.is_sparse():
+        if progress:
+            progress(len(student_ids), len(student_ids))
+        return len(student_ids), len(days), 0
+
+    if progress:
+        progress(0, len(student_ids))
+
+    for start in range(0, len(student_ids), chunk_size):
+        chunk = student_ids[start:start + chunk_size]
+        records = ((student_id, day, True) for day in days for student_id in chunk)
+        written += Attendance.bulk_upsert(records, user=user, overwrite=overwrite)
+        if progress:
+            progress(start + len(chunk), len(student_ids))
+
+    def refresh():
+        for day in days:
+            presence_cache.invalidate(day)
+        rollups.refresh_month(date_cls(year, month, 1))
+
+    # Bulk writes bypass the attendance signals. Callers may hold the rows in a transaction:
+    # a present set rebuilt before it commits would be served stale until it expires
+    transaction.on_commit(refresh)
+
+    return len(student_ids), len(days), written
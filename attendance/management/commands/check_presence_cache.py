@@ -0,0 +1,41 @@
+from datetime import date as date_cls, timedelta
+
+from django.core.management.base import BaseCommand
+
+from attendance import presence_cache
+
+
+class Command(BaseCommand):
+    help = "Compare the cached present-student sets with the attendance records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date_cls.fromisoformat, default=None,
+                            help='First date to check (YYYY-MM-DD, default today)')
+        parser.add_argument('--days', type=int, default=2,
+                            help='Number of consecutive dates to check')
+        parser.add_argument('--repair', action='store_true',
+                            help='Rebuild entries that differ from the database')
+
+    def handle(self, *args, **options):
+        start = options['date'] or date_cls.today()
+        inconsistent = 0
+
+        for offset in range(options['days']):
+            date = start + timedelta(days=offset)
+            result = presence_cache.check(date, repair=options['repair'])
+            if not result['cached']:
+                self.stdout.write(f"{date}: not cached")
+            elif result['missing'] or result['extra']:
+                inconsistent += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{date}: {len(result['missing'])} missing, {len(result['extra'])} extra "
+                    f"(built {result['age_seconds']}s ago)"
+                    + (" - rebuilt" if options['repair'] else "")
+                ))
+            else:
+                self.stdout.write(f"{date}: consistent (built {result['age_seconds']}s ago)")
+
+        if inconsistent:
+            self.stdout.write(self.style.WARNING(f"{inconsistent} dates out of date"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Present-set cache is consistent"))
@@ -0,0 +1,64 @@
+from datetime import date as date_cls
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly partitions of the attendance table and detach "
+        "the ones past the retention period. Run it daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.ATTENDANCE_PARTITIONS_AHEAD,
+                            help='Number of future months that should have a partition')
+        parser.add_argument('--retain-months', type=int, default=settings.ATTENDANCE_RETENTION_MONTHS,
+                            help='Detach partitions older than this many months (default: keep all)')
+        parser.add_argument('--archive-schema', default='attendance_archive',
+                            help='Schema detached partitions are moved into')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop detached partitions instead of archiving them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be done')
+
+    def handle(self, *args, **options):
+        if options['retain_months'] is not None and options['retain_months'] < 1:
+            raise CommandError("--retain-months must be at least 1")
+
+        this_month = partitions.month_start(date_cls.today())
+        existing = partitions.monthly_partitions()
+        dry_run = options['dry_run']
+
+        for offset in range(options['ahead'] + 1):
+            month = partitions.add_months(this_month, offset)
+            if month in existing:
+                continue
+            name = partitions.partition_name(month)
+            if dry_run:
+                self.stdout.write(f"Would create {name}")
+                continue
+            moved = partitions.create_partition(month)
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {name}" + (f" ({moved} rows moved from the default partition)" if moved else "")
+            ))
+
+        if options['retain_months'] is None:
+            return
+
+        oldest_kept = partitions.add_months(this_month, -options['retain_months'])
+        for month, name in sorted(existing.items()):
+            if month >= oldest_kept:
+                break
+            if dry_run:
+                self.stdout.write(f"Would detach {name}")
+                continue
+            partitions.detach_partition(
+                month,
+                archive_schema=options['archive_schema'],
+                drop=options['drop'],
+            )
+            where = 'dropped' if options['drop'] else f"moved to {options['archive_schema']}"
+            self.stdout.write(self.style.SUCCESS(f"Detached {name} ({where})"))
@@ -0,0 +1,39 @@
+from datetime import date as date_cls
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from attendance.models import Attendance
+
+# Rows deleted per statement
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete presence records that sparse attendance mode does not need. "
+        "Run once after switching ATTENDANCE_MODE to 'sparse'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date_cls.fromisoformat, default=None,
+                            help='Only prune records before this date (YYYY-MM-DD, default today)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not Attendance.is_sparse():
+            raise CommandError("ATTENDANCE_MODE is not 'sparse' - presence records are still needed")
+
+        before = options['before'] or date_cls.today()
+        present = Attendance.objects.filter(presence=True, date__lt=before)
+
+        deleted = 0
+        while True:
+            batch = list(present.values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                deleted += Attendance.objects.filter(pk__in=batch).delete()[0]
+            self.stdout.write(f"Deleted {deleted} presence records")
+
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} presence records before {before}"))
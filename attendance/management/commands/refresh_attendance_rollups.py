@@ -0,0 +1,32 @@
+from datetime import date as date_cls, datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from attendance import rollups
+
+
+def parse_month(value):
+    """First day of a YYYY-MM month"""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the attendance rollups of whole months. "
+        "Run nightly; defaults to the current and the previous month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='*', type=parse_month,
+                            help='Months to rebuild (YYYY-MM)')
+
+    def handle(self, *args, **options):
+        months = options['months']
+        if not months:
+            this_month = rollups.month_start(date_cls.today())
+            last_month = rollups.month_start(this_month - timedelta(days=1))
+            months = [last_month, this_month]
+
+        for month in months:
+            rollups.refresh_month(month)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed attendance rollups for {month:%Y-%m}"))
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:42
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_alter_attendance_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchoolHoliday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Date the school is closed', unique=True)),
+                ('name', models.CharField(help_text='Name of the holiday', max_length=100)),
+            ],
+            options={
+                'verbose_name': 'School Holiday',
+                'verbose_name_plural': 'School Holidays',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AttendanceJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='Job ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_students', models.PositiveIntegerField(default=0)),
+                ('processed_students', models.PositiveIntegerField(default=0)),
+                ('school_days', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, help_text='User who started this job', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendance_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Attendance Job',
+                'verbose_name_plural': 'Attendance Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
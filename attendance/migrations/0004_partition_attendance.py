@@ -0,0 +1,92 @@
+"""
+Range-partition attendance_attendance by month.
+
+The existing table is copied into a new table partitioned on `date`, with
+one partition per month from the oldest record up to three months ahead
+and a default partition for anything outside. PostgreSQL requires the
+partition key in every unique constraint, so the primary key becomes
+(attendance_id, date); Django keeps treating attendance_id as the primary
+key. Later partitions are created by `manage.py manage_attendance_partitions`.
+
+The names of the recreated constraints and indexes are the ones Django
+derives for the model (attendance.tests checks they still match). Migrating
+back copies every row into a plain table with those same names.
+"""
+from django.db import migrations
+
+TABLE = 'attendance_attendance'
+
+# Constraint and index names Django created for the unpartitioned table
+UNIQUE = 'attendance_attendance_student_id_date_167892e4_uniq'
+INDEXES = [
+    ('attendance__date_61f2e1_idx', 'date'),
+    ('attendance__student_76a8d7_idx', 'student_id, date'),
+    ('attendance_attendance_student_id_94863613', 'student_id'),
+    ('attendance_attendance_marked_by_id_0698c76f', 'marked_by_id'),
+]
+FOREIGN_KEYS = f"""
+ALTER TABLE {TABLE} ADD CONSTRAINT attendance_attendanc_student_id_94863613_fk_students_
+    FOREIGN KEY (student_id) REFERENCES students_student (student_id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE {TABLE} ADD CONSTRAINT attendance_attendance_marked_by_id_0698c76f_fk_auth_user_id
+    FOREIGN KEY (marked_by_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED;
+"""
+CREATE_INDEXES = ''.join(f"CREATE INDEX {name} ON {TABLE} ({columns});\n" for name, columns in INDEXES)
+
+PARTITION = f"""
+CREATE TABLE {TABLE}_new (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (date);
+ALTER TABLE {TABLE}_new ADD CONSTRAINT {TABLE}_new_pkey PRIMARY KEY (attendance_id, date);
+ALTER TABLE {TABLE}_new ADD CONSTRAINT {TABLE}_new_uniq UNIQUE (student_id, date);
+CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_new DEFAULT;
+
+DO $$
+DECLARE
+    month date;
+    last_month date;
+BEGIN
+    SELECT date_trunc('month', coalesce(min(date), current_date))::date,
+           (date_trunc('month', greatest(max(date), current_date)) + interval '3 months')::date
+      INTO month, last_month
+      FROM {TABLE};
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {TABLE}_new FOR VALUES FROM (%L) TO (%L)',
+            '{TABLE}_' || to_char(month, '"y"YYYY"m"MM'),
+            month,
+            (month + interval '1 month')::date
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO {TABLE}_new SELECT * FROM {TABLE};
+DROP TABLE {TABLE};
+ALTER TABLE {TABLE}_new RENAME TO {TABLE};
+ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_new_pkey TO {TABLE}_pkey;
+ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_new_uniq TO {UNIQUE};
+{CREATE_INDEXES}
+{FOREIGN_KEYS}
+ANALYZE {TABLE};
+"""
+
+UNPARTITION = f"""
+CREATE TABLE {TABLE}_plain (LIKE {TABLE} INCLUDING DEFAULTS);
+INSERT INTO {TABLE}_plain SELECT * FROM {TABLE};
+DROP TABLE {TABLE};
+ALTER TABLE {TABLE}_plain RENAME TO {TABLE};
+ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (attendance_id);
+ALTER TABLE {TABLE} ADD CONSTRAINT {UNIQUE} UNIQUE (student_id, date);
+{CREATE_INDEXES}
+{FOREIGN_KEYS}
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_holidays_and_jobs'),
+        ('students', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION, reverse_sql=UNPARTITION),
+    ]
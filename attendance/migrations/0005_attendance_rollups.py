@@ -0,0 +1,67 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_partition_attendance'),
+        ('students', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassDailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('class_grade', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Class Daily Attendance',
+                'verbose_name_plural': 'Class Daily Attendance',
+                'indexes': [models.Index(fields=['date'], name='attendance__date_4c2244_idx')],
+                'unique_together': {('class_grade', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ClassMonthlyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('class_grade', models.CharField(max_length=3)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('school_days', models.PositiveSmallIntegerField(default=0)),
+                ('present', models.PositiveIntegerField(default=0, help_text='Student-days present')),
+                ('absent', models.PositiveIntegerField(default=0, help_text='Student-days absent')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Class Monthly Attendance',
+                'verbose_name_plural': 'Class Monthly Attendance',
+                'unique_together': {('class_grade', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentMonthlyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('school_days', models.PositiveSmallIntegerField(default=0)),
+                ('present_days', models.PositiveSmallIntegerField(default=0)),
+                ('absent_days', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_attendance', to='students.student')),
+            ],
+            options={
+                'verbose_name': 'Student Monthly Attendance',
+                'verbose_name_plural': 'Student Monthly Attendance',
+                'indexes': [models.Index(fields=['month'], name='attendance__month_5c7a7a_idx')],
+                'unique_together': {('student', 'month')},
+            },
+        ),
+    ]
@@ -1,10 +1,21 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 import uuid
+from datetime import timedelta
 
 class Attendance(models.Model):
     """
     Attendance model to track student presence for each day.
     Records whether a student was present on a specific date.
+
+    With settings.ATTENDANCE_MODE = 'sparse' only exceptions are stored:
+    an active student without a record is present. Use present_students()
+    instead of querying records directly so both modes are handled.
+
+    The table is partitioned by month (see attendance.partitions), so
+    filter on date wherever possible.
     """
     # Primary key
     attendance_id = models.UUIDField(
@@ -58,6 +69,60 @@ class Attendance(models.Model):
         status = "Present" if self.presence else "Absent"
         return f"{self.student.name} - {status} - {self.date}"
     
+    @staticmethod
+    def is_sparse():
+        """Whether only absences are stored (settings.ATTENDANCE_MODE = 'sparse')"""
+        return getattr(settings, 'ATTENDANCE_MODE', 'full') == 'sparse'
+    
+    @classmethod
+    def present_students(cls, date):
+        """
+        Students present on a date: only active students, and nobody on a
+        day the school is closed.
+        In sparse mode this is every active student without an absence
+        record, evaluated as an anti-join against the absence rows.
+        
+        Args:
+            date: Date to look up
+            
+        Returns:
+            Student queryset
+        """
+        from students.models import Student
+        from .school_calendar import is_school_day
+        
+        if not is_school_day(date):
+            return Student.objects.none()
+        if cls.is_sparse():
+            absent = cls.objects.filter(student=OuterRef('pk'), date=date, presence=False)
+            return Student.objects.filter(~Exists(absent), is_active=True)
+        return Student.objects.filter(
+            attendance_records__date=date,
+            attendance_records__presence=True,
+            is_active=True,
+        )
+    
+    @classmethod
+    def is_recorded(cls, date):
+        """
+        Whether attendance for a date is known.
+        In sparse mode every date is - students are present unless marked absent.
+        """
+        return cls.is_sparse() or cls.objects.filter(date=date).exists()
+    
+    @classmethod
+    def is_complete(cls, date):
+        """
+        Whether every active student's attendance for a date is recorded.
+        Always true in sparse mode, where a missing record means present.
+        """
+        from students.models import Student
+        
+        if cls.is_sparse():
+            return True
+        recorded = cls.objects.filter(student=OuterRef('pk'), date=date)
+        return not Student.objects.filter(~Exists(recorded), is_active=True).exists()
+    
     @classmethod
     def mark_student_present(cls, student_id, date, user=None):
         """
@@ -73,6 +138,16 @@ class Attendance(models.Model):
         try:
             student = Student.objects.get(student_id=student_id)
             
+            if cls.is_sparse():
+                # Presence is implied - only an existing absence has to be cleared
+                attendance = cls.objects.filter(student=student, date=date).first()
+                if attendance is None:
+                    return cls(student=student, date=date, presence=True, marked_by=user)
+                attendance.presence = True
+                attendance.marked_by = user
+                attendance.save()
+                return attendance
+            
             attendance, created = cls.objects.get_or_create(
                 student=student,
                 date=date,
@@ -90,4 +165,251 @@ class Attendance(models.Model):
             
             return attendance
         except Student.DoesNotExist:
-            return None
\ No newline at end of file
+            return None
+    
+    @classmethod
+    def bulk_upsert(cls, records, user=None, batch_size=5000, overwrite=True):
+        """
+        Insert or update many attendance records at once, in batches, all
+        inside one transaction.
+        
+        In full mode every record is written with INSERT ... ON CONFLICT
+        (student, date) DO UPDATE, or DO NOTHING when overwrite is False.
+        In sparse mode only absences are inserted that way; a present record
+        is not inserted at all and only flips an existing absence back to
+        present (with a plain UPDATE, and only when overwrite is True).
+        
+        Args:
+            records: Iterable of (student_id, date, presence) tuples
+            user: User who is marking attendance
+            batch_size: Number of rows per INSERT statement
+            overwrite: Update existing records; when False they are left untouched
+            
+        Returns:
+            Number of records written
+        """
+        # One statement cannot update the same row twice - keep the last value per key
+        latest = {}
+        for student_id, date, presence in records:
+            latest[(student_id, date)] = presence
+        
+        sparse = cls.is_sparse()
+        objs = [
+            cls(student_id=student_id, date=date, presence=presence, marked_by=user)
+            for (student_id, date), presence in latest.items()
+            if not (sparse and presence)
+        ]
+        if overwrite:
+            conflict_options = {
+                'update_conflicts': True,
+                'unique_fields': ['student', 'date'],
+                'update_fields': ['presence', 'marked_by', 'updated_at'],
+            }
+        else:
+            conflict_options = {'ignore_conflicts': True}
+        
+        # Sparse mode: cleared absences stay as present rows so the change is visible
+        cleared = {}
+        if sparse and overwrite:
+            for (student_id, date), presence in latest.items():
+                if presence:
+                    cleared.setdefault(date, []).append(student_id)
+        
+        written = len(objs)
+        with transaction.atomic():
+            cls.objects.bulk_create(objs, batch_size=batch_size, **conflict_options)
+            for date, student_ids in cleared.items():
+                written += cls.objects.filter(
+                    date=date, student_id__in=student_ids, presence=False
+                ).update(presence=True, marked_by=user, updated_at=timezone.now())
+        return written
+
+
+class SchoolHoliday(models.Model):
+    """
+    A weekday on which the school is closed.
+    No attendance is generated and no trips are planned for holidays.
+    """
+    date = models.DateField(
+        unique=True,
+        help_text="Date the school is closed"
+    )
+    name = models.CharField(
+        max_length=100,
+        help_text="Name of the holiday"
+    )
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = "School Holiday"
+        verbose_name_plural = "School Holidays"
+    
+    def __str__(self):
+        return f"{self.name} ({self.date})"
+
+
+class AttendanceJob(models.Model):
+    """
+    Background job that generates a month of attendance records.
+    Progress is updated after every chunk of students.
+    """
+    # A pending or running job whose progress is older than this is considered dead
+    STALE_AFTER = timedelta(minutes=10)
+    
+    job_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        verbose_name="Job ID"
+    )
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    
+    # Progress tracking
+    total_students = models.PositiveIntegerField(default=0)
+    processed_students = models.PositiveIntegerField(default=0)
+    school_days = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    created_by = models.ForeignKey(
+        'auth.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='attendance_jobs',
+        help_text="User who started this job"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Attendance Job"
+        verbose_name_plural = "Attendance Jobs"
+    
+    def __str__(self):
+        return f"Attendance {self.year}-{self.month:02d} ({self.get_status_display()})"
+    
+    @classmethod
+    def fail_stale(cls):
+        """
+        Mark jobs that stopped reporting progress as failed, e.g. because the
+        job process died or never started, so they no longer block new jobs.
+        
+        Returns:
+            Number of jobs marked as failed
+        """
+        cutoff = timezone.now() - cls.STALE_AFTER
+        return cls.objects.filter(status__in=['pending', 'running'], updated_at__lt=cutoff).update(
+            status='failed',
+            error=f"No progress for {int(cls.STALE_AFTER.total_seconds() // 60)} minutes - the job process stopped",
+            updated_at=timezone.now(),
+        )
+    
+    @property
+    def progress_percent(self):
+        """Share of students processed so far, from 0 to 100"""
+        if not self.total_students:
+            return 100 if self.status == 'completed' else 0
+        return int(self.processed_students * 100 / self.total_students)
+
+
+class StudentMonthlyAttendance(models.Model):
+    """
+    Rollup of one student's attendance in one month.
+    Maintained by attendance.rollups - never edit by hand.
+    """
+    student = models.ForeignKey(
+        'students.Student',
+        on_delete=models.CASCADE,
+        related_name='monthly_attendance'
+    )
+    month = models.DateField(help_text="First day of the month")
+    school_days = models.PositiveSmallIntegerField(default=0)
+    present_days = models.PositiveSmallIntegerField(default=0)
+    absent_days = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['student', 'month']
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+        verbose_name = "Student Monthly Attendance"
+        verbose_name_plural = "Student Monthly Attendance"
+    
+    def __str__(self):
+        return f"{self.student_id} - {self.month:%Y-%m}"
+    
+    @property
+    def attendance_rate(self):
+        """Share of school days the student was present, from 0 to 1"""
+        return self.present_days / self.school_days if self.school_days else None
+
+
+class ClassDailyAttendance(models.Model):
+    """
+    Rollup of one class's attendance on one day.
+    Maintained by attendance.rollups - never edit by hand.
+    """
+    class_grade = models.CharField(max_length=3)
+    date = models.DateField()
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['class_grade', 'date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+        verbose_name = "Class Daily Attendance"
+        verbose_name_plural = "Class Daily Attendance"
+    
+    def __str__(self):
+        return f"Class {self.class_grade} - {self.date}"
+    
+    @property
+    def attendance_rate(self):
+        """Share of the class that was present, from 0 to 1"""
+        total = self.present + self.absent
+        return self.present / total if total else None
+
+
+class ClassMonthlyAttendance(models.Model):
+    """
+    Rollup of one class's attendance in one month, summed from the daily rollups.
+    Maintained by attendance.rollups - never edit by hand.
+    """
+    class_grade = models.CharField(max_length=3)
+    month = models.DateField(help_text="First day of the month")
+    school_days = models.PositiveSmallIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0, help_text="Student-days present")
+    absent = models.PositiveIntegerField(default=0, help_text="Student-days absent")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['class_grade', 'month']
+        verbose_name = "Class Monthly Attendance"
+        verbose_name_plural = "Class Monthly Attendance"
+    
+    def __str__(self):
+        return f"Class {self.class_grade} - {self.month:%Y-%m}"
+    
+    @property
+    def attendance_rate(self):
+        """Share of student-days present, from 0 to 1"""
+        total = self.present + self.absent
+        return self.present / total if total else None
@@ -0,0 +1,111 @@
+"""
+Monthly partitions of the attendance table.
+
+attendance_attendance is range-partitioned by `date` with one partition per
+month named attendance_attendance_yYYYYmMM, plus a default partition that
+catches rows for months without their own partition. Queries bounded by
+date (planning, the admin date hierarchy) only scan the matching months.
+"""
+from datetime import date as date_cls
+
+from django.db import connection, transaction
+
+from .models import Attendance
+
+TABLE = Attendance._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(date):
+    """First day of the month a date falls in"""
+    return date.replace(day=1)
+
+
+def add_months(date, months):
+    """First day of the month `months` after the month of a date"""
+    index = date.year * 12 + date.month - 1 + months
+    return date_cls(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Name of the partition holding a month"""
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def monthly_partitions():
+    """
+    Monthly partitions currently attached to the attendance table.
+
+    Returns:
+        dict mapping the first day of each month to its partition name
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE parent.relname = %s AND child.relname <> %s
+            """,
+            [TABLE, DEFAULT_PARTITION],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        # attendance_attendance_yYYYYmMM
+        suffix = name[len(TABLE) + 1:]
+        partitions[date_cls(int(suffix[1:5]), int(suffix[6:8]), 1)] = name
+    return partitions
+
+
+def create_partition(month):
+    """
+    Create the partition for a month.
+    Rows for that month already in the default partition are moved into it.
+
+    Args:
+        month (datetime.date): First day of the month
+
+    Returns:
+        Number of rows moved out of the default partition
+    """
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Attaching scans the default partition, which must not hold rows of the new range
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f'WHERE date >= %s AND date < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+    return moved
+
+
+def detach_partition(month, archive_schema=None, drop=False):
+    """
+    Detach a month's partition from the attendance table.
+    Its rows stay in a standalone table unless it is dropped.
+
+    Args:
+        month (datetime.date): First day of the month
+        archive_schema (str): Move the detached table into this schema
+        drop (bool): Delete the detached table and its rows
+    """
+    name = partition_name(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+        if drop:
+            cursor.execute(f'DROP TABLE "{name}"')
+        elif archive_schema:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"')
+            cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA "{archive_schema}"')
@@ -0,0 +1,243 @@
+"""
+Cached present-student set per date.
+
+The IDs of the students present on a date are kept in the Django cache as
+a sorted list, so planners and dashboards read them with a single cache
+lookup instead of joining Student to Attendance every time. Entries are
+built from the database on the first read and then kept up to date by
+attendance writes (see attendance.signals). Rebuilds and incremental
+updates of an entry hold a per-date lock, so neither can write back a copy
+that misses the other's changes; writers wait for the lock rather than
+dropping the entry.
+
+Entries are shared by the web, planner and script processes, which only
+works with a shared cache backend (Redis, see REDIS_URL); the core.E001
+deploy check and run_planner refuse a per-process cache.
+"""
+import logging
+import time
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from core import metrics
+from students.models import Student
+from .models import Attendance
+from .school_calendar import is_school_day
+
+logger = logging.getLogger(__name__)
+
+# Entries outlive the school day they are used on
+CACHE_TIMEOUT = 60 * 60 * 48
+
+# Seconds an update or rebuild may hold the lock on an entry; writers wait this long at most
+LOCK_TIMEOUT = 10
+
+# Seconds between attempts to take a held lock
+LOCK_RETRY_SECONDS = 0.01
+
+# Bumped to drop every entry at once (e.g. when students are activated); entries
+# record the generation they were built in and are ignored once it has moved on
+GENERATION_KEY = 'attendance:present:generation'
+
+
+def _key(date):
+    return f'attendance:present:{date.isoformat()}'
+
+
+def _get(key):
+    """The entry under a key, or None when missing or from an older generation"""
+    # One round trip for the entry and the generation it must match
+    values = cache.get_many([GENERATION_KEY, key])
+    entry = values.get(key)
+    if entry is None or entry['generation'] != values.get(GENERATION_KEY, 1):
+        return None
+    return entry
+
+
+def _load(date):
+    """Sorted IDs of the students present on a date, read from the database"""
+    return sorted(Attendance.present_students(date).values_list('student_id', flat=True))
+
+
+def _lock(key, wait=True):
+    """
+    Take the lock on an entry.
+
+    Args:
+        key (str): Cache key of the entry
+        wait (bool): Wait up to LOCK_TIMEOUT for a held lock, after which it has expired
+
+    Returns:
+        False when the lock could not be taken
+    """
+    deadline = time.monotonic() + (LOCK_TIMEOUT if wait else 0)
+    while not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(LOCK_RETRY_SECONDS)
+    return True
+
+
+def _unlock(key):
+    cache.delete(f'{key}:lock')
+
+
+def rebuild(date, wait=True):
+    """
+    Rebuild the cached present set of a date from the database.
+
+    Args:
+        date (datetime.date): Date to rebuild
+        wait (bool): Wait for a concurrent update of the entry; when False
+            and one is running, the set is read but not cached
+
+    Returns:
+        Sorted list of student IDs
+    """
+    key = _key(date)
+    if not _lock(key, wait):
+        return _load(date)
+    try:
+        # Read under the lock: writes committed later are applied on top of this entry
+        generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+        ids = _load(date)
+        now = time.time()
+        cache.set(key, {'ids': ids, 'generation': generation, 'built_at': now, 'updated_at': now},
+                  CACHE_TIMEOUT)
+    finally:
+        _unlock(key)
+    metrics.incr('presence_cache.rebuilds')
+    return ids
+
+
+def present_ids(date):
+    """
+    IDs of the students present on a date, built on first use.
+
+    Args:
+        date (datetime.date): Date to look up
+
+    Returns:
+        Sorted list of student IDs
+    """
+    entry = _get(_key(date))
+    if entry is None:
+        metrics.incr('presence_cache.misses')
+        return rebuild(date, wait=False)
+    metrics.incr('presence_cache.hits')
+    metrics.gauge('presence_cache.age_seconds', round(time.time() - entry['built_at'], 1))
+    return entry['ids']
+
+
+def present_count(date):
+    """Number of students present on a date"""
+    return len(present_ids(date))
+
+
+def _active(student_ids):
+    """The students among student_ids who are active"""
+    if not student_ids:
+        return set()
+    return set(Student.objects.filter(pk__in=student_ids, is_active=True).values_list('pk', flat=True))
+
+
+def merge(ids, marks, active):
+    """
+    Apply attendance marks to a sorted list of present student IDs in place.
+
+    Args:
+        ids: Sorted list of present student IDs
+        marks: dict mapping student ID to presence
+        active: Set of the marked students who are active; only they can be present
+    """
+    for student_id, presence in marks.items():
+        index = bisect_left(ids, student_id)
+        found = index < len(ids) and ids[index] == student_id
+        if presence and student_id in active:
+            if not found:
+                ids.insert(index, student_id)
+        elif found:
+            del ids[index]
+
+
+def apply_changes(changes):
+    """
+    Update cached present sets with attendance that was just written.
+    Dates that are not cached are skipped - they are built on first read.
+
+    Args:
+        changes: dict mapping date to {student_id: presence}
+    """
+    # Only active students count as present (see Attendance.present_students)
+    active = _active({student_id for marks in changes.values()
+                      for student_id, presence in marks.items() if presence})
+
+    for date, marks in changes.items():
+        if not is_school_day(date):
+            # Nobody is present while the school is closed
+            continue
+        key = _key(date)
+        if not _lock(key):
+            # The lock outlived its timeout, so its holder is gone; rebuilding later is always safe
+            invalidate(date)
+            continue
+        try:
+            entry = _get(key)
+            if entry is None:
+                continue
+            merge(entry['ids'], marks, active)
+            entry['updated_at'] = time.time()
+            cache.set(key, entry, CACHE_TIMEOUT)
+            metrics.incr('presence_cache.incremental_updates')
+        finally:
+            _unlock(key)
+
+
+def invalidate(date):
+    """Drop the cached present set of a date"""
+    cache.delete(_key(date))
+    metrics.incr('presence_cache.invalidations')
+
+
+def invalidate_all():
+    """Drop the cached present set of every date"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
+    metrics.incr('presence_cache.invalidations')
+
+
+def check(date, repair=False):
+    """
+    Compare the cached present set of a date with the database.
+
+    Args:
+        date (datetime.date): Date to check
+        repair (bool): Replace the cached entry when it differs
+
+    Returns:
+        dict with 'cached' (whether an entry existed), 'missing' and 'extra'
+        (IDs absent from / only in the cache) and the entry's 'age_seconds'
+    """
+    entry = _get(_key(date))
+    actual = _load(date)
+    if entry is None:
+        return {'cached': False, 'missing': [], 'extra': [], 'age_seconds': None}
+
+    cached, expected = set(entry['ids']), set(actual)
+    missing = sorted(expected - cached)
+    extra = sorted(cached - expected)
+    age = round(time.time() - entry['built_at'], 1)
+
+    metrics.incr('presence_cache.checks')
+    metrics.gauge('presence_cache.drift', len(missing) + len(extra))
+    metrics.gauge('presence_cache.last_check', time.time())
+    if missing or extra:
+        metrics.incr('presence_cache.inconsistent')
+        logger.warning(f"Present set for {date} is out of date: "
+                       f"{len(missing)} missing, {len(extra)} extra")
+        if repair:
+            rebuild(date)
+    return {'cached': True, 'missing': missing, 'extra': extra, 'age_seconds': age}
@@ -0,0 +1,293 @@
+"""
+Attendance rollups.
+
+Daily and monthly attendance totals per class and per student are kept in
+ClassDailyAttendance, ClassMonthlyAttendance and StudentMonthlyAttendance
+so reports read a few hundred rows instead of the raw attendance table.
+Attendance writes queue the days and students they touch (see
+attendance.signals); a background thread refreshes them REFRESH_DELAY_SECONDS
+after the first write, together with everything written meanwhile, so no
+request waits for a refresh and a burst of writes costs one. `manage.py
+refresh_attendance_rollups` rebuilds whole months and should run nightly,
+since in sparse mode every school day that passes adds present days without
+any write; it also repairs refreshes lost with a process that exited.
+
+Only days up to today are counted - attendance generated ahead of time
+has not happened yet.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import date as date_cls, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Q, Sum
+
+from students.models import Student
+from .models import Attendance, ClassDailyAttendance, ClassMonthlyAttendance, StudentMonthlyAttendance
+from .school_calendar import is_school_day, school_days_between
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the first queued attendance write and the refresh of its rollups
+REFRESH_DELAY_SECONDS = 5.0
+
+# Students with attendance writes waiting for a refresh, by date
+_pending = defaultdict(set)
+_lock = threading.Lock()
+_timer = None
+
+
+def month_start(date):
+    """First day of the month a date falls in"""
+    return date.replace(day=1)
+
+
+def _month_end(month):
+    """First day of the month after `month`, capped at tomorrow"""
+    following = date_cls(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return min(following, date_cls.today() + timedelta(days=1))
+
+
+def refresh_days(dates):
+    """
+    Recompute the per-class rollups of some days.
+
+    Args:
+        dates: Iterable of dates
+    """
+    today = date_cls.today()
+    dates = sorted({date for date in dates if date <= today})
+    if not dates:
+        return
+
+    counts = defaultdict(lambda: [0, 0])
+    if Attendance.is_sparse():
+        # Every active student is present unless an absence was recorded
+        enrolled = dict(
+            Student.objects.filter(is_active=True)
+            .values_list('class_grade')
+            .annotate(Count('student_id'))
+        )
+        absences = (
+            Attendance.objects
+            .filter(date__in=dates, presence=False, student__is_active=True)
+            .values_list('date', 'student__class_grade')
+            .annotate(Count('attendance_id'))
+        )
+        for date in dates:
+            if not is_school_day(date):
+                continue
+            for class_grade, total in enrolled.items():
+                counts[(class_grade, date)] = [total, 0]
+        for date, class_grade, absent in absences:
+            present, _ = counts[(class_grade, date)]
+            counts[(class_grade, date)] = [present - absent, absent]
+    else:
+        rows = (
+            Attendance.objects
+            .filter(date__in=dates)
+            .values_list('date', 'student__class_grade')
+            .annotate(
+                present=Count('attendance_id', filter=Q(presence=True)),
+                absent=Count('attendance_id', filter=Q(presence=False)),
+            )
+        )
+        for date, class_grade, present, absent in rows:
+            counts[(class_grade, date)] = [present, absent]
+
+    grades_by_date = defaultdict(list)
+    for class_grade, date in counts:
+        grades_by_date[date].append(class_grade)
+
+    # Upsert rather than delete and insert: concurrent refreshes of a day must not collide on the key
+    with transaction.atomic():
+        for date in dates:
+            ClassDailyAttendance.objects.filter(date=date).exclude(
+                class_grade__in=grades_by_date[date]
+            ).delete()
+        ClassDailyAttendance.objects.bulk_create(
+            [
+                ClassDailyAttendance(class_grade=class_grade, date=date, present=present, absent=absent)
+                for (class_grade, date), (present, absent) in counts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['class_grade', 'date'],
+            update_fields=['present', 'absent', 'updated_at'],
+        )
+
+
+def refresh_class_months(months):
+    """
+    Recompute the monthly class rollups from the daily ones.
+
+    Args:
+        months: Iterable of first days of months
+    """
+    for month in set(months):
+        end = _month_end(month)
+        rows = (
+            ClassDailyAttendance.objects
+            .filter(date__gte=month, date__lt=end)
+            .values_list('class_grade')
+            .annotate(days=Count('date'), present=Sum('present'), absent=Sum('absent'))
+        )
+        rows = list(rows)
+        with transaction.atomic():
+            ClassMonthlyAttendance.objects.filter(month=month).exclude(
+                class_grade__in=[row[0] for row in rows]
+            ).delete()
+            ClassMonthlyAttendance.objects.bulk_create(
+                [
+                    ClassMonthlyAttendance(class_grade=class_grade, month=month, school_days=days,
+                                           present=present, absent=absent)
+                    for class_grade, days, present, absent in rows
+                ],
+                update_conflicts=True,
+                unique_fields=['class_grade', 'month'],
+                update_fields=['school_days', 'present', 'absent', 'updated_at'],
+            )
+
+
+def refresh_student_months(month, student_ids=None):
+    """
+    Recompute the monthly rollups of students.
+
+    Args:
+        month (datetime.date): First day of the month
+        student_ids: Only refresh these students; all students when None
+    """
+    end = _month_end(month)
+    if end <= month:
+        return
+    records = Attendance.objects.filter(date__gte=month, date__lt=end)
+    if student_ids is not None:
+        student_ids = set(student_ids)
+        records = records.filter(student_id__in=student_ids)
+
+    totals = {}
+    if Attendance.is_sparse():
+        days = len(school_days_between(month, end))
+        students = Student.objects.filter(is_active=True)
+        if student_ids is not None:
+            students = students.filter(student_id__in=student_ids)
+        for student_id in students.values_list('student_id', flat=True):
+            totals[student_id] = [days, days, 0]
+        absences = (
+            records.filter(presence=False, student__is_active=True)
+            .values_list('student_id')
+            .annotate(Count('attendance_id'))
+        )
+        for student_id, absent in absences:
+            totals[student_id] = [days, max(days - absent, 0), absent]
+    else:
+        rows = (
+            records.values_list('student_id')
+            .annotate(
+                days=Count('attendance_id'),
+                present=Count('attendance_id', filter=Q(presence=True)),
+            )
+        )
+        for student_id, days, present in rows:
+            totals[student_id] = [days, present, days - present]
+
+    if student_ids is not None:
+        # Students without any counted day keep an empty rollup
+        for student_id in student_ids - set(totals):
+            totals[student_id] = [0, 0, 0]
+
+    with transaction.atomic():
+        if student_ids is None:
+            StudentMonthlyAttendance.objects.filter(month=month).exclude(
+                student_id__in=list(totals)
+            ).delete()
+        StudentMonthlyAttendance.objects.bulk_create(
+            [
+                StudentMonthlyAttendance(student_id=student_id, month=month, school_days=days,
+                                         present_days=present, absent_days=absent)
+                for student_id, (days, present, absent) in totals.items()
+            ],
+            batch_size=5000,
+            update_conflicts=True,
+            unique_fields=['student', 'month'],
+            update_fields=['school_days', 'present_days', 'absent_days', 'updated_at'],
+        )
+
+
+def refresh_changes(changes):
+    """
+    Refresh the rollups touched by a batch of attendance writes.
+
+    Args:
+        changes: dict mapping date to the IDs of the students written,
+            e.g. {student_id: presence}
+    """
+    refresh_days(changes)
+
+    students_by_month = defaultdict(set)
+    for date, marks in changes.items():
+        students_by_month[month_start(date)].update(marks)
+    for month, student_ids in students_by_month.items():
+        refresh_student_months(month, student_ids)
+    refresh_class_months(students_by_month)
+
+
+def schedule_changes(changes):
+    """
+    Queue the rollups touched by attendance writes for the background refresh.
+
+    Args:
+        changes: dict mapping date to {student_id: presence}
+    """
+    global _timer
+    with _lock:
+        for date, marks in changes.items():
+            _pending[date].update(marks)
+        if _timer is None:
+            _timer = threading.Timer(REFRESH_DELAY_SECONDS, _refresh_in_background)
+            _timer.daemon = True
+            _timer.start()
+
+
+def flush():
+    """Refresh the rollups queued in this process"""
+    global _timer
+    with _lock:
+        changes = dict(_pending)
+        _pending.clear()
+        _timer = None
+    if not changes:
+        return
+    try:
+        refresh_changes(changes)
+    except DatabaseError:
+        schedule_changes(changes)
+        raise
+
+
+def _refresh_in_background():
+    try:
+        flush()
+    except DatabaseError as e:
+        logger.error(f"Could not refresh attendance rollups: {e}")
+    finally:
+        # The timer thread ends here; do not leave its connection open
+        connection.close()
+
+
+atexit.register(flush)
+
+
+def refresh_month(month):
+    """
+    Rebuild every rollup of a month.
+
+    Args:
+        month (datetime.date): Any day of the month
+    """
+    month = month_start(month)
+    end = _month_end(month)
+    refresh_days(month + timedelta(days=offset) for offset in range((end - month).days))
+    refresh_student_months(month)
+    refresh_class_months([month])
@@ -0,0 +1,48 @@
+"""
+School calendar: which dates are school days.
+
+A date is a school day when its weekday is listed in settings.SCHOOL_WEEKDAYS
+and it is not a SchoolHoliday.
+"""
+import calendar
+from datetime import date as date_cls, timedelta
+
+from django.conf import settings
+
+from .models import SchoolHoliday
+
+
+def is_school_day(date):
+    """Whether the school is open on a date"""
+    if date.weekday() not in settings.SCHOOL_WEEKDAYS:
+        return False
+    return not SchoolHoliday.objects.filter(date=date).exists()
+
+
+def school_days(year, month):
+    """List of the dates in a month on which the school is open"""
+    num_days = calendar.monthrange(year, month)[1]
+    holidays = set(
+        SchoolHoliday.objects
+        .filter(date__year=year, date__month=month)
+        .values_list('date', flat=True)
+    )
+    days = (date_cls(year, month, day) for day in range(1, num_days + 1))
+    return [
+        day for day in days
+        if day.weekday() in settings.SCHOOL_WEEKDAYS and day not in holidays
+    ]
+
+
+def school_days_between(start, end):
+    """List of the dates from start up to (not including) end on which the school is open"""
+    holidays = set(
+        SchoolHoliday.objects
+        .filter(date__gte=start, date__lt=end)
+        .values_list('date', flat=True)
+    )
+    days = (start + timedelta(days=offset) for offset in range((end - start).days))
+    return [
+        day for day in days
+        if day.weekday() in settings.SCHOOL_WEEKDAYS and day not in holidays
+    ]
@@ -0,0 +1,53 @@
+from rest_framework import serializers
+from .models import StudentMonthlyAttendance, ClassDailyAttendance, ClassMonthlyAttendance
+
+# Largest number of entries accepted in one batch request
+MAX_BATCH_SIZE = 1000
+
+class PresenceEntrySerializer(serializers.Serializer):
+    """
+    A single presence mark for one student on one date
+    """
+    student_id = serializers.UUIDField()
+    date = serializers.DateField()
+    presence = serializers.BooleanField()
+
+class PresenceBatchSerializer(serializers.Serializer):
+    """
+    Serializer for marking presence of many students and/or dates at once
+    """
+    entries = PresenceEntrySerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
+
+class StudentMonthlyAttendanceSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a student's monthly attendance rollup
+    """
+    student_name = serializers.CharField(source='student.name', read_only=True)
+    class_grade = serializers.CharField(source='student.class_grade', read_only=True)
+    attendance_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = StudentMonthlyAttendance
+        fields = ['student', 'student_name', 'class_grade', 'month', 'school_days',
+                  'present_days', 'absent_days', 'attendance_rate', 'updated_at']
+
+class ClassDailyAttendanceSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a class's daily attendance rollup
+    """
+    attendance_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ClassDailyAttendance
+        fields = ['class_grade', 'date', 'present', 'absent', 'attendance_rate', 'updated_at']
+
+class ClassMonthlyAttendanceSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a class's monthly attendance rollup
+    """
+    attendance_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ClassMonthlyAttendance
+        fields = ['class_grade', 'month', 'school_days', 'present', 'absent',
+                  'attendance_rate', 'updated_at']
@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from students.models import Student
+from . import presence_cache, rollups
+from .models import Attendance, SchoolHoliday
+
+# Sent after attendance was written in bulk, with
+# changes={date: {student_id: presence}} covering every record that was written
+attendance_changed = Signal()
+
+
+def apply_changes(changes):
+    """Bring the cached present sets up to date with written attendance and queue the rollups"""
+    presence_cache.apply_changes(changes)
+    rollups.schedule_changes(changes)
+
+
+@receiver(attendance_changed)
+def update_for_attendance(sender, changes, **kwargs):
+    """Apply a batch of attendance changes"""
+    apply_changes(changes)
+
+
+@receiver(post_save, sender=Attendance)
+def update_for_saved_attendance(sender, instance, **kwargs):
+    """Apply single records saved e.g. in the admin"""
+    changes = {instance.date: {instance.student_id: instance.presence}}
+    transaction.on_commit(lambda: apply_changes(changes))
+
+
+@receiver(post_delete, sender=Attendance)
+def update_for_deleted_attendance(sender, instance, **kwargs):
+    """A deleted record means absent in full mode and present in sparse mode"""
+    presence = Attendance.is_sparse()
+    if instance.presence == presence:
+        # e.g. pruning presence records in sparse mode - nothing changes
+        return
+    changes = {instance.date: {instance.student_id: presence}}
+    transaction.on_commit(lambda: apply_changes(changes))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def cache_student_changes(sender, update_fields=None, **kwargs):
+    """Only active students are present, so any change to the roster drops the cache"""
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    transaction.on_commit(presence_cache.invalidate_all)
+
+
+@receiver(post_save, sender=SchoolHoliday)
+@receiver(post_delete, sender=SchoolHoliday)
+def cache_holiday_changes(sender, **kwargs):
+    """Nobody is present on a holiday, so a change to the calendar drops the cache"""
+    transaction.on_commit(presence_cache.invalidate_all)
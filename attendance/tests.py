@@ -1,3 +1,421 @@
-from django.test import TestCase
+import importlib
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from students.models import Student
+from . import exports, forecast, generation, partitions, presence_cache, rollups, school_calendar
+from .models import Attendance, AttendanceJob, SchoolHoliday
+from .signals import attendance_changed
+
+DAY = date(2025, 3, 3)
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                      'LOCATION': 'attendance-tests'}}
+
+
+class MergeTests(SimpleTestCase):
+    def test_marks_are_applied_in_order(self):
+        ids = ['a', 'c']
+        presence_cache.merge(ids, {'b': True, 'c': False, 'd': True}, active={'b', 'd'})
+        self.assertEqual(ids, ['a', 'b', 'd'])
+
+    def test_inactive_students_are_never_present(self):
+        ids = ['a', 'b']
+        presence_cache.merge(ids, {'b': True, 'c': True}, active=set())
+        self.assertEqual(ids, ['a'])
+
+    def test_repeated_marks_change_nothing(self):
+        ids = ['a', 'b']
+        presence_cache.merge(ids, {'a': True, 'c': False}, active={'a'})
+        self.assertEqual(ids, ['a', 'b'])
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch.object(presence_cache, '_active', lambda student_ids: set(student_ids))
+@mock.patch.object(presence_cache, 'is_school_day', lambda day: day.weekday() < 5)
+class ApplyChangesTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def cached(self, day=DAY):
+        entry = presence_cache._get(presence_cache._key(day))
+        return entry and entry['ids']
+
+    def seed(self, ids, day=DAY):
+        cache.set(presence_cache._key(day), {'ids': list(ids), 'generation': 1, 'built_at': 0, 'updated_at': 0})
+
+    def test_cached_entry_is_updated(self):
+        self.seed(['a', 'b'])
+        presence_cache.apply_changes({DAY: {'a': False, 'c': True}})
+        self.assertEqual(self.cached(), ['b', 'c'])
+
+    def test_uncached_dates_stay_uncached(self):
+        presence_cache.apply_changes({DAY: {'a': True}})
+        self.assertIsNone(self.cached())
+
+    def test_closed_days_are_skipped(self):
+        saturday = date(2025, 3, 8)
+        self.seed([], saturday)
+        presence_cache.apply_changes({saturday: {'a': True}})
+        self.assertEqual(self.cached(saturday), [])
+
+    def test_writer_waits_for_a_held_lock(self):
+        self.seed(['a'])
+        key = presence_cache._key(DAY)
+        cache.add(f'{key}:lock', 1)
+        threading.Timer(0.05, lambda: cache.delete(f'{key}:lock')).start()
+        presence_cache.apply_changes({DAY: {'b': True}})
+        self.assertEqual(self.cached(), ['a', 'b'])
+
+    def test_rebuild_does_not_overwrite_a_concurrent_write(self):
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_load(day):
+            loading.set()
+            release.wait(1)
+            # Read before the write below committed
+            return ['a']
+
+        with mock.patch.object(presence_cache, '_load', slow_load):
+            rebuild = threading.Thread(target=presence_cache.rebuild, args=(DAY,))
+            rebuild.start()
+            loading.wait(1)
+            writer = threading.Thread(target=presence_cache.apply_changes, args=({DAY: {'b': True}},))
+            writer.start()
+            time.sleep(0.05)
+            release.set()
+            rebuild.join()
+            writer.join()
+        self.assertEqual(self.cached(), ['a', 'b'])
+
+    def test_entries_of_an_older_generation_are_ignored(self):
+        self.seed(['a'])
+        presence_cache.invalidate_all()
+        self.assertIsNone(self.cached())
+        with mock.patch.object(presence_cache, '_load', lambda day: ['b']):
+            self.assertEqual(presence_cache.present_ids(DAY), ['b'])
+        self.assertEqual(self.cached(), ['b'])
+
+    def test_reader_does_not_wait_for_a_rebuild(self):
+        key = presence_cache._key(DAY)
+        cache.add(f'{key}:lock', 1)
+        with mock.patch.object(presence_cache, '_load', lambda day: ['a']):
+            self.assertEqual(presence_cache.present_ids(DAY), ['a'])
+        # Not cached while someone else holds the lock
+        self.assertIsNone(self.cached())
+
+
+class PresenceBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.student = Student.objects.create(name='Student', class_grade='5', address_text='-',
+                                              guardian_name='-')
+        self.changes = []
+        receiver = lambda sender, changes, **kwargs: self.changes.append(changes)
+        attendance_changed.connect(receiver)
+        self.addCleanup(attendance_changed.disconnect, receiver)
+
+    def test_only_touched_dates_are_reported_after_commit(self):
+        entries = [{'student_id': str(self.student.student_id), 'date': '2025-03-03', 'presence': False},
+                   {'student_id': str(self.student.student_id), 'date': '2025-03-04', 'presence': True}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('student-presence'), {'entries': entries}, format='json')
+            self.assertEqual(self.changes, [])
+        self.assertEqual(response.data['applied'], 2)
+        self.assertEqual(self.changes, [{date(2025, 3, 3): {self.student.student_id: False},
+                                         date(2025, 3, 4): {self.student.student_id: True}}])
+        self.assertEqual(Attendance.objects.filter(student=self.student).count(),
+                         1 if Attendance.is_sparse() else 2)
+
+
+class RecordWeightTests(SimpleTestCase):
+    def test_same_weekday_counts_more(self):
+        monday, tuesday = DAY - timedelta(weeks=1), DAY - timedelta(days=6)
+        same, other = forecast._record_weights(DAY, [monday, tuesday])
+        self.assertGreater(same, other)
+
+    def test_older_records_count_less(self):
+        recent, old = forecast._record_weights(DAY, [DAY - timedelta(weeks=1), DAY - timedelta(weeks=4)])
+        self.assertAlmostEqual(old / recent, forecast.WEEKLY_DECAY ** 3)
+
+
+@override_settings(ATTENDANCE_MODE='full')
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.regular, self.absent = [
+            Student.objects.create(name=name, class_grade='5', address_text='-', guardian_name='-')
+            for name in ('Regular', 'Absent')
+        ]
+        for weeks in range(1, 5):
+            day = DAY - timedelta(weeks=weeks)
+            Attendance.objects.create(student=self.regular, date=day, presence=True)
+            Attendance.objects.create(student=self.absent, date=day, presence=False)
+
+    def test_history_decides_the_prediction(self):
+        rates = forecast.predict_presence(DAY)
+        self.assertGreater(rates[self.regular.student_id], forecast.PRESENCE_THRESHOLD)
+        self.assertLess(rates[self.absent.student_id], forecast.PRESENCE_THRESHOLD)
+
+    def test_students_without_history_are_planned_present(self):
+        newcomer = Student.objects.create(name='New', class_grade='5', address_text='-', guardian_name='-')
+        ids = [self.regular.student_id, self.absent.student_id, newcomer.student_id]
+        self.assertEqual(forecast.predicted_present_ids(DAY, ids),
+                         [self.regular.student_id, newcomer.student_id])
+
+    def test_register_is_complete_once_every_active_student_is_recorded(self):
+        Attendance.objects.create(student=self.regular, date=DAY, presence=True)
+        self.assertFalse(Attendance.is_complete(DAY))
+        Student.objects.filter(pk=self.absent.pk).update(is_active=False)
+        self.assertTrue(Attendance.is_complete(DAY))
+
+
+@override_settings(ATTENDANCE_MODE='full')
+class GenerationTests(TestCase):
+    def setUp(self):
+        self.students = [
+            Student.objects.create(name=f'Student {i}', class_grade='5', address_text='-', guardian_name='-')
+            for i in range(3)
+        ]
+
+    def test_every_school_day_is_marked(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            students, days, written = generation.generate_monthly_attendance(2025, 3, chunk_size=2)
+        self.assertEqual((students, written), (3, 3 * days))
+        self.assertEqual(Attendance.objects.filter(presence=True).count(), 3 * days)
+        self.assertFalse(Attendance.objects.filter(date=date(2025, 3, 8)).exists())  # Saturday
+
+    def test_existing_records_are_kept_without_overwrite(self):
+        Attendance.objects.create(student=self.students[0], date=DAY, presence=False)
+        generation.generate_monthly_attendance(2025, 3, overwrite=False)
+        self.assertFalse(Attendance.objects.get(student=self.students[0], date=DAY).presence)
+
+    def test_caches_are_refreshed_after_commit(self):
+        with mock.patch.object(presence_cache, 'invalidate') as invalidate, \
+                mock.patch.object(generation.rollups, 'refresh_month'):
+            with self.captureOnCommitCallbacks(execute=True):
+                generation.generate_monthly_attendance(2025, 3)
+                invalidate.assert_not_called()
+            invalidate.assert_any_call(DAY)
+
+
+class SchoolCalendarTests(TestCase):
+    def setUp(self):
+        SchoolHoliday.objects.create(date=date(2025, 3, 5), name='Holiday')
+
+    def test_weekends_and_holidays_are_closed(self):
+        self.assertTrue(school_calendar.is_school_day(DAY))
+        self.assertFalse(school_calendar.is_school_day(date(2025, 3, 5)))
+        self.assertFalse(school_calendar.is_school_day(date(2025, 3, 8)))
+
+    def test_month_and_range_agree(self):
+        days = school_calendar.school_days(2025, 3)
+        self.assertEqual(len(days), 20)
+        self.assertNotIn(date(2025, 3, 5), days)
+        self.assertEqual(school_calendar.school_days_between(date(2025, 3, 1), date(2025, 4, 1)), days)
+
+    def test_range_excludes_its_end(self):
+        self.assertEqual(school_calendar.school_days_between(DAY, DAY + timedelta(days=2)),
+                         [DAY, DAY + timedelta(days=1)])
+
+    @override_settings(SCHOOL_WEEKDAYS=[0, 1, 2, 3, 4, 5])
+    def test_weekdays_come_from_the_settings(self):
+        self.assertTrue(school_calendar.is_school_day(date(2025, 3, 8)))
+
+
+class AttendanceJobTests(TestCase):
+    def make_job(self, status, idle):
+        job = AttendanceJob.objects.create(year=2025, month=3, status=status)
+        AttendanceJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - idle)
+        return job
+
+    def test_only_silent_unfinished_jobs_fail(self):
+        stale = AttendanceJob.STALE_AFTER + timedelta(minutes=1)
+        dead = [self.make_job('pending', stale), self.make_job('running', stale)]
+        alive = self.make_job('running', timedelta(minutes=1))
+        done = self.make_job('completed', stale)
+        self.assertEqual(AttendanceJob.fail_stale(), 2)
+        self.assertEqual(set(AttendanceJob.objects.filter(status='failed')), set(dead))
+        alive.refresh_from_db()
+        done.refresh_from_db()
+        self.assertEqual((alive.status, done.status), ('running', 'completed'))
+        self.assertIn('stopped', AttendanceJob.objects.get(pk=dead[0].pk).error)
+
+
+class BulkUpsertTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(name='Student', class_grade='5', address_text='-',
+                                              guardian_name='-')
+
+    @override_settings(ATTENDANCE_MODE='full')
+    def test_last_value_per_key_wins(self):
+        Attendance.bulk_upsert([(self.student.student_id, DAY, True), (self.student.student_id, DAY, False)])
+        self.assertFalse(Attendance.objects.get(student=self.student, date=DAY).presence)
+
+    @override_settings(ATTENDANCE_MODE='full')
+    def test_overwrite_updates_existing_records(self):
+        Attendance.objects.create(student=self.student, date=DAY, presence=False)
+        self.assertEqual(Attendance.bulk_upsert([(self.student.student_id, DAY, True)]), 1)
+        self.assertTrue(Attendance.objects.get(student=self.student, date=DAY).presence)
+
+    @override_settings(ATTENDANCE_MODE='sparse')
+    def test_sparse_mode_stores_absences_only(self):
+        Attendance.bulk_upsert([(self.student.student_id, DAY, True)])
+        self.assertFalse(Attendance.objects.exists())
+        Attendance.bulk_upsert([(self.student.student_id, DAY, False)])
+        Attendance.bulk_upsert([(self.student.student_id, DAY, True)])
+        # A cleared absence stays as a present row so the change is visible
+        self.assertTrue(Attendance.objects.get(student=self.student, date=DAY).presence)
+
+
+class AttendanceExportTests(TestCase):
+    def setUp(self):
+        self.bea, self.amy = [
+            Student.objects.create(name=name, class_grade='5', address_text='-', guardian_name='-')
+            for name in ('Bea', 'Amy')
+        ]
+
+    @override_settings(ATTENDANCE_MODE='full')
+    def test_rows_are_ordered_by_date_and_name(self):
+        for day in (DAY + timedelta(days=1), DAY):
+            for student in (self.bea, self.amy):
+                Attendance.objects.create(student=student, date=day, presence=True)
+        rows = list(exports.attendance_rows(DAY, DAY + timedelta(days=1)))
+        self.assertEqual([(row['date'], row['student_name']) for row in rows],
+                         [(DAY, 'Amy'), (DAY, 'Bea'), (DAY + timedelta(days=1), 'Amy'),
+                          (DAY + timedelta(days=1), 'Bea')])
+
+    @override_settings(ATTENDANCE_MODE='full')
+    def test_first_row_needs_only_its_own_day(self):
+        Attendance.objects.create(student=self.amy, date=DAY, presence=True)
+        rows = exports.attendance_rows(DAY, DAY + timedelta(days=30))
+        with CaptureQueriesContext(connection) as queries:
+            next(rows)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(ATTENDANCE_MODE='sparse')
+    def test_sparse_mode_fills_in_present_students(self):
+        Attendance.objects.create(student=self.bea, date=DAY, presence=False)
+        rows = list(exports.attendance_rows(DAY, DAY))
+        self.assertEqual([(row['student_name'], row['presence']) for row in rows],
+                         [('Amy', True), ('Bea', False)])
+
+
+partition_migration = importlib.import_module('attendance.migrations.0004_partition_attendance')
+
+
+class PartitionMigrationNameTests(SimpleTestCase):
+    """The migration recreates constraints and indexes under the names Django expects"""
+
+    def setUp(self):
+        self.editor = connection.SchemaEditorClass(connection, collect_sql=True)
+
+    def test_unique_constraint(self):
+        self.assertEqual(partition_migration.UNIQUE,
+                         self.editor._create_index_name(partitions.TABLE, ['student_id', 'date'], suffix='_uniq'))
+
+    def test_indexes(self):
+        names = {name for name, _ in partition_migration.INDEXES}
+        self.assertTrue({index.name for index in Attendance._meta.indexes} <= names)
+        for field in ('student', 'marked_by'):
+            column = Attendance._meta.get_field(field).column
+            self.assertIn(self.editor._create_index_name(partitions.TABLE, [column], suffix=''), names)
+
+    def test_foreign_keys(self):
+        for field in ('student', 'marked_by'):
+            name = self.editor._fk_constraint_name(Attendance, Attendance._meta.get_field(field),
+                                                   '_fk_%(to_table)s_%(to_column)s')
+            self.assertIn(str(name).strip('"'), partition_migration.FOREIGN_KEYS)
+
+
+class PartitionTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(name='Student', class_grade='5', address_text='-',
+                                              guardian_name='-')
+
+    def count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ONLY "{table}"')
+            return cursor.fetchone()[0]
+
+    def test_create_partition_moves_rows_out_of_the_default_partition(self):
+        month = partitions.add_months(partitions.month_start(date.today()), 24)
+        Attendance.objects.create(student=self.student, date=month, presence=False)
+        self.assertEqual(self.count(partitions.DEFAULT_PARTITION), 1)
+
+        self.assertEqual(partitions.create_partition(month), 1)
+        self.assertEqual(self.count(partitions.DEFAULT_PARTITION), 0)
+        self.assertEqual(self.count(partitions.partition_name(month)), 1)
+        self.assertIn(month, partitions.monthly_partitions())
+        # Still one table to the ORM
+        self.assertFalse(Attendance.objects.get(student=self.student, date=month).presence)
+
+
+class PartitionMigrationTests(TransactionTestCase):
+    def relkind(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [partitions.TABLE])
+            return cursor.fetchone()[0]
+
+    def test_migration_is_reversible(self):
+        student = Student.objects.create(name='Student', class_grade='5', address_text='-',
+                                          guardian_name='-')
+        Attendance.objects.create(student=student, date=DAY, presence=False)
+        executor = MigrationExecutor(connection)
+        latest = executor.loader.graph.leaf_nodes('attendance')
+
+        executor.migrate([('attendance', '0003_holidays_and_jobs')])
+        self.assertEqual(self.relkind(), 'r')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM "{partitions.TABLE}"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(latest)
+        self.assertEqual(self.relkind(), 'p')
+        self.assertEqual(Attendance.objects.filter(student=student, presence=False).count(), 1)
+
+
+class RollupQueueTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(rollups, 'refresh_changes')
+        self.refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(rollups.flush)
+
+    def test_writes_are_refreshed_together(self):
+        with mock.patch.object(rollups, 'REFRESH_DELAY_SECONDS', 60):
+            rollups.schedule_changes({DAY: {'a': True}})
+            rollups.schedule_changes({DAY: {'b': False}, date(2025, 3, 4): {'a': False}})
+        self.refresh.assert_not_called()
+        rollups.flush()
+        self.refresh.assert_called_once_with({DAY: {'a', 'b'}, date(2025, 3, 4): {'a'}})
+
+    def test_refresh_runs_in_the_background(self):
+        done = threading.Event()
+        self.refresh.side_effect = lambda changes: done.set()
+        with mock.patch.object(rollups, 'REFRESH_DELAY_SECONDS', 0.01):
+            rollups.schedule_changes({DAY: {'a': True}})
+        self.assertTrue(done.wait(1))
+
+    def test_failed_refresh_is_queued_again(self):
+        self.refresh.side_effect = [rollups.DatabaseError("down"), None]
+        with mock.patch.object(rollups, 'REFRESH_DELAY_SECONDS', 60):
+            rollups.schedule_changes({DAY: {'a': True}})
+            with self.assertRaises(rollups.DatabaseError):
+                rollups.flush()
+        rollups.flush()
+        self.assertEqual(self.refresh.call_args_list[-1], mock.call({DAY: {'a'}}))
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('students/', views.StudentMonthlyAttendanceListView.as_view(), name='attendance-students'),
+    path('students/<uuid:student_id>/', views.StudentAttendanceHistoryView.as_view(), name='attendance-student-history'),
+    path('classes/daily/', views.ClassDailyAttendanceListView.as_view(), name='attendance-classes-daily'),
+    path('classes/monthly/', views.ClassMonthlyAttendanceListView.as_view(), name='attendance-classes-monthly'),
+    path('export/', views.AttendanceExportView.as_view(), name='attendance-export'),
+]
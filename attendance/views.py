@@ -1,3 +1,180 @@
-from django.shortcuts import render
+from collections import defaultdict
+from datetime import date as date_cls, datetime, timedelta
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from core.export import export_params, streaming_export
+from core.permissions import IsOwnerOrAdmin
+from students.models import Student
+from .exports import FIELDS as EXPORT_FIELDS, attendance_rows
+from .models import Attendance, StudentMonthlyAttendance, ClassDailyAttendance, ClassMonthlyAttendance
+from .serializers import (
+    PresenceBatchSerializer,
+    StudentMonthlyAttendanceSerializer,
+    ClassDailyAttendanceSerializer,
+    ClassMonthlyAttendanceSerializer,
+)
+from .signals import attendance_changed
 
-# Create your views here.
+class AttendanceBatchView(generics.GenericAPIView):
+    """
+    Mark presence for a batch of (student, date) entries in one request.
+    Guardians can only mark their own student; admins can mark anyone.
+    """
+    serializer_class = PresenceBatchSerializer
+    permission_classes = [IsAuthenticated]
+    owner_id_field = 'student_id'
+
+    def post(self, request, *args, **kwargs):
+        """
+        Apply every permitted entry in a single upsert and report the
+        outcome of each entry in request order.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.validated_data['entries']
+
+        students = Student.objects.in_bulk({entry['student_id'] for entry in entries})
+        ownership = IsOwnerOrAdmin()
+
+        results = []
+        records = []
+        changes = defaultdict(dict)
+        for entry in entries:
+            student = students.get(entry['student_id'])
+            if student is None:
+                outcome = 'not_found'
+            elif not ownership.has_object_permission(request, self, student):
+                outcome = 'forbidden'
+            else:
+                outcome = 'ok'
+                records.append((student.student_id, entry['date'], entry['presence']))
+                changes[entry['date']][student.student_id] = entry['presence']
+
+            results.append({
+                'student_id': str(entry['student_id']),
+                'date': entry['date'].isoformat(),
+                'presence': entry['presence'],
+                'status': outcome,
+            })
+
+        if records:
+            with transaction.atomic():
+                Attendance.bulk_upsert(records, user=request.user)
+                # Refresh the cached present sets and rollups of the dates this batch touched.
+                # Plans are patched off the request path: run_planner's incremental pass reads
+                # the attendance of each planned date written since its watermark, which only
+                # finds the dates this batch touched (see routeplan.incremental)
+                transaction.on_commit(lambda: attendance_changed.send(
+                    sender=Attendance, changes=dict(changes)
+                ))
+
+        return Response({
+            'applied': len(records),
+            'rejected': len(entries) - len(records),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+def _date_param(request, name, fmt='%Y-%m-%d'):
+    """Parse an optional date query parameter"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, fmt).date()
+    except ValueError:
+        raise ValidationError({name: f"Expected a date formatted as {fmt}"})
+
+class StudentMonthlyAttendanceListView(generics.ListAPIView):
+    """
+    Monthly attendance of every student in a month (?month=YYYY-MM, default
+    the current month), optionally for one class (?class_grade=).
+    Only accessible to admins.
+    """
+    serializer_class = StudentMonthlyAttendanceSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        month = _date_param(self.request, 'month', '%Y-%m') or date_cls.today().replace(day=1)
+        queryset = StudentMonthlyAttendance.objects.filter(month=month).select_related('student')
+        class_grade = self.request.query_params.get('class_grade')
+        if class_grade:
+            queryset = queryset.filter(student__class_grade=class_grade)
+        return queryset.order_by('student__name')
+
+class StudentAttendanceHistoryView(generics.ListAPIView):
+    """
+    Monthly attendance of one student, newest month first.
+    Parents can only access their own student's attendance.
+    """
+    serializer_class = StudentMonthlyAttendanceSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    owner_id_field = 'student_id'
+
+    def get_queryset(self):
+        student = get_object_or_404(Student, student_id=self.kwargs['student_id'])
+        self.check_object_permissions(self.request, student)
+        return (
+            StudentMonthlyAttendance.objects
+            .filter(student=student)
+            .select_related('student')
+            .order_by('-month')
+        )
+
+class ClassDailyAttendanceListView(generics.ListAPIView):
+    """
+    Daily attendance per class between ?from= and ?to= (YYYY-MM-DD, default
+    the last 30 days), optionally for one class (?class_grade=).
+    Only accessible to admins.
+    """
+    serializer_class = ClassDailyAttendanceSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        end = _date_param(self.request, 'to') or date_cls.today()
+        start = _date_param(self.request, 'from') or end - timedelta(days=30)
+        queryset = ClassDailyAttendance.objects.filter(date__gte=start, date__lte=end)
+        class_grade = self.request.query_params.get('class_grade')
+        if class_grade:
+            queryset = queryset.filter(class_grade=class_grade)
+        return queryset.order_by('date', 'class_grade')
+
+class ClassMonthlyAttendanceListView(generics.ListAPIView):
+    """
+    Monthly attendance per class, optionally for one month (?month=YYYY-MM)
+    and/or one class (?class_grade=).
+    Only accessible to admins.
+    """
+    serializer_class = ClassMonthlyAttendanceSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        queryset = ClassMonthlyAttendance.objects.all()
+        month = _date_param(self.request, 'month', '%Y-%m')
+        if month:
+            queryset = queryset.filter(month=month)
+        class_grade = self.request.query_params.get('class_grade')
+        if class_grade:
+            queryset = queryset.filter(class_grade=class_grade)
+        return queryset.order_by('-month', 'class_grade')
+
+class AttendanceExportView(generics.GenericAPIView):
+    """
+    Stream the attendance of a month or date range as CSV or NDJSON,
+    optionally for one class (?class_grade=).
+    Only accessible to admins.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        start, end, fmt = export_params(request)
+        class_grade = request.query_params.get('class_grade')
+        return streaming_export(
+            request, attendance_rows(start, end, class_grade),
+            EXPORT_FIELDS, fmt,
+            f"attendance_{start}_{end}" + (f"_class_{class_grade}" if class_grade else ""),
+        )
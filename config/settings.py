@@ -37,6 +37,7 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '').split(',')
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI server - must come before staticfiles so runserver serves WebSockets
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -62,6 +63,7 @@ INSTALLED_APPS = [
     'authapp', 
     'attendance',
     'core',
+    'live_tracking',
 ]
 
 MIDDLEWARE = [
@@ -95,6 +97,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
@@ -112,6 +115,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Shared between the web and planner processes through Redis; falls back to
+# a per-process memory cache when REDIS_URL is not set, which is only fit for
+# a single process in development: invalidations made by one process never
+# reach the others (`check --deploy` reports it as core.E001).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -230,6 +255,43 @@ CORS_ALLOWED_ORIGINS = [
 # Mapbox settings
 MAPBOX_TOKEN = os.getenv('MAPBOX_ACCESS_TOKEN')
 
+# School location used as the start/end of every route ([longitude, latitude])
+SCHOOL_COORDINATES = [76.328898, 10.0482921]
+
+# School calendar - weekdays on which the school is open (Monday is 0)
+SCHOOL_WEEKDAYS = [0, 1, 2, 3, 4]
+
+# Attendance storage
+# 'full' stores a row for every student on every school day.
+# 'sparse' only stores exceptions: a student is present unless marked absent.
+ATTENDANCE_MODE = os.environ.get('ATTENDANCE_MODE', 'full')
+# Monthly partitions (manage.py manage_attendance_partitions)
+ATTENDANCE_PARTITIONS_AHEAD = 3  # Future months that always have a partition
+ATTENDANCE_RETENTION_MONTHS = None  # Detach older months; None keeps everything
+
+# Trip scheduling
+SCHOOL_START_TIME = '08:30'  # Morning trips must arrive by this time
+SCHOOL_END_TIME = '15:30'  # Afternoon trips leave from this time
+WAVE_TIME_BUDGET_MINUTES = 90  # Longest a driver's session (all waves) may take
+WAVE_TURNAROUND_MINUTES = 10  # Gap between two waves of the same bus
+BUS_AVERAGE_SPEED_KMH = 25
+STOP_DWELL_SECONDS = 60
+
+# Live tracking (WebSockets)
+LIVE_LOCATION_FLUSH_SECONDS = 5  # Buffered driver positions are written to the database this often
+# Relay points between ASGI processes: 'postgres' (LISTEN/NOTIFY) or '' for a single process
+LIVE_TRACKING_BROKER = os.environ.get('LIVE_TRACKING_BROKER', 'postgres')
+LIVE_TRACKING_BATCH_MS = 50  # Points are sent to other processes in batches this far apart
+LIVE_INGEST_CAPACITY = 500  # Location pings per second a process takes before asking apps to back off
+BREADCRUMB_SIMPLIFY_METERS = 5  # Douglas-Peucker tolerance for the stored path of a trip
+BREADCRUMB_RETENTION_DAYS = 7  # Raw breadcrumbs of compacted trips are kept this long
+
+# Planner service (manage.py run_planner)
+PLANNER_EVENING_TIME = '19:00'  # Plan the next school day from this time
+PLANNER_MORNING_CUTOFF = '07:00'  # Morning plan must be final by this time
+PLANNER_AFTERNOON_CUTOFF = '14:00'  # Afternoon plan must be final by this time
+PLANNER_POLL_SECONDS = 60
+
 # Add these settings
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get('GOOGLE_OAUTH2_CLIENT_ID', '')
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH2_CLIENT_SECRET', '')
@@ -18,6 +18,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from core.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -31,6 +32,10 @@ urlpatterns = [
     path('accounts/', include('allauth.urls')),
     path('api/students/', include('students.urls')),
     path('api/drivers/', include('drivers.urls')),
+    path('api/attendance/', include('attendance.urls')),
+    path('api/routes/', include('routeplan.urls')),
+    path('api/live/', include('live_tracking.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
     
     # Your other URL patterns
     # path('api/students/', include('students.urls')),
@@ -1,3 +1,19 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Notification
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    """The outbox is written by the application; admins can only inspect it"""
+    list_display = ('created_at', 'kind', 'recipient_type', 'recipient_id', 'message', 'sent_at')
+    list_filter = ('kind', 'recipient_type', 'sent_at')
+    search_fields = ('recipient_id', 'dedupe_key')
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,31 @@
+"""
+System checks for the deployment.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends that keep entries inside one process
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    """Whether the default cache is seen by every process (web, planner, scripts)"""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Live positions, the present-student sets and the student trip lookups
+    are written by one process and read or invalidated by another.
+    """
+    if cache_is_shared():
+        return []
+    return [Error(
+        "The default cache is local to each process.",
+        hint="Set REDIS_URL: the web, planner and script processes share cached state through it.",
+        id='core.E001',
+    )]
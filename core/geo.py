@@ -0,0 +1,75 @@
+import numpy as np
+
+# Mean Earth radius in kilometres
+EARTH_RADIUS_KM = 6371.0088
+
+# Approximate length of one degree of latitude in kilometres
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance in kilometres between two points.
+    Accepts scalars or numpy arrays (broadcast element-wise).
+
+    Args:
+        lon1, lat1: Longitude/latitude of the first point(s) in degrees
+        lon2, lat2: Longitude/latitude of the second point(s) in degrees
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_local_xy(coords, origin_lat):
+    """
+    Project [lon, lat] coordinates onto a flat plane in kilometres.
+    Accurate enough for distances within a city.
+
+    Args:
+        coords: Array-like of shape (n, 2) with [longitude, latitude] pairs
+        origin_lat (float): Latitude used for the longitude scale factor
+    """
+    coords = np.asarray(coords, dtype=float)
+    scale = np.cos(np.radians(origin_lat))
+    return np.column_stack((coords[:, 0] * KM_PER_DEGREE * scale,
+                            coords[:, 1] * KM_PER_DEGREE))
+
+
+def locate_on_polyline(points, position, start=0, end=None):
+    """
+    Find the polyline segment closest to a position.
+
+    Args:
+        points: Array-like of shape (n, 2) with [longitude, latitude] vertices
+        position: [longitude, latitude] of the point to locate
+        start (int): First segment to consider
+        end (int): Segment after the last one to consider (defaults to all)
+
+    Returns:
+        Tuple of (segment_index, fraction along the segment, distance in km)
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        raise ValueError("A polyline needs at least two points")
+
+    end = len(points) - 1 if end is None else min(end, len(points) - 1)
+    start = max(0, min(start, end - 1))
+
+    xy = to_local_xy(points[start:end + 1], position[1])
+    p = to_local_xy([position], position[1])[0]
+
+    a = xy[:-1]
+    ab = xy[1:] - a
+    lengths = (ab ** 2).sum(axis=1)
+    # Degenerate segments (repeated vertices) project onto their start point
+    t = np.divide(((p - a) * ab).sum(axis=1), lengths,
+                  out=np.zeros_like(lengths), where=lengths > 0)
+    t = np.clip(t, 0.0, 1.0)
+    closest = a + ab * t[:, None]
+    distances = np.sqrt(((closest - p) ** 2).sum(axis=1))
+
+    best = int(distances.argmin())
+    return start + best, float(t[best]), float(distances[best])
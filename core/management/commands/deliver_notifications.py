@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.notifications import DELIVERY_BATCH_SIZE, deliver_pending
+
+
+class Command(BaseCommand):
+    help = "Send the notifications waiting in the outbox, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep delivering new notifications until stopped')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the outbox is empty (with --loop)')
+        parser.add_argument('--batch-size', type=int, default=DELIVERY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        sent = 0
+        while True:
+            count = deliver_pending(options['batch_size'])
+            sent += count
+            if count:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} notifications"))
@@ -0,0 +1,41 @@
+import sys
+from datetime import date as date_cls
+
+from django.core.management.base import BaseCommand
+
+from attendance.exports import FIELDS as ATTENDANCE_FIELDS, attendance_rows
+from core.export import FORMATS, encode_rows
+from routeplan.exports import FIELDS as ROSTER_FIELDS, roster_rows
+
+
+class Command(BaseCommand):
+    help = "Stream attendance or trip roster history for a date range to a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['attendance', 'trips'])
+        parser.add_argument('start', type=date_cls.fromisoformat, help='First date (YYYY-MM-DD)')
+        parser.add_argument('end', type=date_cls.fromisoformat, help='Last date (YYYY-MM-DD)')
+        parser.add_argument('--format', dest='fmt', choices=list(FORMATS), default='csv')
+        parser.add_argument('--class-grade', help='Only export this class (attendance only)')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        if options['kind'] == 'attendance':
+            rows = attendance_rows(options['start'], options['end'], options['class_grade'])
+            fields = ATTENDANCE_FIELDS
+        else:
+            rows = roster_rows(options['start'], options['end'])
+            fields = ROSTER_FIELDS
+
+        out = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        count = 0
+        try:
+            for line in encode_rows(rows, fields, options['fmt']):
+                out.write(line)
+                count += 1
+        finally:
+            if options['output']:
+                out.close()
+
+        if options['output']:
+            self.stderr.write(f"Wrote {count} lines to {options['output']}")
@@ -0,0 +1,69 @@
+"""
+Lightweight application metrics.
+
+Counters and gauges live in the Django cache so every process (web
+workers, the planner) reports into the same numbers. Metric names are
+dotted strings such as 'presence_cache.hits'.
+"""
+from django.core.cache import cache
+
+KEY_PREFIX = 'metrics:'
+REGISTRY_KEY = 'metrics:names'
+
+# Names this process has already added to the shared registry
+_registered = set()
+
+
+def _register(name):
+    """Add a metric name to the registry that snapshot() reads"""
+    if name in _registered:
+        return
+    names = cache.get(REGISTRY_KEY) or set()
+    if name not in names:
+        cache.set(REGISTRY_KEY, names | {name}, timeout=None)
+    _registered.add(name)
+
+
+def incr(name, amount=1):
+    """
+    Increase a counter.
+
+    Args:
+        name (str): Metric name
+        amount (int): Amount to add
+    """
+    _register(name)
+    key = KEY_PREFIX + name
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # First use - another process may create it at the same moment
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def gauge(name, value):
+    """
+    Set a gauge to its current value.
+
+    Args:
+        name (str): Metric name
+        value: Number to report
+    """
+    _register(name)
+    cache.set(KEY_PREFIX + name, value, timeout=None)
+
+
+def snapshot(prefix=''):
+    """
+    Current value of every metric.
+
+    Args:
+        prefix (str): Only include metrics whose name starts with this
+
+    Returns:
+        dict mapping metric name to its value
+    """
+    names = sorted(name for name in cache.get(REGISTRY_KEY) or () if name.startswith(prefix))
+    values = cache.get_many([KEY_PREFIX + name for name in names])
+    return {name: values.get(KEY_PREFIX + name) for name in names}
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recipient_type', models.CharField(choices=[('driver', 'Driver'), ('guardian', 'Guardian')], help_text='Kind of user the notification is for', max_length=20)),
+                ('recipient_id', models.UUIDField(help_text='Driver or student the notification is about')),
+                ('kind', models.CharField(help_text='Event that caused the notification, e.g. bus_approaching', max_length=40)),
+                ('message', models.TextField(help_text='Human readable message')),
+                ('data', models.JSONField(blank=True, help_text='Structured payload for the app', null=True)),
+                ('dedupe_key', models.CharField(blank=True, help_text='Identifies the event; a second notification with the same key is dropped', max_length=200, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, help_text='When the notification was delivered; empty while it waits in the outbox', null=True)),
+            ],
+            options={
+                'verbose_name': 'Notification',
+                'verbose_name_plural': 'Notifications',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['id'], name='notification_outbox_idx'), models.Index(fields=['recipient_type', 'recipient_id', 'created_at'], name='core_notifi_recipie_f9375b_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,68 @@
 from django.db import models
+from django.db.models import Q
 
-# Create your models here.
+
+class Notification(models.Model):
+    """
+    Outbox of notifications for drivers and guardians.
+    Rows are written together with the change that caused them and sent in
+    batches by `manage.py deliver_notifications` (see core.notifications).
+    """
+    id = models.BigAutoField(primary_key=True)
+
+    RECIPIENT_CHOICES = [
+        ('driver', 'Driver'),
+        ('guardian', 'Guardian'),
+    ]
+    recipient_type = models.CharField(
+        max_length=20,
+        choices=RECIPIENT_CHOICES,
+        help_text="Kind of user the notification is for"
+    )
+    # Driver ID for drivers, student ID for guardians (the associated_id of their tokens)
+    recipient_id = models.UUIDField(
+        help_text="Driver or student the notification is about"
+    )
+
+    kind = models.CharField(
+        max_length=40,
+        help_text="Event that caused the notification, e.g. bus_approaching"
+    )
+    message = models.TextField(
+        help_text="Human readable message"
+    )
+    data = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Structured payload for the app"
+    )
+
+    # Events that may be reported more than once (by several processes or
+    # repeated pings) carry a key so only the first report is stored
+    dedupe_key = models.CharField(
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Identifies the event; a second notification with the same key is dropped"
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the notification was delivered; empty while it waits in the outbox"
+    )
+
+    def __str__(self):
+        return f"{self.kind} for {self.recipient_type} {self.recipient_id}"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notifications'
+        indexes = [
+            # The outbox: unsent notifications in the order they were written
+            models.Index(fields=['id'], condition=Q(sent_at__isnull=True), name='notification_outbox_idx'),
+            models.Index(fields=['recipient_type', 'recipient_id', 'created_at']),
+        ]
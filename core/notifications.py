@@ -0,0 +1,100 @@
+"""
+Notifications for drivers and guardians.
+
+Notifications are written to the Notification outbox, in the same
+transaction as the change that caused them, and delivered in batches by
+`manage.py deliver_notifications`. Push delivery (Firebase/OneSignal) is
+planned for V2; until then delivered notifications are written to the
+application log.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Notifications sent per outbox batch
+DELIVERY_BATCH_SIZE = 500
+
+
+def enqueue(notifications):
+    """
+    Add notifications to the outbox. Those whose dedupe_key is already
+    taken are dropped.
+
+    Args:
+        notifications: List of unsaved Notification
+    """
+    if notifications:
+        Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+        metrics.incr('notifications.enqueued', len(notifications))
+
+
+def notify_drivers(drivers, message, data=None, kind='message'):
+    """
+    Send a notification to each of the given drivers
+
+    Args:
+        drivers: Iterable of Driver objects
+        message (str): Human readable message
+        data (dict): Optional structured payload for the driver app
+        kind (str): Event that caused the notification
+    """
+    enqueue([
+        Notification(recipient_type='driver', recipient_id=driver.driver_id,
+                     kind=kind, message=message, data=data)
+        for driver in drivers if driver is not None
+    ])
+
+
+def notify_guardians(student_ids, kind, message, data=None, dedupe_key=None):
+    """
+    Send a notification to the guardians of the given students
+
+    Args:
+        student_ids: Iterable of student IDs
+        kind (str): Event that caused the notification
+        message (str): Human readable message
+        data (dict): Optional structured payload for the guardian app
+        dedupe_key (str): Identifies the event, so reporting it again does nothing
+    """
+    enqueue([
+        Notification(recipient_type='guardian', recipient_id=student_id, kind=kind,
+                     message=message, data=data,
+                     dedupe_key=f'{dedupe_key}:{student_id}' if dedupe_key else None)
+        for student_id in student_ids
+    ])
+
+
+def _send(notification):
+    """Deliver one notification"""
+    logger.info(f"Notify {notification.recipient_type} {notification.recipient_id}: {notification.message}")
+    if notification.data:
+        logger.debug(f"Notification payload for {notification.recipient_id}: {notification.data}")
+
+
+def deliver_pending(batch_size=DELIVERY_BATCH_SIZE):
+    """
+    Send one batch of notifications from the outbox.
+    Batches locked by another deliverer are skipped, so several can run.
+
+    Returns:
+        Number of notifications sent
+    """
+    with transaction.atomic():
+        batch = list(
+            Notification.objects
+            .filter(sent_at__isnull=True)
+            .order_by('id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        for notification in batch:
+            _send(notification)
+        Notification.objects.filter(id__in=[n.id for n in batch]).update(sent_at=timezone.now())
+    if batch:
+        metrics.incr('notifications.sent', len(batch))
+    return len(batch)
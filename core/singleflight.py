@@ -0,0 +1,127 @@
+"""
+Request coalescing.
+
+do() runs a computation once for all concurrent callers asking for the
+same key and hands every one of them the same result. With a window, the
+result is also reused by callers arriving up to `window` seconds after it
+was computed, which is what hot polling endpoints need: every guardian of
+a bus asking for its position in the same second gets one shared,
+already serialized response body.
+
+Results are kept per process. How many calls were served by another
+call's computation is reported to core.metrics as
+singleflight.<group>.computed / .shared.
+"""
+import threading
+import time
+
+from core import metrics
+
+# Callers wait at most this long for another call's result before computing it themselves
+WAIT_TIMEOUT = 5.0
+
+# Keys kept before finished calls outside their window are dropped
+MAX_KEYS = 5000
+
+# Seconds between pushes of the local counters to core.metrics
+METRICS_INTERVAL = 5.0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+
+_lock = threading.Lock()
+_calls = {}
+
+# group -> [computed, shared] not yet pushed to core.metrics
+_counts = {}
+_counts_pushed = time.monotonic()
+
+
+def _count(group, shared):
+    global _counts_pushed
+    with _lock:
+        counts = _counts.setdefault(group, [0, 0])
+        counts[1 if shared else 0] += 1
+        now = time.monotonic()
+        if now - _counts_pushed < METRICS_INTERVAL:
+            return
+        pending = {name: values for name, values in _counts.items() if any(values)}
+        _counts.clear()
+        _counts_pushed = now
+    for name, (computed, shared_calls) in pending.items():
+        if computed:
+            metrics.incr(f'singleflight.{name}.computed', computed)
+        if shared_calls:
+            metrics.incr(f'singleflight.{name}.shared', shared_calls)
+
+
+def _sweep(now):
+    """Forget finished calls whose result can no longer be reused (called with _lock held)"""
+    for key in [key for key, (call, window) in _calls.items()
+                if call.finished_at is not None and now - call.finished_at >= window]:
+        del _calls[key]
+
+
+def do(group, key, fn, window=0.0):
+    """
+    Run fn() once for concurrent calls with the same key.
+
+    Args:
+        group (str): Name of the call site, used for the metrics
+        key: Hashable identifying the computation within the group
+        fn: Callable without arguments
+        window (float): Seconds a finished result is reused for
+
+    Returns:
+        The result of fn(), possibly computed by another call
+
+    Raises:
+        Whatever fn() raised, in every call that shared it
+    """
+    full_key = (group, key)
+    now = time.monotonic()
+    with _lock:
+        entry = _calls.get(full_key)
+        call = None
+        if entry is not None:
+            call = entry[0]
+            if call.finished_at is not None and now - call.finished_at >= window:
+                call = None
+        leader = call is None
+        if leader:
+            if len(_calls) >= MAX_KEYS:
+                _sweep(now)
+            call = _Call()
+            _calls[full_key] = (call, window)
+
+    if not leader and call.done.wait(WAIT_TIMEOUT):
+        _count(group, shared=True)
+        if call.error is not None:
+            raise call.error
+        return call.result
+    if not leader:
+        # The computing call is stuck; do not pile up behind it
+        _count(group, shared=False)
+        return fn()
+
+    _count(group, shared=False)
+    try:
+        call.result = fn()
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        call.finished_at = time.monotonic()
+        call.done.set()
+        # Failures are not reused beyond the calls already waiting for them
+        if window <= 0 or call.error is not None:
+            with _lock:
+                if _calls.get(full_key, (None,))[0] is call:
+                    del _calls[full_key]
+    return call.result
@@ -1,3 +1,140 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import date
+from unittest import mock
+from uuid import UUID
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import export, singleflight
+from .authentication import CachedJWTAuthentication
+
+
+class SingleflightTests(SimpleTestCase):
+    def setUp(self):
+        with singleflight._lock:
+            singleflight._calls.clear()
+
+    def test_concurrent_calls_share_one_computation(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(singleflight.do('test', 'k', compute)))
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=lambda: results.append(singleflight.do('test', 'k', compute)))
+                     for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['result'] * 5)
+
+    def test_result_is_reused_within_the_window(self):
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(singleflight.do('test', 'k', compute, window=60), 1)
+        self.assertEqual(singleflight.do('test', 'k', compute, window=60), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_result_is_recomputed_without_a_window(self):
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        singleflight.do('test', 'k', compute)
+        self.assertEqual(singleflight.do('test', 'k', compute), 2)
+
+    def test_keys_are_computed_separately(self):
+        self.assertEqual(singleflight.do('test', 'a', lambda: 'a', window=60), 'a')
+        self.assertEqual(singleflight.do('test', 'b', lambda: 'b', window=60), 'b')
+
+    def test_errors_are_raised_and_not_reused(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            singleflight.do('test', 'k', fail, window=60)
+        self.assertEqual(singleflight.do('test', 'k', lambda: 'ok', window=60), 'ok')
+
+
+class ExportTests(SimpleTestCase):
+    ROW = {'date': date(2025, 3, 3), 'student_id': UUID(int=1), 'presence': True}
+
+    def params(self, **query):
+        return export.export_params(Request(APIRequestFactory().get('/', query)))
+
+    def test_csv_has_a_header_and_plain_values(self):
+        lines = list(export.encode_rows([self.ROW], ['date', 'student_id', 'presence'], 'csv'))
+        self.assertEqual(lines, ['date,student_id,presence\r\n',
+                                 f'2025-03-03,{UUID(int=1)},True\r\n'])
+
+    def test_ndjson_writes_one_object_per_line(self):
+        lines = list(export.encode_rows([self.ROW, self.ROW], ['date', 'presence'], 'ndjson'))
+        self.assertEqual([json.loads(line) for line in lines], [{'date': '2025-03-03', 'presence': True}] * 2)
+
+    def test_rows_are_read_lazily(self):
+        def rows():
+            yield self.ROW
+            raise AssertionError('read past the first row')
+
+        lines = export.encode_rows(rows(), ['date'], 'csv')
+        self.assertEqual([next(lines), next(lines)], ['date\r\n', '2025-03-03\r\n'])
+
+    def test_async_body_joins_lines_into_chunks(self):
+        async def collect():
+            return [chunk async for chunk in export._chunks(f'{i}\n' for i in range(export.CHUNK_SIZE + 1))]
+
+        chunks = async_to_sync(collect)()
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[1], f'{export.CHUNK_SIZE}\n')
+
+    def test_month_covers_the_whole_month(self):
+        self.assertEqual(self.params(month='2024-02'), (date(2024, 2, 1), date(2024, 2, 29), 'csv'))
+
+    def test_range_and_format(self):
+        self.assertEqual(self.params(**{'from': '2025-03-03', 'to': '2025-03-07', 'output': 'ndjson'}),
+                         (date(2025, 3, 3), date(2025, 3, 7), 'ndjson'))
+
+    def test_invalid_params_are_rejected(self):
+        for query in ({}, {'month': '2025-13'}, {'month': '2025-03', 'output': 'xml'},
+                      {'from': '2025-03-07', 'to': '2025-03-03'}):
+            with self.subTest(query=query), self.assertRaises(ValidationError):
+                self.params(**query)
+
+
+class CachedJWTAuthenticationTests(SimpleTestCase):
+    def setUp(self):
+        with singleflight._lock:
+            singleflight._calls.clear()
+        user = User(id=7, username='guardian@example.com', is_active=True)
+        user._state.db = 'default'
+        patcher = mock.patch.object(JWTAuthentication, 'get_user', return_value=user)
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_get_their_own_user(self):
+        auth = CachedJWTAuthentication()
+        first = auth.get_user({'user_id': 7})
+        first.username = 'changed by a request'
+        second = auth.get_user({'user_id': 7})
+        self.assertEqual(self.load.call_count, 1)
+        self.assertIsNot(first, second)
+        self.assertEqual((second.pk, second.username), (7, 'guardian@example.com'))
+        self.assertFalse(second._state.adding)
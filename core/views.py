@@ -1,3 +1,15 @@
-from django.shortcuts import render
+from rest_framework import generics
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import metrics
 
-# Create your views here.
+class MetricsView(generics.GenericAPIView):
+    """
+    Current value of the application metrics (cache hit rates, freshness).
+    Only accessible to admins.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """Return every metric, optionally limited to a name prefix (?prefix=)"""
+        return Response(metrics.snapshot(request.query_params.get('prefix', '')))
@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.gis.admin import GISModelAdmin
+from django.shortcuts import render
+from django.urls import path, reverse
 from .models import Driver
 
 @admin.register(Driver)
@@ -42,6 +45,30 @@ class DriverAdmin(GISModelAdmin):
     # Add custom actions
     actions = ['mark_as_available', 'mark_as_offline', 'mark_as_on_leave']
     
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('live-map/', self.admin_site.admin_view(self.live_map_view), name='driver-live-map'),
+        ]
+        return custom_urls + urls
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['live_map_url'] = reverse('admin:driver-live-map')
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def live_map_view(self, request):
+        """Map of every bus, polling the fleet endpoint for buses that moved"""
+        context = {
+            'title': 'Live Map',
+            'fleet_url': reverse('live-fleet'),
+            'mapbox_token': settings.MAPBOX_TOKEN,
+            'school_coordinates': settings.SCHOOL_COORDINATES,
+            'poll_seconds': 3,
+            'opts': self.model._meta,
+        }
+        return render(request, 'admin/drivers/driver/live_map.html', context)
+    
     def location_status(self, obj):
         """Display the status of driver location data"""
         if not obj.current_location:
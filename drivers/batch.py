@@ -0,0 +1,114 @@
+"""
+Batched location upload.
+
+A phone that lost its connection uploads its backlog of points in one
+request instead of replaying them one by one. Points are sent as integer
+triples (time offset in milliseconds, longitude and latitude in
+microdegrees); the first triple is relative to `base_time` and every
+following one to the triple before it, so a typical point takes a few
+bytes. The same triples can be sent as JSON or as a binary body:
+
+    application/json:
+        {"trip_id": "...", "base_time": 1760000000.5,
+         "points": [[0, 76328898, 10048292], [2000, 12, -5], ...]}
+
+    application/octet-stream (trip_id as ?trip_id=):
+        base_time as a little-endian float64, then one little-endian
+        int32 triple per point
+"""
+import struct
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import live
+from live_tracking import progress
+from live_tracking.hub import hub
+from routeplan import breadcrumbs
+
+# Points accepted in one upload (over 15 minutes at one ping per second);
+# matches the breadcrumb insert batch so an upload is a single INSERT
+MAX_BATCH_POINTS = breadcrumbs.INSERT_BATCH_SIZE
+
+MICRODEGREES = 1_000_000
+
+HEADER = struct.Struct('<d')
+TRIPLE = struct.Struct('<iii')
+
+
+class BinaryParser(BaseParser):
+    """Passes an application/octet-stream body through as bytes"""
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read() if stream is not None else b''
+
+
+def unpack(body):
+    """
+    Read the binary upload format.
+
+    Returns:
+        Tuple of (base_time, list of [dt, dlon, dlat] triples)
+
+    Raises:
+        ParseError: When the body is not a header followed by whole triples
+    """
+    if len(body) < HEADER.size or (len(body) - HEADER.size) % TRIPLE.size:
+        raise ParseError("Expected a float64 base time followed by int32 triples")
+    (base_time,) = HEADER.unpack_from(body)
+    return base_time, [list(triple) for triple in TRIPLE.iter_unpack(body[HEADER.size:])]
+
+
+def decode(base_time, points):
+    """
+    Turn delta-encoded triples into absolute fixes.
+
+    Args:
+        base_time (float): Unix time the first time offset is relative to
+        points: List of [dt ms, dlon microdegrees, dlat microdegrees]
+
+    Returns:
+        List of (timestamp, longitude, latitude) in upload order
+    """
+    fixes = []
+    millis = lon = lat = 0
+    for dt, dlon, dlat in points:
+        millis += dt
+        lon += dlon
+        lat += dlat
+        fixes.append((base_time + millis / 1000, lon / MICRODEGREES, lat / MICRODEGREES))
+    return fixes
+
+
+def ingest(driver_id, trip_id, fixes):
+    """
+    Store an uploaded batch: all points go to the trip's breadcrumbs in one
+    INSERT and the newest one becomes the driver's live position and
+    moves the bus along its trip (arrival estimates, geofences).
+
+    Args:
+        driver_id: Driver that sent the batch
+        trip_id: Trip the points belong to, or None to only update the live position
+        fixes: List of (timestamp, longitude, latitude)
+
+    Returns:
+        dict with the number of points stored and whether the live position moved
+    """
+    # Repeated timestamps are the same fix sent twice
+    fixes = sorted({timestamp: (timestamp, lon, lat) for timestamp, lon, lat in fixes}.values())
+
+    stored = 0
+    if trip_id:
+        batch = [breadcrumbs.build(trip_id, lon, lat, timestamp) for timestamp, lon, lat in fixes]
+        breadcrumbs.insert(batch)
+        stored = len(batch)
+
+    timestamp, lon, lat = fixes[-1]
+    updated = live.record(driver_id, lon, lat, timestamp)
+    if updated and trip_id:
+        progress.track(trip_id, lon, lat, timestamp)
+        # Subscribers only need where the bus is now, not the backlog
+        hub.publish_sync(str(trip_id), {'type': 'location', 'trip_id': str(trip_id),
+                                        'longitude': lon, 'latitude': lat, 'timestamp': timestamp})
+    return {'points': stored, 'position_updated': updated}
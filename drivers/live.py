@@ -0,0 +1,209 @@
+"""
+Live driver positions.
+
+Location pings are not written to the drivers table one by one. The latest
+position of each driver is kept in the Django cache, where readers (the
+driver API, live tracking) pick it up, and in a per-process buffer that is
+written to Driver.current_location with a single UPDATE at most every
+LIVE_LOCATION_FLUSH_SECONDS. Pings are ordered by the timestamp the device
+sends: a ping that is not newer than the last one seen (compared under a
+per-driver cache lock) is dropped, and the UPDATE never overwrites a newer
+position written by another process. The
+cached position also records when the server took the ping, which is what
+readers polling for changes order by; device clocks can lag or jump.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+
+from core import metrics
+from .models import Driver
+
+logger = logging.getLogger(__name__)
+
+# Positions stay readable from the cache this long after the last ping
+CACHE_TIMEOUT = 60 * 10
+
+# Pings from the future are clamped to now; devices are rarely more off than this
+MAX_CLOCK_SKEW = 60
+
+# Seconds a driver's position stays locked while a ping is compared and stored,
+# should the process die holding it
+LOCK_TIMEOUT = 2
+
+# How often a ping waiting for the driver's lock retries
+LOCK_RETRY_SECONDS = 0.005
+
+# Positions waiting to be written, by driver ID: (longitude, latitude, timestamp)
+_dirty = {}
+_lock = threading.Lock()
+_timer = None
+
+
+def _key(driver_id):
+    return f'drivers:live:{driver_id}'
+
+
+def record(driver_id, longitude, latitude, timestamp=None):
+    """
+    Take a location ping.
+
+    Args:
+        driver_id: Driver the ping belongs to
+        longitude (float): Longitude coordinate
+        latitude (float): Latitude coordinate
+        timestamp (float): Unix time the device took the position (default now)
+
+    Returns:
+        False when the ping was dropped as out of order or duplicate
+    """
+    now = time.time()
+    if timestamp is None or timestamp > now + MAX_CLOCK_SKEW:
+        timestamp = now
+    driver_id = str(driver_id)
+
+    key = _key(driver_id)
+    # Compare and set under the driver's lock, or of two concurrent pings the older could win
+    if not _lock_driver(key):
+        metrics.incr('driver_location.contended')
+        return False
+    try:
+        last = cache.get(key)
+        if last is not None and timestamp <= last['timestamp']:
+            metrics.incr('driver_location.stale')
+            return False
+        cache.set(key, {'longitude': longitude, 'latitude': latitude, 'timestamp': timestamp, 'received': now},
+                  CACHE_TIMEOUT)
+    finally:
+        cache.delete(f'{key}:lock')
+    metrics.incr('driver_location.pings')
+
+    with _lock:
+        pending = _dirty.get(driver_id)
+        if pending is None or timestamp > pending[2]:
+            _dirty[driver_id] = (longitude, latitude, timestamp)
+        _schedule()
+    return True
+
+
+def _lock_driver(key):
+    """
+    Take the lock on a driver's cached position.
+
+    Returns:
+        False when it is still held after LOCK_TIMEOUT, by which time it
+        should have expired
+    """
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(LOCK_RETRY_SECONDS)
+    return True
+
+
+def _schedule():
+    """Start the flush timer unless one is pending; call with _lock held"""
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(settings.LIVE_LOCATION_FLUSH_SECONDS, _flush_in_background)
+        _timer.daemon = True
+        _timer.start()
+
+
+def position(driver_id):
+    """
+    Latest known position of a driver.
+
+    Returns:
+        dict with longitude, latitude, timestamp (Unix time the device took
+        the position) and received (Unix time the server took the ping), or
+        None when no ping arrived recently
+    """
+    return cache.get(_key(driver_id))
+
+
+def positions(driver_ids):
+    """
+    Latest known positions of several drivers in one cache round trip.
+
+    Returns:
+        dict mapping driver ID (str) to the position of drivers that pinged recently
+    """
+    keys = {_key(driver_id): str(driver_id) for driver_id in driver_ids}
+    return {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+
+def flush():
+    """
+    Write the buffered positions of this process to the drivers table.
+
+    Returns:
+        Number of drivers updated
+
+    Raises:
+        DatabaseError: When the UPDATE fails; the batch is buffered again
+            and retried by the next flush
+    """
+    global _timer
+    with _lock:
+        batch = list(_dirty.items())
+        _dirty.clear()
+        _timer = None
+    if not batch:
+        return 0
+
+    values = ', '.join(['(%s::uuid, %s::float8, %s::float8, %s::timestamptz)'] * len(batch))
+    params = []
+    for driver_id, (longitude, latitude, timestamp) in batch:
+        params += [driver_id, longitude, latitude, datetime.fromtimestamp(timestamp, dt_timezone.utc)]
+
+    table = Driver._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE "{table}" AS driver
+                   SET current_location = ST_SetSRID(ST_MakePoint(ping.longitude, ping.latitude), 4326),
+                       location_updated_at = ping.taken_at
+                  FROM (VALUES {values}) AS ping(driver_id, longitude, latitude, taken_at)
+                 WHERE driver.driver_id = ping.driver_id
+                   AND (driver.location_updated_at IS NULL OR driver.location_updated_at < ping.taken_at)
+                """,
+                params,
+            )
+            updated = cursor.rowcount
+    except DatabaseError:
+        _requeue(batch)
+        raise
+    metrics.incr('driver_location.flushed', updated)
+    return updated
+
+
+def _requeue(batch):
+    """Buffer a batch that could not be written again, unless newer pings replaced it"""
+    with _lock:
+        for driver_id, pending in batch:
+            current = _dirty.get(driver_id)
+            if current is None or current[2] < pending[2]:
+                _dirty[driver_id] = pending
+        _schedule()
+
+
+def _flush_in_background():
+    try:
+        flush()
+    except DatabaseError as e:
+        logger.error(f"Could not write driver locations: {e}")
+    finally:
+        # The timer thread ends here; do not leave its connection open
+        connection.close()
+
+
+atexit.register(flush)
@@ -1,31 +1,76 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
 from rest_framework import serializers
 from .models import Driver
-from django.contrib.gis.geos import Point
-from django.utils import timezone
+from . import batch, live
+from live_tracking import progress
+from live_tracking.hub import hub
+from routeplan import breadcrumbs
 
 class DriverLocationSerializer(serializers.Serializer):
     """
     Serializer for updating driver location in real-time
     """
-    longitude = serializers.FloatField()
-    latitude = serializers.FloatField()
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    # Unix time the device took the position; pings older than the last one are dropped
+    timestamp = serializers.FloatField(required=False)
+    speed = serializers.FloatField(required=False, min_value=0, help_text="Speed in m/s")
+    heading = serializers.FloatField(required=False, help_text="Heading in degrees")
     
     def update(self, instance, validated_data):
-        lon = validated_data.get('longitude')
-        lat = validated_data.get('latitude')
-        
-        # Update driver location
-        instance.current_location = Point(lon, lat)
-        instance.location_updated_at = timezone.now()
-        instance.save(update_fields=['current_location', 'location_updated_at'])
+        # Held in the live store and written to the database in batches (see drivers.live)
+        lon = validated_data['longitude']
+        lat = validated_data['latitude']
+        timestamp = validated_data.get('timestamp') or time.time()
+        if live.record(instance.driver_id, lon, lat, timestamp):
+            # The view passes the trip in with save(trip_id=...) when it has looked it up already
+            if 'trip_id' in validated_data:
+                trip_id = validated_data['trip_id']
+            else:
+                trip_id = breadcrumbs.active_trip_id(instance.driver_id)
+            if trip_id:
+                speed, heading = validated_data.get('speed'), validated_data.get('heading')
+                breadcrumbs.record(trip_id, lon, lat, timestamp, speed, heading)
+                progress.track(trip_id, lon, lat, timestamp)
+                # Guardians following the bus over WebSockets see REST pings too
+                point = {'type': 'location', 'trip_id': str(trip_id),
+                         'longitude': lon, 'latitude': lat, 'timestamp': timestamp}
+                if speed is not None:
+                    point['speed'] = speed
+                if heading is not None:
+                    point['heading'] = heading
+                hub.publish_sync(str(trip_id), point)
         return instance
 
+class LocationBatchSerializer(serializers.Serializer):
+    """
+    Serializer for a delta-encoded batch of location points (see drivers.batch)
+    """
+    trip_id = serializers.UUIDField(required=False, allow_null=True)
+    base_time = serializers.FloatField()
+    points = serializers.ListField(
+        child=serializers.ListField(child=serializers.IntegerField(), min_length=3, max_length=3),
+        min_length=1,
+        max_length=batch.MAX_BATCH_POINTS,
+    )
+
+    def validate(self, attrs):
+        fixes = batch.decode(attrs['base_time'], attrs['points'])
+        for _, lon, lat in fixes:
+            if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                raise serializers.ValidationError({'points': "Coordinates out of range"})
+        attrs['fixes'] = fixes
+        return attrs
+
 class DriverSerializer(serializers.ModelSerializer):
     """
     Main serializer for Driver model with all fields
     """
     # Convert Point object to readable format
     current_location = serializers.SerializerMethodField()
+    location_updated_at = serializers.SerializerMethodField()
     
     class Meta:
         model = Driver
@@ -33,15 +78,28 @@ class DriverSerializer(serializers.ModelSerializer):
             'driver_id', 'name', 'licence_no', 'phone_number', 
             'email', 'bus_no', 'current_location', 'location_updated_at'
         ]
-        read_only_fields = ['driver_id', 'location_updated_at']
+        read_only_fields = ['driver_id']
     
     def get_current_location(self, obj):
         """
-        Convert the GeoDjango Point object to a simple lon/lat dictionary
+        Convert the GeoDjango Point object to a simple lon/lat dictionary.
+        A recent ping in the live store is newer than the stored location.
         """
+        position = live.position(obj.driver_id)
+        if position:
+            return {
+                'longitude': position['longitude'],
+                'latitude': position['latitude']
+            }
         if obj.current_location:
             return {
                 'longitude': obj.current_location.x,
                 'latitude': obj.current_location.y
             }
-        return None
\ No newline at end of file
+        return None
+
+    def get_location_updated_at(self, obj):
+        position = live.position(obj.driver_id)
+        if position:
+            return datetime.fromtimestamp(position['timestamp'], dt_timezone.utc).isoformat()
+        return obj.location_updated_at.isoformat() if obj.location_updated_at else None
@@ -1,3 +1,92 @@
-from django.test import TestCase
+import struct
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ParseError
+
+from . import batch, live
+
+
+class DecodeTests(SimpleTestCase):
+    def test_deltas_accumulate(self):
+        fixes = batch.decode(1000.0, [[0, 76328898, 10048292], [2000, 12, -5], [1500, -2, 3]])
+        self.assertEqual(len(fixes), 3)
+        self.assertEqual(fixes[0], (1000.0, 76.328898, 10.048292))
+        timestamp, longitude, latitude = fixes[2]
+        self.assertAlmostEqual(timestamp, 1003.5)
+        self.assertAlmostEqual(longitude, 76.328908)
+        self.assertAlmostEqual(latitude, 10.04829)
+
+    def test_first_offset_is_relative_to_base_time(self):
+        (fix,) = batch.decode(1000.0, [[250, 0, 0]])
+        self.assertEqual(fix[0], 1000.25)
+
+    def test_no_points(self):
+        self.assertEqual(batch.decode(1000.0, []), [])
+
+
+class UnpackTests(SimpleTestCase):
+    def test_round_trip(self):
+        points = [[0, 76328898, 10048292], [2000, 12, -5]]
+        body = batch.HEADER.pack(1760000000.5) + b''.join(batch.TRIPLE.pack(*point) for point in points)
+        self.assertEqual(batch.unpack(body), (1760000000.5, points))
+
+    def test_header_only(self):
+        self.assertEqual(batch.unpack(batch.HEADER.pack(1.0)), (1.0, []))
+
+    def test_values_are_little_endian(self):
+        body = struct.pack('<d', 2.0) + struct.pack('<iii', 1, -1, 256)
+        self.assertEqual(batch.unpack(body), (2.0, [[1, -1, 256]]))
+
+    def test_truncated_body_is_rejected(self):
+        with self.assertRaises(ParseError):
+            batch.unpack(b'\x00' * 4)
+
+    def test_partial_triple_is_rejected(self):
+        with self.assertRaises(ParseError):
+            batch.unpack(batch.HEADER.pack(1.0) + batch.TRIPLE.pack(1, 2, 3)[:-1])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'drivers-tests'}})
+class LiveRecordTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(live, '_schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(live._dirty.clear)
+        self.now = time.time()
+
+    def test_older_pings_are_dropped(self):
+        self.assertTrue(live.record('d', 1.0, 2.0, self.now))
+        self.assertFalse(live.record('d', 3.0, 4.0, self.now - 5))
+        self.assertFalse(live.record('d', 3.0, 4.0, self.now))
+        self.assertEqual(live.position('d')['longitude'], 1.0)
+
+    def test_ping_waits_for_the_drivers_lock(self):
+        cache.add(f"{live._key('d')}:lock", 1)
+        threading.Timer(0.05, cache.delete, [f"{live._key('d')}:lock"]).start()
+        self.assertTrue(live.record('d', 1.0, 2.0, self.now))
+        self.assertFalse(cache.get(f"{live._key('d')}:lock"))
+
+    def test_newest_of_concurrent_pings_wins(self):
+        real_get = cache.get
+
+        def slow_get(*args, **kwargs):
+            # Widen the window between reading the last ping and storing the new one
+            value = real_get(*args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        with mock.patch.object(cache, 'get', slow_get):
+            threads = [threading.Thread(target=live.record, args=('d', float(i), 0.0, self.now + i))
+                       for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(live.position('d')['timestamp'], self.now + 7)
@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('<uuid:driver_id>/', views.DriverDetailView.as_view(), name='driver-detail'),
     path('<uuid:driver_id>/location/', views.DriverLocationUpdateView.as_view(), name='driver-location'),
+    path('<uuid:driver_id>/location/batch/', views.DriverLocationBatchView.as_view(), name='driver-location-batch'),
 ]
\ No newline at end of file
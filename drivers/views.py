@@ -1,8 +1,14 @@
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from core.permissions import IsOwnerOrAdmin
+from live_tracking.progress import next_ping_interval
+from routeplan import breadcrumbs
+from routeplan.models import Trip
+from . import batch
 from .models import Driver
-from .serializers import DriverSerializer, DriverLocationSerializer
+from .serializers import DriverSerializer, DriverLocationSerializer, LocationBatchSerializer
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -36,5 +42,48 @@ class DriverLocationUpdateView(generics.GenericAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        trip_id = breadcrumbs.active_trip_id(instance.driver_id)
+        serializer.save(trip_id=trip_id)
+
+        # Tell the app when to send the next point
+        data = serializer.validated_data
+        interval = next_ping_interval(trip_id, data['longitude'], data['latitude'], data.get('speed'))
+        return Response({**serializer.data, 'next_ping_interval': interval}, status=status.HTTP_200_OK)
+
+class DriverLocationBatchView(generics.GenericAPIView):
+    """
+    Upload a backlog of location points in one request (see drivers.batch).
+    Drivers can only upload their own points, to their own trips.
+    """
+    queryset = Driver.objects.all()
+    serializer_class = LocationBatchSerializer
+    lookup_field = 'driver_id'
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    owner_id_field = 'driver_id'
+    parser_classes = [JSONParser, batch.BinaryParser]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Store the points as the trip's breadcrumbs and move the driver's
+        live position to the newest one.
+        """
+        driver = self.get_object()
+        if isinstance(request.data, bytes):
+            base_time, points = batch.unpack(request.data)
+            data = {'trip_id': request.query_params.get('trip_id'), 'base_time': base_time, 'points': points}
+        else:
+            data = request.data
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        trip_id = serializer.validated_data.get('trip_id')
+        if trip_id is None:
+            trip_id = breadcrumbs.active_trip_id(driver.driver_id)
+        elif not Trip.objects.filter(route_plan_id=trip_id, driver=driver).exists():
+            raise ValidationError({'trip_id': "Not a trip of this driver"})
+
+        fixes = serializer.validated_data['fixes']
+        result = batch.ingest(driver.driver_id, trip_id, fixes)
+        _, lon, lat = max(fixes)
+        result['next_ping_interval'] = next_ping_interval(trip_id, lon, lat)
+        return Response(result, status=status.HTTP_200_OK)
@@ -0,0 +1,84 @@
+"""
+JWT authentication for WebSocket connections.
+
+Browsers cannot set headers on a WebSocket handshake, so the access token
+is read from the `token` query parameter, or from an Authorization header
+when the client can send one. The token is checked once per connection;
+its claims end up in scope['jwt'] and its user in scope['user'].
+
+Browsers always send an Origin header, so checking it against ALLOWED_HOSTS
+stops other sites from opening connections with a visitor's token. The
+driver and guardian apps send none; they are only let through by the JWT.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.security.websocket import OriginValidator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+@database_sync_to_async
+def get_user(user_id):
+    try:
+        return get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id}, is_active=True)
+    except get_user_model().DoesNotExist:
+        return AnonymousUser()
+
+
+def token_from_scope(scope):
+    """Raw access token of a connection, or None"""
+    tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if tokens:
+        return tokens[0]
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            scheme, _, token = value.decode().partition(' ')
+            if scheme.lower() == 'bearer':
+                return token
+    return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticate WebSocket connections with the same JWTs as the REST API"""
+
+    async def __call__(self, scope, receive, send):
+        scope['jwt'] = {}
+        scope['user'] = AnonymousUser()
+
+        token = token_from_scope(scope)
+        if token:
+            try:
+                access = AccessToken(token)
+            except TokenError:
+                pass
+            else:
+                scope['jwt'] = access.payload
+                scope['user'] = await get_user(access.payload.get(api_settings.USER_ID_CLAIM))
+
+        return await super().__call__(scope, receive, send)
+
+
+class BrowserOriginValidator(OriginValidator):
+    """OriginValidator that lets handshakes without an Origin header through"""
+
+    def valid_origin(self, parsed_origin):
+        if parsed_origin is None:
+            return True
+        return super().valid_origin(parsed_origin)
+
+
+def AllowedHostsBrowserOriginValidator(application):
+    """
+    BrowserOriginValidator for settings.ALLOWED_HOSTS, like channels'
+    AllowedHostsOriginValidator
+    """
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['localhost', '127.0.0.1', '[::1]']
+    return BrowserOriginValidator(application, allowed_hosts)
@@ -0,0 +1,226 @@
+"""
+Cross-process location fan-out over PostgreSQL LISTEN/NOTIFY.
+
+Each ASGI process opens one listener connection and LISTENs on the channel
+of every trip it has local subscribers for (live_trip_<trip id hex>).
+Published points are buffered for a few milliseconds and sent to all
+trip channels in a single pg_notify statement from a second connection,
+so a busy process makes one round trip per batch instead of one per point.
+Local subscribers get points straight from the hub; a process ignores the
+notifications it sent itself.
+"""
+import asyncio
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'live_trip_'
+
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD = 7900
+
+# Seconds to wait before reconnecting a dropped listener
+RECONNECT_DELAY = 1.0
+
+
+def channel_name(trip_id):
+    return CHANNEL_PREFIX + uuid.UUID(str(trip_id)).hex
+
+
+def trip_id_from_channel(channel):
+    return str(uuid.UUID(channel[len(CHANNEL_PREFIX):]))
+
+
+def connect():
+    """New autocommit connection to the default database, outside Django's connection handling"""
+    db = settings.DATABASES['default']
+    conn = psycopg2.connect(
+        dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+        host=db['HOST'], port=db['PORT'],
+    )
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+def notify(trip_id, message):
+    """
+    Send one message to the listeners of a trip from synchronous code, on
+    Django's connection (delivered when its transaction commits)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [channel_name(trip_id), message])
+
+
+def payloads(messages):
+    """Join encoded messages into newline separated payloads that fit a NOTIFY"""
+    payload = ''
+    for message in messages:
+        if payload and len(payload) + len(message) + 1 > MAX_PAYLOAD:
+            yield payload
+            payload = ''
+        payload = f'{payload}\n{message}' if payload else message
+    if payload:
+        yield payload
+
+
+class PostgresBroker:
+    """
+    Relays hub messages between processes.
+
+    Args:
+        deliver: Callable(trip_id, encoded message) for messages from other processes
+    """
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.loop = asyncio.get_running_loop()
+        self.batch_seconds = settings.LIVE_TRACKING_BATCH_MS / 1000
+        self.channels = set()
+        self.pending = {}
+        self.flush_scheduled = False
+        self.listener = None
+        self.notifier = None
+        self.notifier_pid = None
+        # Connecting, LISTEN/UNLISTEN and NOTIFYs run on one background thread so the
+        # event loop never waits on the database
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='live-broker')
+        self._connect_listener()
+
+    def _connect_listener(self):
+        """Open the listener connection on the executor thread; the event loop never waits on it"""
+        channels = set(self.channels)
+        future = self.loop.run_in_executor(self.executor, self._open_listener, channels)
+        future.add_done_callback(partial(self._listener_ready, channels))
+
+    @staticmethod
+    def _open_listener(channels):
+        """Connect and LISTEN on the given channels (runs on the executor thread)"""
+        listener = connect()
+        with listener.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f'LISTEN {channel}')
+        return listener
+
+    def _listener_ready(self, channels, future):
+        try:
+            self.listener = future.result()
+        except psycopg2.Error as e:
+            logger.error(f"Live tracking listener could not connect: {e}")
+            self.loop.call_later(RECONNECT_DELAY, self._connect_listener)
+            return
+        self.loop.add_reader(self.listener.fileno(), self._on_readable)
+        # Trips subscribed to or left while connecting
+        for channel in self.channels - channels:
+            self._execute(f'LISTEN {channel}')
+        for channel in channels - self.channels:
+            self._execute(f'UNLISTEN {channel}')
+
+    def _drop_listener(self):
+        self.loop.remove_reader(self.listener.fileno())
+        try:
+            self.listener.close()
+        except psycopg2.Error:
+            pass
+        self.listener = None
+        self.loop.call_later(RECONNECT_DELAY, self._connect_listener)
+
+    def _execute(self, sql):
+        """
+        Run a LISTEN/UNLISTEN on the listener connection, if it is up, on the
+        executor thread. While it is (re)connecting, the channels are
+        reconciled once it is up.
+        """
+        if self.listener is None:
+            return
+        listener = self.listener
+        future = self.loop.run_in_executor(self.executor, self._run, listener, sql)
+        future.add_done_callback(partial(self._executed, listener))
+
+    @staticmethod
+    def _run(listener, sql):
+        with listener.cursor() as cursor:
+            cursor.execute(sql)
+
+    def _executed(self, listener, future):
+        try:
+            future.result()
+        except psycopg2.Error as e:
+            # A failure on a connection that was already replaced needs no action
+            if listener is self.listener:
+                logger.warning(f"Live tracking listener failed, reconnecting: {e}")
+                self._drop_listener()
+
+    def listen(self, trip_id):
+        """Start receiving a trip's points from other processes"""
+        channel = channel_name(trip_id)
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self._execute(f'LISTEN {channel}')
+
+    def unlisten(self, trip_id):
+        """Stop receiving a trip's points from other processes"""
+        channel = channel_name(trip_id)
+        if channel in self.channels:
+            self.channels.discard(channel)
+            self._execute(f'UNLISTEN {channel}')
+
+    def publish(self, trip_id, message):
+        """Queue a message for the other processes; it is sent with the next batch"""
+        self.pending.setdefault(channel_name(trip_id), []).append(message)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_later(self.batch_seconds, self._flush)
+
+    def _flush(self):
+        self.flush_scheduled = False
+        pending, self.pending = self.pending, {}
+        channels, bodies = [], []
+        for channel, messages in pending.items():
+            for payload in payloads(messages):
+                channels.append(channel)
+                bodies.append(payload)
+        if channels:
+            self.loop.run_in_executor(self.executor, self._notify, channels, bodies)
+
+    def _notify(self, channels, bodies):
+        """Send one batch of notifications (runs on the executor thread)"""
+        try:
+            if self.notifier is None or self.notifier.closed:
+                self.notifier = connect()
+                self.notifier_pid = self.notifier.get_backend_pid()
+            with self.notifier.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_notify(c, p) FROM unnest(%s::text[], %s::text[]) AS batch(c, p)',
+                    [channels, bodies],
+                )
+        except psycopg2.Error as e:
+            logger.warning(f"Dropped {len(bodies)} live tracking notifications: {e}")
+            if self.notifier is not None:
+                self.notifier.close()
+            self.notifier = None
+
+    def _on_readable(self):
+        try:
+            self.listener.poll()
+        except psycopg2.Error as e:
+            logger.warning(f"Live tracking listener failed, reconnecting: {e}")
+            self._drop_listener()
+            return
+
+        notifies = list(self.listener.notifies)
+        self.listener.notifies.clear()
+        for notify in notifies:
+            # Our own points were already delivered locally
+            if notify.pid == self.notifier_pid:
+                continue
+            trip_id = trip_id_from_channel(notify.channel)
+            for message in notify.payload.split('\n'):
+                self.deliver(trip_id, message)
@@ -0,0 +1,161 @@
+"""
+WebSocket endpoints for live bus locations.
+
+    /ws/driver-location/<trip_id>/     driver streams the bus location
+    /ws/parent-subscribe/<student_id>/ guardian follows the student's bus
+
+Connections are authorized once, when they open: drivers only for their
+own trips and guardians only for their own student. Admins may do both.
+"""
+import json
+import time
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils import timezone
+
+from drivers import live
+from routeplan import breadcrumbs
+from routeplan.models import Trip
+from . import progress
+from .hub import hub
+
+# Close codes sent after the handshake was accepted
+CLOSE_INVALID = 4400
+
+
+def is_allowed(scope, user_type, associated_id):
+    """Whether the connection's token belongs to an admin or to the given driver/guardian"""
+    user = scope['user']
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    claims = scope['jwt']
+    return claims.get('user_type') == user_type and claims.get('associated_id') == str(associated_id)
+
+
+@database_sync_to_async
+def get_trip(trip_id):
+    return Trip.objects.filter(route_plan_id=trip_id).values('driver_id', 'status').first()
+
+
+@database_sync_to_async
+def todays_trip_ids(student_id):
+    """IDs of the student's trips today that have not finished"""
+    return [
+        str(trip_id) for trip_id in
+        Trip.objects
+        .filter(trip_date=timezone.localdate(), student_list=student_id, status__in=['pending', 'active'])
+        .order_by('start_time')
+        .values_list('route_plan_id', flat=True)
+    ]
+
+
+@database_sync_to_async
+def record_location(driver_id, trip_id, point):
+    """
+    Update the driver's live position and, unless the ping is stale, the
+    trip's breadcrumbs, arrival estimates and geofences.
+
+    Returns:
+        Tuple of (whether the ping was accepted, seconds the app should wait
+        before its next point)
+    """
+    accepted = live.record(driver_id, point['longitude'], point['latitude'], point['timestamp'])
+    if accepted:
+        breadcrumbs.record(trip_id, point['longitude'], point['latitude'], point['timestamp'],
+                           point.get('speed'), point.get('heading'))
+        progress.track(trip_id, point['longitude'], point['latitude'], point['timestamp'])
+    interval = progress.next_ping_interval(trip_id, point['longitude'], point['latitude'], point.get('speed'))
+    return accepted, interval
+
+
+def parse_point(text_data):
+    """
+    Location message sent by a driver: {"longitude", "latitude"} plus
+    optional "speed" (m/s), "heading" (degrees) and "timestamp" (Unix time).
+
+    Raises:
+        ValueError: When the message is not a valid location
+    """
+    data = json.loads(text_data)
+    longitude = float(data['longitude'])
+    latitude = float(data['latitude'])
+    if not (-180 <= longitude <= 180 and -90 <= latitude <= 90):
+        raise ValueError("Coordinates out of range")
+
+    point = {'longitude': longitude, 'latitude': latitude}
+    for field in ('speed', 'heading'):
+        if data.get(field) is not None:
+            point[field] = float(data[field])
+    timestamp = data.get('timestamp')
+    point['timestamp'] = float(timestamp) if isinstance(timestamp, (int, float)) else time.time()
+    return point
+
+
+class DriverLocationConsumer(AsyncWebsocketConsumer):
+    """Receives a driver's location stream for one trip and fans it out"""
+
+    async def connect(self):
+        self.trip_id = str(self.scope['url_route']['kwargs']['trip_id'])
+        trip = await get_trip(self.trip_id)
+        if trip is None or trip['status'] in ('completed', 'cancelled'):
+            await self.close()
+            return
+        if not is_allowed(self.scope, 'driver', trip['driver_id']):
+            await self.close()
+            return
+
+        self.driver_id = trip['driver_id']
+        self.ping_interval = None
+        await self.accept()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            point = parse_point(text_data)
+        except (TypeError, KeyError, ValueError):
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Invalid location'}))
+            return
+
+        # The live store and the breadcrumbs batch their database writes
+        accepted, interval = await record_location(self.driver_id, self.trip_id, point)
+        # Duplicate and out of order pings would move the bus backwards for guardians
+        if accepted:
+            hub.publish(self.trip_id, {'type': 'location', 'trip_id': self.trip_id, **point})
+        # The app keeps its interval until told otherwise
+        if interval != self.ping_interval:
+            self.ping_interval = interval
+            await self.send(text_data=json.dumps({'type': 'interval', 'next_ping_interval': interval}))
+
+
+class ParentSubscribeConsumer(AsyncWebsocketConsumer):
+    """Streams the location of a student's bus to a guardian"""
+
+    async def connect(self):
+        self.subscriptions = []
+        student_id = self.scope['url_route']['kwargs']['student_id']
+        if not is_allowed(self.scope, 'guardian', student_id):
+            await self.close()
+            return
+
+        await self.accept()
+        trip_ids = await todays_trip_ids(student_id)
+        if not trip_ids:
+            await self.send(text_data=json.dumps({'type': 'no_trip'}))
+            await self.close(code=CLOSE_INVALID)
+            return
+        for trip_id in trip_ids:
+            self.subscriptions.append((trip_id, hub.subscribe(trip_id, self.send_message)))
+
+    async def send_message(self, message):
+        await self.send(text_data=message)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Subscribers only listen
+        pass
+
+    async def disconnect(self, code):
+        for trip_id, subscription in self.subscriptions:
+            hub.unsubscribe(trip_id, subscription)
+        self.subscriptions = []
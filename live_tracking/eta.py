@@ -0,0 +1,183 @@
+"""
+Live per-stop arrival estimates.
+
+Each accepted ping of a bus on a trip is projected onto the trip's route
+(the polyline through the stops in route_order) and the remaining time to
+every stop ahead is taken from the planned schedule, scaled by the pace the
+bus has kept so far. The planned schedule is the per-stop eta_offset stored
+by the optimizer; routes without it (patched by the incremental planner)
+spread the planned duration over the stops by distance.
+
+A bus only moves forward along its route, so a ping is searched for near
+the segment of the previous one, which keeps the work per ping
+proportional to the stops still ahead. The latest estimate of every trip
+is cached for readers (see get()) and also carries the tracking state, so
+pings of one trip may land on different processes.
+"""
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+from core.geo import haversine_km, locate_on_polyline
+from routeplan.models import Trip
+
+# Estimates stay readable this long after the last ping
+CACHE_TIMEOUT = 60 * 10
+
+# Seconds a process reuses a trip's route before reading it again
+ROUTE_TIMEOUT = 60
+
+# Segments after the previous one searched for the next ping
+SEARCH_AHEAD = 3
+
+# A ping farther than this from the searched segments is located on the whole rest of the route
+OFF_ROUTE_KM = 0.3
+
+# Planned speed when a route has neither stop offsets nor an estimated duration
+DEFAULT_SPEED_KMH = 25.0
+
+# Planned seconds a bus must advance from its first ping to count as having set off;
+# smaller moves are GPS noise around a standing bus
+MIN_PROGRESS_SECONDS = 30
+
+# Planned seconds that must have passed before the observed pace is trusted
+MIN_PACE_SECONDS = 120
+
+# Observed pace is kept within these bounds and smoothed with this weight for the newest value
+PACE_BOUNDS = (0.5, 3.0)
+PACE_SMOOTHING = 0.3
+
+# Routes kept by a process before those not reloaded recently are dropped
+MAX_ROUTES = 2000
+
+# Routes loaded by this process: trip ID -> (loaded at, Route or None)
+_routes = {}
+
+
+class Route:
+    """Stops of a trip with their planned offsets from departure"""
+
+    def __init__(self, stops, estimated_duration=None):
+        self.stops = stops
+        self.coords = np.array([stop['coordinates'] for stop in stops], dtype=float)
+        legs = haversine_km(self.coords[:-1, 0], self.coords[:-1, 1], self.coords[1:, 0], self.coords[1:, 1])
+        offsets = [stop.get('eta_offset') for stop in stops]
+        if all(offset is not None for offset in offsets):
+            self.planned = np.array(offsets, dtype=float)
+        else:
+            distance = np.concatenate(([0.0], np.cumsum(legs)))
+            if estimated_duration and distance[-1] > 0:
+                self.planned = distance / distance[-1] * estimated_duration
+            else:
+                self.planned = distance / DEFAULT_SPEED_KMH * 3600
+
+    def locate(self, position, segment):
+        """
+        Position along the route, searching from a segment onwards.
+
+        Returns:
+            Tuple of (segment, planned seconds from departure at the position)
+        """
+        segment, fraction, distance = locate_on_polyline(self.coords, position, segment, segment + SEARCH_AHEAD)
+        if distance > OFF_ROUTE_KM:
+            segment, fraction, _ = locate_on_polyline(self.coords, position, segment)
+        planned = self.planned[segment] + fraction * (self.planned[segment + 1] - self.planned[segment])
+        return segment, float(planned)
+
+
+def load_route(trip_id):
+    """Route of a trip, read at most every ROUTE_TIMEOUT seconds; None when it has under two stops"""
+    now = time.monotonic()
+    loaded = _routes.get(trip_id)
+    if loaded is not None and now - loaded[0] < ROUTE_TIMEOUT:
+        return loaded[1]
+
+    if len(_routes) >= MAX_ROUTES:
+        for stale in [key for key, (at, _) in _routes.items() if now - at >= ROUTE_TIMEOUT]:
+            del _routes[stale]
+
+    route_order = Trip.objects.filter(route_plan_id=trip_id).values_list('route_order', flat=True).first()
+    stops = (route_order or {}).get('stops') or []
+    route = Route(stops, route_order.get('estimated_duration')) if len(stops) >= 2 else None
+    _routes[trip_id] = (now, route)
+    return route
+
+
+def _key(trip_id):
+    return f'live:eta:{trip_id}'
+
+
+def get(trip_id):
+    """
+    Latest arrival estimates of a trip.
+
+    Returns:
+        dict with 'updated_at' (Unix time of the ping), 'pace' (actual over
+        planned time, 1.0 = on schedule) and 'stops': the stops ahead, each
+        with 'index', 'type', 'student_id' (student stops) and 'eta_seconds'
+        from 'updated_at'; None when the bus has not reported recently
+    """
+    return cache.get(_key(trip_id))
+
+
+def update(trip_id, longitude, latitude, timestamp):
+    """
+    Recompute a trip's estimates from a new position of its bus.
+
+    Args:
+        trip_id: Trip the bus is driving
+        longitude (float): Longitude of the bus
+        latitude (float): Latitude of the bus
+        timestamp (float): Unix time of the position
+
+    Returns:
+        The new estimates (see get()), or None when the trip has no route
+    """
+    route = load_route(str(trip_id))
+    if route is None:
+        return None
+
+    previous = cache.get(_key(trip_id))
+    if previous is not None and timestamp <= previous['updated_at']:
+        return previous
+
+    segment, planned = route.locate([longitude, latitude], previous['segment'] if previous else 0)
+    if previous is None:
+        started_at, started_planned, pace = None, planned, 1.0
+    else:
+        started_at, started_planned, pace = previous['started_at'], previous['started_planned'], previous['pace']
+
+    if started_at is None:
+        # Time spent waiting before the bus sets off says nothing about its pace,
+        # so the pace is measured from the first ping that moved along the route
+        if planned - started_planned >= MIN_PROGRESS_SECONDS:
+            started_at, started_planned = timestamp, planned
+    else:
+        planned_elapsed = planned - started_planned
+        if planned_elapsed >= MIN_PACE_SECONDS:
+            observed = min(max((timestamp - started_at) / planned_elapsed, PACE_BOUNDS[0]), PACE_BOUNDS[1])
+            pace += PACE_SMOOTHING * (observed - pace)
+
+    ahead = []
+    for index in range(segment + 1, len(route.stops)):
+        stop = route.stops[index]
+        ahead.append({
+            'index': index,
+            'type': stop['type'],
+            'student_id': stop.get('student_id'),
+            'eta_seconds': round((route.planned[index] - planned) * pace),
+        })
+
+    estimates = {
+        'updated_at': timestamp,
+        'pace': round(pace, 3),
+        'stops': ahead,
+        # Tracking state for the next ping
+        'segment': segment,
+        # None until the bus sets off; started_planned is then where it was first seen
+        'started_at': started_at,
+        'started_planned': started_planned,
+    }
+    cache.set(_key(trip_id), estimates, CACHE_TIMEOUT)
+    return estimates
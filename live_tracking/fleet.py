@@ -0,0 +1,136 @@
+"""
+Fleet snapshot for the admin live map.
+
+The positions of every bus that reported recently are read from the live
+position cache (drivers.live) with one multi-get and encoded as compact
+GeoJSON features. The snapshot is rebuilt at most every SNAPSHOT_SECONDS
+per process and shared by all admins polling the map; a poll with a
+cursor only gets the buses that reported after it, by the time the server
+took their ping, and the IDs of the buses that left the map since.
+
+A bus leaves the map STALE_SECONDS after its last ping, while its position
+is still in the cache, so when it left can be told from the position
+alone and any process can answer a cursor handed out by another.
+"""
+import json
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from core import singleflight
+from drivers import live
+from drivers.models import Driver
+
+# Seconds a snapshot is served before it is rebuilt
+SNAPSHOT_SECONDS = 2.0
+
+# Seconds the list of drivers (names, buses) is cached
+ROSTER_TIMEOUT = 60
+
+# Coordinates are rounded to about 10 cm
+PRECISION = 6
+
+# Buses that have not reported for this long leave the map; must be shorter
+# than the live position cache so the time they left can still be told
+STALE_SECONDS = live.CACHE_TIMEOUT / 2
+
+# Cursors are set back this far so that pings written while a snapshot was
+# read, or taken by a server whose clock is slightly behind, are not skipped
+CURSOR_OVERLAP = 2.0
+
+# A bus in a snapshot; `feature` is its encoded GeoJSON feature and
+# `received` the Unix time the server took its last ping
+Bus = namedtuple('Bus', ['received', 'timestamp', 'driver_id', 'bus_no', 'name', 'status',
+                         'longitude', 'latitude', 'feature'])
+
+# Buses on the map, oldest ping first, and (Unix time left, driver ID) of
+# those that left it within the last CACHE_TIMEOUT - STALE_SECONDS
+Snapshot = namedtuple('Snapshot', ['built_at', 'buses', 'gone'])
+
+
+def roster():
+    """Drivers as (driver ID, bus number, name, status, is active), cached briefly"""
+    return cache.get_or_set(
+        'live:fleet:roster',
+        lambda: [
+            (str(driver_id), bus_no, name, status, is_active)
+            for driver_id, bus_no, name, status, is_active in
+            Driver.objects.values_list('driver_id', 'bus_no', 'name', 'status', 'is_active')
+        ],
+        ROSTER_TIMEOUT,
+    )
+
+
+def _build():
+    """
+    Returns:
+        Snapshot of every active driver with a recent live position
+    """
+    built_at = time.time()
+    drivers = roster()
+    positions = live.positions(driver_id for driver_id, *_ in drivers)
+    features = []
+    gone = []
+    for driver_id, bus_no, name, status, is_active in drivers:
+        position = positions.get(driver_id)
+        if position is None:
+            continue
+        # Positions cached before the receive time was recorded
+        received = position.get('received', position['timestamp'])
+        if not is_active:
+            # When a driver was deactivated is unknown; report it with every poll
+            gone.append((built_at, driver_id))
+            continue
+        if received <= built_at - STALE_SECONDS:
+            gone.append((received + STALE_SECONDS, driver_id))
+            continue
+        feature = {
+            'type': 'Feature',
+            'id': driver_id,
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [round(position['longitude'], PRECISION), round(position['latitude'], PRECISION)],
+            },
+            'properties': {'bus': bus_no, 'name': name, 'status': status, 't': round(position['timestamp'], 1)},
+        }
+        features.append(Bus(received, position['timestamp'], driver_id, bus_no, name, status,
+                            position['longitude'], position['latitude'],
+                            json.dumps(feature, separators=(',', ':'))))
+    features.sort(key=lambda bus: bus.received)
+    gone.sort()
+    return Snapshot(built_at, features, gone)
+
+
+def snapshot():
+    """Buses with a live position (see _build()), at most SNAPSHOT_SECONDS old"""
+    return singleflight.do('fleet', None, _build, window=SNAPSHOT_SECONDS)
+
+
+def geojson(since=None):
+    """
+    The fleet as a GeoJSON FeatureCollection.
+
+    Args:
+        since (float): Cursor of an earlier response; only buses that
+            reported after it and the IDs of buses that left the map since
+            are included
+
+    Returns:
+        Encoded FeatureCollection with a 'cursor' member to pass as the
+        next `since`, a 'removed' list of driver IDs and a 'full' flag set
+        when every bus on the map is included; buses missing from a full
+        response are no longer on the map
+    """
+    fleet = snapshot()
+    cursor = round(fleet.built_at - CURSOR_OVERLAP, 3)
+    # Buses that left before the oldest departure still known may be missed
+    full = since is None or since < fleet.built_at - (live.CACHE_TIMEOUT - STALE_SECONDS)
+    if full:
+        features, removed = fleet.buses, []
+    else:
+        features = [bus for bus in fleet.buses if bus.received > since]
+        removed = [driver_id for left_at, driver_id in fleet.gone if left_at > since]
+    body = ','.join(bus.feature for bus in features)
+    return (f'{{"type":"FeatureCollection","cursor":{json.dumps(cursor)},"full":{json.dumps(full)},'
+            f'"removed":{json.dumps(removed)},"features":[{body}]}}')
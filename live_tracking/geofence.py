@@ -0,0 +1,144 @@
+"""
+Geofence alerts for student stops.
+
+For every trip a process tracks, the student stops of its route are put
+in a grid whose cells are as wide as the approach radius, so the stops
+near a position are found by looking at the 3x3 cells around it. Only the
+stop the bus last passed and the next LOOKAHEAD stops are considered;
+together this is a constant amount of work per ping, without a query.
+
+Each stop goes through approaching -> arrived -> departed. Every
+transition notifies the student's guardians once: the event's dedupe key
+makes a repeated report (another process, a replayed upload) a no-op.
+"""
+import math
+import time
+from collections import defaultdict
+
+from core.geo import KM_PER_DEGREE
+from core.notifications import notify_guardians
+
+APPROACH_KM = 0.5
+ARRIVE_KM = 0.05
+# Leaving takes a little more distance than arriving, so GPS jitter at the stop does not flap
+DEPART_KM = 0.1
+
+# Stops after the bus's current segment that are checked
+LOOKAHEAD = 3
+
+# Trips not seen for this many seconds are forgotten once MAX_TRIPS are tracked
+STATE_TIMEOUT = 60 * 60
+MAX_TRIPS = 2000
+
+# Trip ID -> TripFences
+_trips = {}
+
+
+class StopGrid:
+    """Student stops of a route bucketed by grid cell"""
+
+    def __init__(self, route):
+        self.route = route
+        self.lon_km = KM_PER_DEGREE * math.cos(math.radians(route.coords[0, 1]))
+        self.cells = defaultdict(list)
+        for index, stop in enumerate(route.stops):
+            if stop['type'] == 'student' and stop.get('student_id'):
+                self.cells[self._cell(*stop['coordinates'])].append(index)
+
+    def _cell(self, longitude, latitude):
+        return (math.floor(longitude * self.lon_km / APPROACH_KM),
+                math.floor(latitude * KM_PER_DEGREE / APPROACH_KM))
+
+    def nearby(self, longitude, latitude, first, last):
+        """
+        Student stops with index in [first, last] near a position.
+
+        Yields:
+            Tuple of (stop index, distance in km)
+        """
+        cx, cy = self._cell(longitude, latitude)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for index in self.cells.get((cx + dx, cy + dy), ()):
+                    if first <= index <= last:
+                        stop_lon, stop_lat = self.route.stops[index]['coordinates']
+                        distance = math.hypot((longitude - stop_lon) * self.lon_km,
+                                              (latitude - stop_lat) * KM_PER_DEGREE)
+                        yield index, distance
+
+
+class TripFences:
+    """Geofence state of one trip: the stop grid and the last event of each student's stop"""
+
+    def __init__(self, route):
+        self.grid = StopGrid(route)
+        self.states = {}
+        self.seen = time.monotonic()
+
+
+def _fences(trip_id, route):
+    fences = _trips.get(trip_id)
+    if fences is None:
+        if len(_trips) >= MAX_TRIPS:
+            expired = time.monotonic() - STATE_TIMEOUT
+            for stale in [key for key, value in _trips.items() if value.seen < expired]:
+                del _trips[stale]
+        fences = _trips[trip_id] = TripFences(route)
+    elif fences.grid.route is not route:
+        # The route was reloaded; states are kept since they are keyed by student
+        fences.grid = StopGrid(route)
+    fences.seen = time.monotonic()
+    return fences
+
+
+def _transition(state, distance):
+    """Event a stop goes through at a distance from the bus, or None"""
+    if state in (None, 'approaching') and distance <= ARRIVE_KM:
+        return 'arrived'
+    if state is None and distance <= APPROACH_KM:
+        return 'approaching'
+    if state == 'arrived' and distance > DEPART_KM:
+        return 'departed'
+    return None
+
+
+def check(trip_id, route, longitude, latitude, estimates):
+    """
+    Raise the geofence events of a new position of a trip's bus.
+
+    Args:
+        trip_id: Trip the bus is driving
+        route: The trip's eta.Route
+        longitude (float): Longitude of the bus
+        latitude (float): Latitude of the bus
+        estimates (dict): Arrival estimates for the position (see eta.get())
+
+    Returns:
+        List of (student_id, event) raised by this position
+    """
+    trip_id = str(trip_id)
+    fences = _fences(trip_id, route)
+    segment = estimates['segment']
+    eta_seconds = {stop['index']: stop['eta_seconds'] for stop in estimates['stops'][:LOOKAHEAD]}
+
+    events = []
+    for index, distance in fences.grid.nearby(longitude, latitude, segment, segment + LOOKAHEAD):
+        student_id = route.stops[index]['student_id']
+        event = _transition(fences.states.get(student_id), distance)
+        if event is None:
+            continue
+        fences.states[student_id] = event
+        events.append((student_id, event))
+
+        data = {'trip_id': trip_id, 'student_id': student_id, 'event': event}
+        if event == 'approaching':
+            minutes = max(round(eta_seconds.get(index, 0) / 60), 1)
+            message = f"The bus is about {minutes} min away"
+            data['eta_seconds'] = eta_seconds.get(index)
+        elif event == 'arrived':
+            message = "The bus has arrived at the stop"
+        else:
+            message = "The bus has left the stop"
+        notify_guardians([student_id], f'bus_{event}', message, data,
+                         dedupe_key=f'{trip_id}:{event}')
+    return events
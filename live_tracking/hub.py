@@ -0,0 +1,166 @@
+"""
+In-process fan-out of live bus locations.
+
+Every ASGI process keeps one LocationHub. Drivers publish points for their
+trip and the hub hands each point to every subscriber of that trip. The
+point is encoded once and each subscriber gets its own bounded queue, so a
+slow parent connection drops its oldest points instead of holding up the
+driver or the other subscribers.
+
+With settings.LIVE_TRACKING_BROKER = 'postgres' points are also relayed to
+the hubs of the other processes (see live_tracking.broker).
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# Points buffered per subscriber before the oldest is dropped
+SUBSCRIBER_QUEUE_SIZE = 16
+
+# Last known points older than this are not replayed to new subscribers
+LAST_POINT_TTL = 15 * 60
+
+# Publishes between sweeps of expired last known points
+SWEEP_INTERVAL = 1000
+
+
+class Subscription:
+    """A subscriber's outgoing queue, drained by its own task"""
+
+    def __init__(self, send, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+        self.task = asyncio.get_running_loop().create_task(self._pump(send))
+
+    def offer(self, message):
+        """Queue a message without waiting, dropping the oldest one when full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def _pump(self, send):
+        while True:
+            await send(await self.queue.get())
+
+    def close(self):
+        self.task.cancel()
+
+
+class LocationHub:
+    """Subscribers and last known point of every trip in this process"""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        # trip_id -> (encoded message, time it was published)
+        self.last = {}
+        self.published = 0
+        self.delivered = 0
+        self.broker = None
+        # Event loop the subscriptions run on, known once there is one
+        self.loop = None
+
+    def get_broker(self):
+        """Broker to the other processes, started on first use; None when disabled"""
+        if self.broker is None and settings.LIVE_TRACKING_BROKER == 'postgres':
+            from .broker import PostgresBroker
+            self.broker = PostgresBroker(self.deliver)
+        return self.broker
+
+    def subscribe(self, trip_id, send):
+        """
+        Start delivering a trip's points.
+
+        Args:
+            trip_id (str): Trip to follow
+            send: Coroutine function called with each encoded message
+
+        Returns:
+            Subscription to pass to unsubscribe()
+        """
+        subscription = Subscription(send)
+        self.loop = asyncio.get_running_loop()
+        if trip_id not in self.subscriptions and self.get_broker():
+            self.broker.listen(trip_id)
+        self.subscriptions[trip_id].add(subscription)
+        last = self.last.get(trip_id)
+        if last and time.monotonic() - last[1] < LAST_POINT_TTL:
+            subscription.offer(last[0])
+        return subscription
+
+    def unsubscribe(self, trip_id, subscription):
+        subscription.close()
+        subscribers = self.subscriptions.get(trip_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[trip_id]
+                if self.broker:
+                    self.broker.unlisten(trip_id)
+
+    def publish(self, trip_id, point):
+        """
+        Hand a point to every subscriber of a trip, in this process and,
+        through the broker, in all others.
+
+        Args:
+            trip_id (str): Trip the point belongs to
+            point (dict): Location message; encoded once for all subscribers
+
+        Returns:
+            Number of local subscribers the point was queued for
+        """
+        message = json.dumps(point)
+        self.published += 1
+        if self.published % SWEEP_INTERVAL == 0:
+            self._sweep()
+        if self.get_broker():
+            self.broker.publish(trip_id, message)
+        return self.deliver(trip_id, message)
+
+    def publish_sync(self, trip_id, point):
+        """
+        Publish a point from synchronous code, e.g. the REST location
+        endpoints. With the broker the point is sent with pg_notify on the
+        caller's database connection and reaches every process, this one
+        included; without it, it is handed to this process's event loop.
+
+        Args:
+            trip_id (str): Trip the point belongs to
+            point (dict): Location message
+        """
+        if settings.LIVE_TRACKING_BROKER == 'postgres':
+            from .broker import notify
+            notify(trip_id, json.dumps(point))
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish, trip_id, point)
+
+    def deliver(self, trip_id, message):
+        """Queue an encoded message for the local subscribers of a trip"""
+        self.last[trip_id] = (message, time.monotonic())
+        subscribers = self.subscriptions.get(trip_id, ())
+        for subscription in subscribers:
+            subscription.offer(message)
+        self.delivered += len(subscribers)
+        return len(subscribers)
+
+    def _sweep(self):
+        """Forget last known points of trips that stopped publishing"""
+        expired = time.monotonic() - LAST_POINT_TTL
+        for trip_id in [trip_id for trip_id, (_, at) in self.last.items() if at < expired]:
+            del self.last[trip_id]
+
+    def stats(self):
+        return {
+            'trips': len(self.subscriptions),
+            'subscribers': sum(len(s) for s in self.subscriptions.values()),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': sum(s.dropped for subs in self.subscriptions.values() for s in subs),
+        }
+
+
+hub = LocationHub()
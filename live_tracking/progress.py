@@ -0,0 +1,152 @@
+"""
+Progress of buses along their trips.
+
+track() feeds an accepted position of a bus to the arrival estimates
+(live_tracking.eta) and the stop geofences (live_tracking.geofence).
+
+next_ping_interval() adapts how often driver apps report: every location
+ingest response tells the app when to send the next point.
+A bus about to reach a stop pings often; one that is far from its next stop,
+parked, or not on a trip pings rarely. When this process takes in more
+pings than LIVE_INGEST_CAPACITY per second, every interval is stretched by
+the overload factor until the rate is back under capacity.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.geo import haversine_km, locate_on_polyline
+from routeplan.models import Trip
+from . import eta, geofence
+
+# Interval bounds in seconds
+MIN_INTERVAL = 2
+MAX_INTERVAL = 15
+# Parked buses and drivers without a running trip
+IDLE_INTERVAL = 60
+# Never back off further than this under load
+MAX_LOADED_INTERVAL = 60
+
+# Within this distance of the next stop the bus pings at MIN_INTERVAL
+NEAR_STOP_KM = 0.3
+
+# Below this speed (m/s) a bus counts as parked
+PARKED_SPEED = 0.5
+
+# Assumed speed (m/s) when the device does not report one
+DEFAULT_SPEED = 8.0
+
+# Aim for this many points between the bus and its next stop
+POINTS_PER_LEG = 4
+
+# Seconds a trip's stops and status are cached
+ROUTE_TIMEOUT = 60
+
+# Seconds per window of the ingest rate meter
+LOAD_WINDOW = 5
+
+_meter_lock = threading.Lock()
+_window = 0
+_count = 0
+_previous = 0
+
+
+def track(trip_id, longitude, latitude, timestamp):
+    """
+    Update a trip's arrival estimates and raise its geofence events for a
+    new position of its bus.
+
+    Returns:
+        The trip's estimates (see eta.get()), or None when it has no route
+    """
+    estimates = eta.update(trip_id, longitude, latitude, timestamp)
+    if estimates is not None and estimates['updated_at'] == timestamp:
+        geofence.check(trip_id, eta.load_route(str(trip_id)), longitude, latitude, estimates)
+    return estimates
+
+
+def observe_ping():
+    """Count a ping towards this process's ingest rate"""
+    global _window, _count, _previous
+    window = int(time.monotonic() // LOAD_WINDOW)
+    with _meter_lock:
+        if window != _window:
+            _previous = _count if window == _window + 1 else 0
+            _window, _count = window, 0
+        _count += 1
+
+
+def load_factor():
+    """How far this process's ingest rate is over capacity (1.0 when it is not)"""
+    rate = max(_count, _previous) / LOAD_WINDOW
+    return max(1.0, rate / settings.LIVE_INGEST_CAPACITY)
+
+
+def trip_route(trip_id):
+    """
+    Status and stop coordinates of a trip, cached briefly.
+
+    Returns:
+        dict with 'status' and 'stops' (list of [lon, lat], empty when the trip
+        has not been optimized), or None for an unknown trip
+    """
+    key = f'live:route:{trip_id}'
+    route = cache.get(key)
+    if route is None:
+        trip = Trip.objects.filter(route_plan_id=trip_id).values('status', 'route_order').first()
+        if trip is None:
+            return None
+        stops = (trip['route_order'] or {}).get('stops') or []
+        route = {'status': trip['status'], 'stops': [stop['coordinates'] for stop in stops]}
+        cache.set(key, route, ROUTE_TIMEOUT)
+    return route
+
+
+def distance_to_next_stop(stops, longitude, latitude):
+    """
+    Distance in km from a position to the next stop along a route.
+
+    Returns:
+        Distance, or None when the route has fewer than two stops
+    """
+    if len(stops) < 2:
+        return None
+    segment, _, _ = locate_on_polyline(stops, [longitude, latitude])
+    next_lon, next_lat = stops[segment + 1]
+    return float(haversine_km(longitude, latitude, next_lon, next_lat))
+
+
+def next_ping_interval(trip_id, longitude, latitude, speed=None):
+    """
+    Seconds the driver app should wait before sending the next point.
+
+    Args:
+        trip_id: Trip the bus is driving, or None
+        longitude (float): Current longitude
+        latitude (float): Current latitude
+        speed (float): Current speed in m/s, if the device reported it
+
+    Returns:
+        Interval in whole seconds
+    """
+    observe_ping()
+    route = trip_route(trip_id) if trip_id else None
+
+    if route is None or route['status'] not in ('pending', 'active'):
+        interval = IDLE_INTERVAL
+    elif speed is not None and speed < PARKED_SPEED:
+        interval = MAX_INTERVAL
+    else:
+        distance = distance_to_next_stop(route['stops'], longitude, latitude)
+        if distance is None:
+            interval = MAX_INTERVAL
+        elif distance <= NEAR_STOP_KM:
+            interval = MIN_INTERVAL
+        else:
+            seconds_to_stop = distance * 1000 / max(speed or DEFAULT_SPEED, PARKED_SPEED)
+            interval = min(max(seconds_to_stop / POINTS_PER_LEG, MIN_INTERVAL), MAX_INTERVAL)
+
+    interval = min(interval * load_factor(), max(interval, MAX_LOADED_INTERVAL))
+    return round(interval)
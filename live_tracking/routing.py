@@ -0,0 +1,7 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/driver-location/<uuid:trip_id>/', consumers.DriverLocationConsumer.as_asgi()),
+    path('ws/parent-subscribe/<uuid:student_id>/', consumers.ParentSubscribeConsumer.as_asgi()),
+]
@@ -0,0 +1,222 @@
+"""
+Nearest-bus lookups on live positions.
+
+GridIndex buckets points into square cells of CELL_KM and answers
+k-nearest queries by scanning rings of cells outwards from the query until
+no unscanned cell can hold a closer point. Moving a point is a couple of
+dict operations, so the index follows every ping without rebuilding.
+
+The process-wide index is fed from the fleet snapshot (live_tracking.fleet):
+at most every SNAPSHOT_SECONDS the buses that reported since the last
+refresh are moved and those that left the map are dropped.
+"""
+import heapq
+import math
+import threading
+
+from django.conf import settings
+
+from core import singleflight
+from core.geo import EARTH_RADIUS_KM, KM_PER_DEGREE
+from . import fleet
+
+# Edge of a grid cell
+CELL_KM = 1.0
+
+
+def distance_km(lon1, lat1, lon2, lat2):
+    """Haversine distance for scalars; core.geo.haversine_km is for arrays"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class GridIndex:
+    """
+    Points bucketed by grid cell.
+
+    Args:
+        origin_lat (float): Latitude the cells are square at; cells stay
+            close to square within a city around it
+        cell_km (float): Edge of a cell
+    """
+
+    def __init__(self, origin_lat, cell_km=CELL_KM):
+        self.cell_km = cell_km
+        self.lat_step = cell_km / KM_PER_DEGREE
+        self.lon_step = cell_km / (KM_PER_DEGREE * math.cos(math.radians(origin_lat)))
+        # cell -> {key: (lon, lat)}
+        self.cells = {}
+        # key -> cell
+        self.points = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def _cell(self, longitude, latitude):
+        return math.floor(longitude / self.lon_step), math.floor(latitude / self.lat_step)
+
+    def update(self, key, longitude, latitude):
+        """Add a point or move it to a new position"""
+        cell = self._cell(longitude, latitude)
+        with self.lock:
+            previous = self.points.get(key)
+            if previous is not None and previous != cell:
+                self._discard(key, previous)
+            self.points[key] = cell
+            self.cells.setdefault(cell, {})[key] = (longitude, latitude)
+
+    def remove(self, key):
+        with self.lock:
+            cell = self.points.pop(key, None)
+            if cell is not None:
+                self._discard(key, cell)
+
+    def _discard(self, key, cell):
+        bucket = self.cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.cells[cell]
+
+    def nearest(self, longitude, latitude, k=1, max_km=None, accept=None):
+        """
+        The k points closest to a position.
+
+        Args:
+            longitude (float): Longitude of the position
+            latitude (float): Latitude of the position
+            k (int): Number of points wanted
+            max_km (float): Ignore points farther than this
+            accept: Optional callable taking a key; points it rejects are skipped
+
+        Returns:
+            List of (distance in km, key), closest first
+        """
+        cx, cy = self._cell(longitude, latitude)
+        # Every point outside ring r is at least r cells away along one axis; measured on the
+        # haversine sphere and rounded down so a point just past the bound is not missed
+        ring_km = 0.99 * EARTH_RADIUS_KM * math.radians(
+            min(self.lat_step, self.lon_step * math.cos(math.radians(latitude))))
+        best = []  # max-heap of (-distance, key) holding the k closest so far
+
+        def consider(bucket):
+            for key, (lon, lat) in bucket.items():
+                if accept is not None and not accept(key):
+                    continue
+                distance = distance_km(longitude, latitude, lon, lat)
+                if max_km is not None and distance > max_km:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, key))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, key))
+
+        with self.lock:
+            ring = 0
+            scanned = 0
+            while scanned < len(self.points):
+                if 8 * ring > len(self.cells):
+                    # Fewer occupied cells than cells in the ring: visit those directly
+                    for (x, y), bucket in self.cells.items():
+                        if max(abs(x - cx), abs(y - cy)) >= ring:
+                            consider(bucket)
+                    break
+                for cell in self._ring(cx, cy, ring):
+                    bucket = self.cells.get(cell)
+                    if bucket:
+                        scanned += len(bucket)
+                        consider(bucket)
+                bound = ring * ring_km
+                if len(best) == k and -best[0][0] <= bound:
+                    break
+                if max_km is not None and bound > max_km:
+                    break
+                ring += 1
+
+        return sorted((-distance, key) for distance, key in best)
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        """Cells exactly `ring` cells away from (cx, cy)"""
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
+
+
+_index = GridIndex(settings.SCHOOL_COORDINATES[1])
+
+# Driver ID -> fleet.Bus last applied to the index
+_buses = {}
+_applied = None
+
+
+def _apply():
+    """Bring the index up to date with the fleet snapshot"""
+    global _applied
+    snapshot = fleet.snapshot()
+    if snapshot is _applied:
+        return
+    current = set()
+    for bus in snapshot.buses:
+        current.add(bus.driver_id)
+        known = _buses.get(bus.driver_id)
+        if known is None or known.timestamp != bus.timestamp:
+            _index.update(bus.driver_id, bus.longitude, bus.latitude)
+        _buses[bus.driver_id] = bus
+    for driver_id in [driver_id for driver_id in _buses if driver_id not in current]:
+        _index.remove(driver_id)
+        del _buses[driver_id]
+    _applied = snapshot
+
+
+def refresh():
+    singleflight.do('nearest', None, _apply, window=fleet.SNAPSHOT_SECONDS)
+
+
+def nearest_buses(longitude, latitude, k=5, status=None, max_km=None):
+    """
+    Buses with a live position closest to a point.
+
+    Args:
+        longitude (float): Longitude of the point
+        latitude (float): Latitude of the point
+        k (int): Number of buses wanted
+        status (str): Only drivers with this status, e.g. 'available'
+        max_km (float): Only buses within this distance
+
+    Returns:
+        List of dicts with driver_id, bus_no, name, status, longitude,
+        latitude, reported_at (Unix time) and distance_km, closest first
+    """
+    refresh()
+    buses = _buses
+    accept = None
+    if status is not None:
+        accept = lambda driver_id: driver_id in buses and buses[driver_id].status == status
+    results = []
+    for distance, driver_id in _index.nearest(longitude, latitude, k, max_km, accept):
+        bus = buses.get(driver_id)
+        if bus is None:
+            continue
+        results.append({
+            'driver_id': driver_id,
+            'bus_no': bus.bus_no,
+            'name': bus.name,
+            'status': bus.status,
+            'longitude': bus.longitude,
+            'latitude': bus.latitude,
+            'reported_at': bus.timestamp,
+            'distance_km': round(distance, 3),
+        })
+    return results
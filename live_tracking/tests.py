@@ -0,0 +1,401 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.asgi import application
+from . import broker, eta, fleet, geofence, progress, spatial, views
+from .auth import BrowserOriginValidator
+
+DRIVERS = [('a', 'B1', 'Ann', 'on_trip', True), ('b', 'B2', 'Bob', 'on_trip', True),
+           ('c', 'B3', 'Cy', 'on_trip', False)]
+
+
+class FleetTests(SimpleTestCase):
+    def setUp(self):
+        self.now = time.time()
+        self.positions = {}
+        for patcher in (
+            mock.patch.object(fleet, 'roster', lambda: DRIVERS),
+            mock.patch.object(fleet.live, 'positions', lambda driver_ids: dict(self.positions)),
+            # Rebuild on every poll rather than share a snapshot between tests
+            mock.patch.object(fleet, 'snapshot', fleet._build),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def ping(self, driver_id, received, timestamp=None):
+        self.positions[driver_id] = {'longitude': 80.2, 'latitude': 13.0,
+                                     'timestamp': received if timestamp is None else timestamp,
+                                     'received': received}
+
+    def poll(self, since=None):
+        return json.loads(fleet.geojson(since))
+
+    def test_first_poll_is_full(self):
+        self.ping('a', self.now - 1)
+        collection = self.poll()
+        self.assertTrue(collection['full'])
+        self.assertEqual([feature['id'] for feature in collection['features']], ['a'])
+
+    def test_cursor_follows_receive_time_not_device_time(self):
+        cursor = self.poll()['cursor']
+        # A device whose clock is an hour behind
+        self.ping('a', self.now + 1, timestamp=self.now - 3600)
+        collection = self.poll(cursor)
+        self.assertFalse(collection['full'])
+        self.assertEqual([feature['id'] for feature in collection['features']], ['a'])
+
+    def test_buses_that_did_not_report_are_not_resent(self):
+        self.ping('a', self.now - 30)
+        self.assertEqual(self.poll(self.now - 10)['features'], [])
+
+    def test_stale_buses_are_removed(self):
+        self.ping('a', self.now - fleet.STALE_SECONDS - 5)
+        self.ping('b', self.now - 1)
+        collection = self.poll(self.now - 10)
+        self.assertEqual(collection['removed'], ['a'])
+        self.assertEqual([feature['id'] for feature in collection['features']], ['b'])
+
+    def test_buses_removed_before_the_cursor_are_not_resent(self):
+        self.ping('a', self.now - fleet.STALE_SECONDS - 30)
+        self.assertEqual(self.poll(self.now - 10)['removed'], [])
+
+    def test_deactivated_drivers_are_removed(self):
+        self.ping('c', self.now - 1)
+        collection = self.poll(self.now - 10)
+        self.assertEqual(collection['removed'], ['c'])
+        self.assertEqual(collection['features'], [])
+
+    def test_old_cursor_gets_a_full_response(self):
+        self.ping('a', self.now - 1)
+        collection = self.poll(self.now - fleet.live.CACHE_TIMEOUT)
+        self.assertTrue(collection['full'])
+        self.assertEqual(len(collection['features']), 1)
+
+
+class TransitionTests(SimpleTestCase):
+    def test_stop_is_approached_then_reached_then_left(self):
+        state = None
+        events = []
+        for distance in (2.0, 0.4, 0.3, 0.04, 0.03, 0.08, 0.2, 0.5):
+            event = geofence._transition(state, distance)
+            if event is not None:
+                state = event
+                events.append(event)
+        self.assertEqual(events, ['approaching', 'arrived', 'departed'])
+
+    def test_arriving_without_approaching(self):
+        self.assertEqual(geofence._transition(None, geofence.ARRIVE_KM), 'arrived')
+
+    def test_nothing_happens_far_away(self):
+        self.assertIsNone(geofence._transition(None, geofence.APPROACH_KM + 0.01))
+
+    def test_jitter_at_the_stop_does_not_depart(self):
+        between = (geofence.ARRIVE_KM + geofence.DEPART_KM) / 2
+        self.assertIsNone(geofence._transition('arrived', between))
+
+    def test_departed_is_final(self):
+        for distance in (0.0, 0.3, 5.0):
+            self.assertIsNone(geofence._transition('departed', distance))
+
+
+class GridIndexTests(SimpleTestCase):
+    CENTER = (80.2, 13.0)
+
+    def setUp(self):
+        self.random = random.Random(0)
+        self.index = spatial.GridIndex(self.CENTER[1])
+        self.points = {}
+
+    def spread(self, radius_km):
+        degrees = radius_km / spatial.KM_PER_DEGREE
+        return (self.CENTER[0] + self.random.uniform(-degrees, degrees),
+                self.CENTER[1] + self.random.uniform(-degrees, degrees))
+
+    def add(self, count, radius_km):
+        for key in range(len(self.points), len(self.points) + count):
+            self.points[key] = self.spread(radius_km)
+            self.index.update(key, *self.points[key])
+
+    def brute_force(self, longitude, latitude, k, max_km=None, accept=None):
+        found = sorted(
+            (spatial.distance_km(longitude, latitude, *position), key)
+            for key, position in self.points.items()
+            if accept is None or accept(key)
+        )
+        if max_km is not None:
+            found = [(distance, key) for distance, key in found if distance <= max_km]
+        return found[:k]
+
+    def assertMatches(self, queries, radius_km, k, **options):
+        for _ in range(queries):
+            longitude, latitude = self.spread(radius_km)
+            self.assertEqual(self.index.nearest(longitude, latitude, k, **options),
+                             self.brute_force(longitude, latitude, k, **options))
+
+    def test_dense_fleet(self):
+        self.add(500, 10)
+        self.assertMatches(200, 10, 5)
+
+    def test_sparse_fleet_and_distant_queries(self):
+        self.add(20, 40)
+        self.assertMatches(100, 80, 3)
+
+    def test_more_wanted_than_there_are(self):
+        self.add(4, 5)
+        self.assertMatches(10, 5, 10)
+
+    def test_max_km(self):
+        self.add(300, 10)
+        self.assertMatches(100, 10, 5, max_km=2.0)
+
+    def test_accept(self):
+        self.add(300, 10)
+        self.assertMatches(100, 10, 5, accept=lambda key: key % 3 == 0)
+
+    def test_moved_and_removed_points(self):
+        self.add(300, 10)
+        for key in range(0, 300, 2):
+            self.points[key] = self.spread(10)
+            self.index.update(key, *self.points[key])
+        for key in range(1, 300, 5):
+            del self.points[key]
+            self.index.remove(key)
+        self.assertEqual(len(self.index), len(self.points))
+        self.assertMatches(100, 10, 5)
+
+    def test_empty_index(self):
+        self.assertEqual(self.index.nearest(*self.CENTER), [])
+
+
+class OriginTests(SimpleTestCase):
+    def setUp(self):
+        async def inner(scope, receive, send):
+            self.reached = True
+            await send({'type': 'websocket.accept'})
+
+        self.reached = False
+        self.validator = BrowserOriginValidator(inner, ['edurider.example'])
+
+    def connect(self, headers):
+        async def run():
+            communicator = WebsocketCommunicator(self.validator, '/ws/', headers=headers)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        return async_to_sync(run)()
+
+    def test_clients_without_origin_are_let_through(self):
+        self.assertTrue(self.connect([]))
+        self.assertTrue(self.reached)
+
+    def test_browsers_must_come_from_an_allowed_host(self):
+        self.assertTrue(self.connect([(b'origin', b'https://edurider.example')]))
+        self.assertFalse(self.connect([(b'origin', b'https://elsewhere.example')]))
+
+
+class ConsumerOriginTests(TransactionTestCase):
+    STUDENT_ID = '00000000-0000-0000-0000-000000000001'
+
+    def setUp(self):
+        admin = User.objects.create(username='admin@edurider.example', is_staff=True)
+        self.token = str(AccessToken.for_user(admin))
+
+    def subscribe(self, token, headers=()):
+        async def run():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/parent-subscribe/{self.STUDENT_ID}/?token={token}', headers=list(headers)
+            )
+            connected, _ = await communicator.connect()
+            message = json.loads(await communicator.receive_from()) if connected else None
+            await communicator.disconnect()
+            return connected, message
+
+        return async_to_sync(run)()
+
+    def test_app_without_origin_connects_with_a_token(self):
+        self.assertEqual(self.subscribe(self.token), (True, {'type': 'no_trip'}))
+
+    def test_app_without_origin_still_needs_a_token(self):
+        self.assertEqual(self.subscribe(''), (False, None))
+
+    def test_other_sites_are_refused(self):
+        self.assertEqual(self.subscribe(self.token, [(b'origin', b'https://elsewhere.example')]), (False, None))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'eta-tests'}})
+class EtaTests(SimpleTestCase):
+    # Four stops 0.01 degrees (about 1.1 km) apart, two minutes each
+    STOPS = [{'type': 'student', 'student_id': str(i), 'coordinates': [76.33 + i / 100, 10.05],
+              'eta_offset': 120 * i} for i in range(4)]
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(eta, 'load_route', lambda trip_id: eta.Route(self.STOPS))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = 1_700_000_000.0
+
+    def drive(self, slowdown=1.0, every=30):
+        """Ping along the route from the first stop to the last, `slowdown` times slower than planned"""
+        for planned in range(0, 360 + 1, every):
+            estimates = eta.update('t', 76.33 + planned / 120 / 100, 10.05, self.now + planned * slowdown)
+        return estimates
+
+    def test_waiting_before_departure_does_not_slow_the_pace(self):
+        for _ in range(10):
+            estimates = eta.update('t', 76.33, 10.05, self.now)
+            self.now += 60
+        self.assertIsNone(estimates['started_at'])
+        self.assertEqual(estimates['pace'], 1.0)
+        self.assertAlmostEqual(self.drive()['pace'], 1.0, places=2)
+
+    def test_stops_ahead_follow_the_schedule(self):
+        estimates = eta.update('t', 76.345, 10.05, self.now)
+        self.assertEqual([(stop['index'], stop['eta_seconds']) for stop in estimates['stops']],
+                         [(2, 60), (3, 180)])
+
+    def test_slow_bus_is_estimated_late(self):
+        estimates = self.drive(slowdown=2, every=60)
+        self.assertGreater(estimates['pace'], 1.5)
+        # Measured from the second ping, the first that moved
+        self.assertEqual(estimates['started_at'], self.now + 120)
+
+
+class MyBusParamsTests(SimpleTestCase):
+    def get(self, **query):
+        request = APIRequestFactory().get('/api/live/my-bus/', query)
+        force_authenticate(request, user=User(username='admin', is_staff=True))
+        return views.MyBusView.as_view()(request)
+
+    def test_admins_must_name_the_student(self):
+        self.assertEqual(self.get().status_code, 400)
+
+    def test_student_id_must_be_a_uuid(self):
+        response = self.get(student_id='not-a-uuid')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('student_id', response.data)
+
+
+class PingIntervalTests(SimpleTestCase):
+    # Stops along a parallel, 0.01 degrees (about 1.1 km) apart
+    ROUTE = {'status': 'active', 'stops': [[76.33 + i / 100, 10.05] for i in range(3)]}
+
+    def setUp(self):
+        patcher = mock.patch.object(progress, 'trip_route', lambda trip_id: self.ROUTE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(progress, 'load_factor', lambda: 1.0)
+        self.load_factor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_trip_pings_rarely(self):
+        self.assertEqual(progress.next_ping_interval(None, 76.33, 10.05), progress.IDLE_INTERVAL)
+
+    def test_parked_bus_pings_at_the_longest_interval(self):
+        self.assertEqual(progress.next_ping_interval('t', 76.335, 10.05, speed=0), progress.MAX_INTERVAL)
+
+    def test_bus_near_a_stop_pings_often(self):
+        self.assertEqual(progress.next_ping_interval('t', 76.338, 10.05, speed=10), progress.MIN_INTERVAL)
+
+    def test_interval_spreads_points_over_the_leg(self):
+        # About 0.77 km from the next stop at 20 m/s: 38 s split into POINTS_PER_LEG
+        self.assertEqual(progress.next_ping_interval('t', 76.333, 10.05, speed=20), 10)
+
+    def test_overload_stretches_the_interval(self):
+        with mock.patch.object(progress, 'load_factor', lambda: 3.0):
+            self.assertEqual(progress.next_ping_interval('t', 76.333, 10.05, speed=20), 29)
+            self.assertEqual(progress.next_ping_interval(None, 76.33, 10.05), progress.IDLE_INTERVAL)
+
+
+class FakeNotifier:
+    closed = False
+
+    def __init__(self):
+        self.executed = []
+
+    def get_backend_pid(self):
+        return 42
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+
+class BrokerTests(SimpleTestCase):
+    TRIPS = [f'00000000-0000-0000-0000-00000000000{i}' for i in (1, 2)]
+
+    def setUp(self):
+        self.notifier = FakeNotifier()
+        for patcher in (
+            mock.patch.object(broker.PostgresBroker, '_connect_listener', lambda self: None),
+            mock.patch.object(broker, 'connect', lambda: self.notifier),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_broker(self, use):
+        async def run():
+            relay = broker.PostgresBroker(lambda trip_id, message: self.delivered.append((trip_id, message)))
+            await use(relay)
+            relay.executor.shutdown(wait=True)
+            return relay
+
+        self.delivered = []
+        return asyncio.run(run())
+
+    def test_payloads_stay_under_the_notify_limit(self):
+        messages = ['x' * 3000] * 5
+        payloads = list(broker.payloads(messages))
+        self.assertEqual(len(payloads), 3)
+        self.assertTrue(all(len(payload) <= broker.MAX_PAYLOAD for payload in payloads))
+        self.assertEqual('\n'.join(payloads).split('\n'), messages)
+
+    @override_settings(LIVE_TRACKING_BATCH_MS=1)
+    def test_points_of_a_batch_go_out_in_one_statement(self):
+        async def publish(relay):
+            for message in ('a', 'b'):
+                relay.publish(self.TRIPS[0], message)
+            relay.publish(self.TRIPS[1], 'c')
+            await asyncio.sleep(0.05)
+
+        self.run_broker(publish)
+        self.assertEqual(len(self.notifier.executed), 1)
+        channels, bodies = self.notifier.executed[0][1]
+        self.assertEqual(channels, [broker.channel_name(trip_id) for trip_id in self.TRIPS])
+        self.assertEqual(bodies, ['a\nb', 'c'])
+
+    def test_own_notifications_are_skipped(self):
+        channel = broker.channel_name(self.TRIPS[0])
+
+        async def receive(relay):
+            relay.notifier_pid = 42
+            relay.listener = mock.Mock(notifies=[
+                SimpleNamespace(pid=42, channel=channel, payload='own'),
+                SimpleNamespace(pid=7, channel=channel, payload='a\nb'),
+            ])
+            relay._on_readable()
+
+        self.run_broker(receive)
+        self.assertEqual(self.delivered, [(self.TRIPS[0], 'a'), (self.TRIPS[0], 'b')])
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('my-bus/', views.MyBusView.as_view(), name='live-my-bus'),
+    path('trips/<uuid:trip_id>/', views.LiveTripView.as_view(), name='live-trip'),
+    path('fleet/', views.FleetView.as_view(), name='live-fleet'),
+    path('nearest/', views.NearestBusView.as_view(), name='live-nearest'),
+]
@@ -0,0 +1,188 @@
+import json
+import math
+from uuid import UUID
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework import generics
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+
+from core import singleflight
+from core.authentication import CachedJWTAuthentication
+from core.permissions import IsGuardianOrAdmin
+from drivers import live
+from drivers.models import Driver
+from routeplan import student_trips
+from . import eta, fleet, spatial
+
+# Live reads of the same trip within this many seconds share one response body
+COALESCE_SECONDS = 1.0
+
+# Buses returned by a nearest-bus query by default and at most
+DEFAULT_NEAREST = 5
+MAX_NEAREST = 50
+
+
+def live_trip(trip):
+    """
+    Live state of a trip, shared by every reader within COALESCE_SECONDS.
+
+    Args:
+        trip (dict): Trip as returned by student_trips
+
+    Returns:
+        Tuple of (arrival estimates or None, JSON body with the trip, the
+        bus position and the estimates of every stop ahead)
+    """
+    def compute():
+        position = live.position(trip['driver_id']) if trip['driver_id'] else None
+        estimates = eta.get(trip['trip_id'])
+        arrival = None
+        if estimates is not None:
+            arrival = {'updated_at': estimates['updated_at'], 'pace': estimates['pace'],
+                       'stops': estimates['stops']}
+        body = json.dumps({
+            'trip': {key: trip[key] for key in trip if key != 'driver_id'},
+            'bus': position,
+            'eta': arrival,
+        }, cls=DjangoJSONEncoder)
+        return estimates, body
+
+    return singleflight.do('live_trip', trip['trip_id'], compute, window=COALESCE_SECONDS)
+
+
+def json_response(body):
+    return HttpResponse(body, content_type='application/json')
+
+
+def _float_param(request, name, required=False, bounds=(None, None)):
+    """Parse an optional number query parameter within inclusive bounds"""
+    value = request.query_params.get(name)
+    if value is None:
+        if required:
+            raise ValidationError({name: "This parameter is required"})
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        value = math.nan
+    if math.isnan(value):
+        raise ValidationError({name: "Expected a number"})
+    low, high = bounds
+    if (low is not None and value < low) or (high is not None and value > high):
+        expected = f"between {low} and {high}" if high is not None else f"of at least {low}"
+        raise ValidationError({name: f"Expected a number {expected}"})
+    return value
+
+
+class MyBusView(generics.GenericAPIView):
+    """
+    Where the bus of the token's student is right now: the trip, the bus
+    position and the arrival estimates. Served from the student -> trip
+    lookup and the live caches, without touching the database.
+    Admins pass the student as ?student_id=.
+    """
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated, IsGuardianOrAdmin]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Return the student's current trip (null when they have none left
+        today), the bus position, the estimates of the stops ahead and the
+        student's own stop among them.
+        """
+        if request.user.is_staff:
+            student_id = request.query_params.get('student_id')
+            if not student_id:
+                raise ValidationError({'student_id': "Required for admins"})
+            try:
+                student_id = str(UUID(student_id))
+            except ValueError:
+                raise ValidationError({'student_id': "Expected a UUID"})
+        else:
+            student_id = request.auth.payload.get('associated_id')
+
+        trip = student_trips.current_trip(student_trips.trips_for_student(student_id))
+        if trip is None:
+            return json_response(json.dumps(
+                {'student_id': student_id, 'my_stop': None, 'trip': None, 'bus': None, 'eta': None}
+            ))
+
+        estimates, shared = live_trip(trip)
+        my_stop = None
+        if estimates is not None:
+            my_stop = next((stop for stop in estimates['stops'] if stop['student_id'] == str(student_id)), None)
+        # The shared body of the trip is spliced in rather than encoded again for every guardian
+        own = json.dumps({'student_id': student_id, 'my_stop': my_stop})
+        return json_response(f'{own[:-1]}, {shared[1:]}')
+
+
+class LiveTripView(generics.GenericAPIView):
+    """
+    Live state of a trip: the bus position and the arrival estimates of
+    every stop ahead. Available to admins, the trip's driver and the
+    guardians of students on the trip today.
+    """
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, trip_id, *args, **kwargs):
+        trip_id = str(trip_id)
+        trip = singleflight.do('trip_detail', trip_id, lambda: student_trips.describe(trip_id),
+                               window=COALESCE_SECONDS)
+        if trip is None:
+            raise NotFound("Trip not found")
+
+        if not request.user.is_staff:
+            claims = request.auth.payload if request.auth else {}
+            associated_id = claims.get('associated_id')
+            if claims.get('user_type') == 'driver':
+                allowed = associated_id == trip['driver_id']
+            elif claims.get('user_type') == 'guardian':
+                allowed = any(t['trip_id'] == trip_id for t in student_trips.trips_for_student(associated_id))
+            else:
+                allowed = False
+            if not allowed:
+                raise PermissionDenied()
+
+        _, body = live_trip(trip)
+        return json_response(body)
+
+
+class FleetView(generics.GenericAPIView):
+    """
+    Every bus that reported recently as a GeoJSON FeatureCollection, for
+    the admin live map. Pass the returned `cursor` as ?since= to only get
+    the buses that moved since and, in `removed`, the IDs of those that
+    left the map. Only accessible to admins.
+    """
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        since = _float_param(request, 'since')
+        return json_response(fleet.geojson(since))
+
+
+class NearestBusView(generics.GenericAPIView):
+    """
+    Buses closest to a point (?lon=&lat=), e.g. to find a replacement after
+    a breakdown. ?k= sets how many (default 5), ?status= limits them to
+    drivers with that status and ?max_km= to buses within that distance.
+    Only accessible to admins.
+    """
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        longitude = _float_param(request, 'lon', required=True, bounds=(-180, 180))
+        latitude = _float_param(request, 'lat', required=True, bounds=(-90, 90))
+        max_km = _float_param(request, 'max_km', bounds=(0, None))
+        k = int(_float_param(request, 'k', bounds=(1, MAX_NEAREST)) or DEFAULT_NEAREST)
+        status = request.query_params.get('status')
+        if status is not None and status not in dict(Driver.STATUS_CHOICES):
+            raise ValidationError({'status': f"Expected one of {', '.join(dict(Driver.STATUS_CHOICES))}"})
+        return Response(spatial.nearest_buses(longitude, latitude, k, status, max_km))
@@ -9,6 +9,9 @@ from datetime import datetime, timedelta
 import subprocess
 import calendar
 from .models import Trip
+from . import student_trips
+from attendance import presence_cache
+from attendance.models import AttendanceJob
 import json
 import os
 from config.settings import BASE_DIR
@@ -41,11 +44,18 @@ class TripAdmin(admin.ModelAdmin):
         current_month = today.strftime('%B %Y')
         next_month = (today + timedelta(days=32)).strftime('%B %Y')
         
+        # Recent attendance generation jobs with their progress
+        AttendanceJob.fail_stale()
+        attendance_jobs = AttendanceJob.objects.all()[:5]
+        
         context = {
             'title': 'Route Management',
             'dates': dates,
             'current_month': current_month,
             'next_month': next_month,
+            'attendance_jobs': attendance_jobs,
+            'jobs_running': any(job.status in ('pending', 'running') for job in attendance_jobs),
+            'present_today': presence_cache.present_count(today.date()),
             'opts': self.model._meta,
         }
         return render(request, 'admin/routeplan/route_management.html', context)
@@ -91,19 +101,35 @@ class TripAdmin(admin.ModelAdmin):
             month = request.POST.get('month')
             try:
                 date = datetime.strptime(month, '%B %Y')
-                # Create attendance records for the month
-                # You'll need to implement this based on your attendance creation logic
-                messages.success(request, f'Successfully created attendance records for {month}')
+                AttendanceJob.fail_stale()
+                if AttendanceJob.objects.filter(year=date.year, month=date.month,
+                                                status__in=['pending', 'running']).exists():
+                    messages.warning(request, f'Attendance records for {month} are already being created')
+                    return HttpResponseRedirect(reverse('admin:route-management'))
+                
+                # Generate the records in the background; progress shows on this page
+                job = AttendanceJob.objects.create(year=date.year, month=date.month, created_by=request.user)
+                try:
+                    subprocess.Popen(
+                        ['python', 'scripts/mark_monthly_attendance.py',
+                         str(date.year), str(date.month), '--job', str(job.job_id)],
+                        cwd=BASE_DIR
+                    )
+                except OSError as e:
+                    # The job never started - do not leave it pending
+                    AttendanceJob.objects.filter(job_id=job.job_id).update(status='failed', error=str(e))
+                    raise
+                messages.success(request, f'Started creating attendance records for {month}')
             except Exception as e:
                 messages.error(request, f'Error creating attendance records: {str(e)}')
         return HttpResponseRedirect(reverse('admin:route-management'))
     
     # Fields to display in the list view
     list_display = ('trip_date', 'start_time', 'end_time', 'status', 
-                   'to_school', 'driver', 'total_distance', 'student_count')
+                   'to_school', 'driver', 'wave', 'total_distance', 'student_count')
     
     # Fields to filter on in the right sidebar
-    list_filter = ('status', 'trip_date', 'to_school')
+    list_filter = ('status', 'trip_date', 'to_school', 'provisional')
     
     # Fields to search on
     search_fields = ('route_plan_id', 'driver__name', 'driver__bus_no')
@@ -114,7 +140,7 @@ class TripAdmin(admin.ModelAdmin):
     # Organize fields into fieldsets for better readability
     fieldsets = (
         ('Trip Information', {
-            'fields': ('route_plan_id', 'trip_date', 'start_time', 'end_time', 'to_school', 'status')
+            'fields': ('route_plan_id', 'trip_date', 'start_time', 'end_time', 'to_school', 'wave', 'status', 'provisional')
         }),
         ('Route Details', {
             'fields': ('total_distance', 'route_order'),
@@ -135,31 +161,59 @@ class TripAdmin(admin.ModelAdmin):
     filter_horizontal = ('student_list',)
     
     # Actions to perform on multiple trips
-    actions = ['mark_as_active', 'mark_as_completed', 'mark_as_cancelled']
+    actions = ['mark_as_active', 'mark_as_completed', 'mark_as_cancelled', 'recover_breakdown']
     
     def student_count(self, obj):
         """Return the number of students assigned to this trip."""
         return obj.student_list.count()
     student_count.short_description = 'Students'
     
+    def _set_status(self, queryset, status):
+        """Update the status of trips; bulk updates skip the signals that refresh the student -> trip lookup"""
+        dates = set(queryset.values_list('trip_date', flat=True))
+        updated = queryset.update(status=status)
+        for date in dates:
+            student_trips.invalidate(date)
+        return updated
+    
     def mark_as_active(self, request, queryset):
         """Admin action to mark selected trips as active"""
-        updated = queryset.update(status='active')
+        updated = self._set_status(queryset, 'active')
         self.message_user(request, f"{updated} trips were marked as active.")
     mark_as_active.short_description = "Mark selected trips as active"
     
     def mark_as_completed(self, request, queryset):
         """Admin action to mark selected trips as completed"""
-        updated = queryset.update(status='completed')
+        updated = self._set_status(queryset, 'completed')
         self.message_user(request, f"{updated} trips were marked as completed.")
     mark_as_completed.short_description = "Mark selected trips as completed"
     
     def mark_as_cancelled(self, request, queryset):
         """Admin action to mark selected trips as cancelled"""
-        updated = queryset.update(status='cancelled')
+        updated = self._set_status(queryset, 'cancelled')
         self.message_user(request, f"{updated} trips were marked as cancelled.")
     mark_as_cancelled.short_description = "Mark selected trips as cancelled"
     
+    def recover_breakdown(self, request, queryset):
+        """Admin action to move the remaining stops of broken down trips to nearby buses"""
+        from .recovery import recover_trip, RecoveryError
+        
+        for trip in queryset:
+            try:
+                result = recover_trip(trip)
+            except RecoveryError as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+                continue
+            
+            message = (f"Trip {trip}: {result['reassigned']} students moved to "
+                       f"{len(result['trips'])} trips in {result['elapsed'] * 1000:.0f}ms.")
+            if result['unplaced']:
+                message += f" {result['unplaced']} students could not be placed - no spare seats nearby."
+                self.message_user(request, message, level=messages.WARNING)
+            else:
+                self.message_user(request, message)
+    recover_breakdown.short_description = "Breakdown: redistribute remaining stops to nearby buses"
+    
     def map(self, obj):
         """Render a map with the route and student locations marked"""
         from django.conf import settings
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RouteplanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'routeplan'
+
+    def ready(self):
+        # Connect signal receivers
+        from . import signals  # noqa: F401
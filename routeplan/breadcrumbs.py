@@ -0,0 +1,223 @@
+"""
+GPS breadcrumbs of trips.
+
+Every accepted location ping of a bus on a trip is appended to
+TripBreadcrumb. Points are buffered per process and inserted with one
+multi-row INSERT at most every LIVE_LOCATION_FLUSH_SECONDS, like the
+driver positions in drivers.live.
+
+Once a trip has finished, compact() simplifies its breadcrumbs with
+Douglas-Peucker into Trip.path; the raw points are deleted
+BREADCRUMB_RETENTION_DAYS later (see manage.py compact_breadcrumbs), so
+the table only holds the last few days while every trip's shape stays
+queryable.
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString, Point
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection
+from django.utils import timezone
+
+from core import metrics
+from .models import Trip, TripBreadcrumb
+
+logger = logging.getLogger(__name__)
+
+# Buffered points that make a process insert right away instead of waiting for the timer
+MAX_BUFFERED = 5000
+
+# Rows per INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+# Seconds a driver's active trip is cached for the REST location endpoint
+ACTIVE_TRIP_TIMEOUT = 60
+
+# Meters per degree of latitude, used to express the simplification tolerance in degrees
+METERS_PER_DEGREE = 111_320
+
+_buffer = []
+_lock = threading.Lock()
+_timer = None
+
+
+def build(trip_id, longitude, latitude, timestamp, speed=None, heading=None):
+    """
+    Unsaved breadcrumb of a trip.
+
+    Args:
+        trip_id: Trip the bus is driving
+        longitude (float): Longitude coordinate
+        latitude (float): Latitude coordinate
+        timestamp (float): Unix time the device took the position
+        speed (float): Speed in meters per second, if known
+        heading (float): Heading in degrees, if known
+    """
+    return TripBreadcrumb(
+        trip_id=trip_id,
+        recorded_at=datetime.fromtimestamp(timestamp, dt_timezone.utc),
+        location=Point(longitude, latitude, srid=4326),
+        speed=speed,
+        heading=heading,
+    )
+
+
+def record(trip_id, longitude, latitude, timestamp, speed=None, heading=None):
+    """
+    Append a point to a trip's breadcrumbs; it is inserted with the next batch.
+    Takes the same arguments as build().
+    """
+    global _timer
+    breadcrumb = build(trip_id, longitude, latitude, timestamp, speed, heading)
+    with _lock:
+        _buffer.append(breadcrumb)
+        full = len(_buffer) >= MAX_BUFFERED
+        if _timer is None and not full:
+            _timer = threading.Timer(settings.LIVE_LOCATION_FLUSH_SECONDS, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        flush()
+
+
+def flush():
+    """
+    Insert the buffered breadcrumbs of this process. Points of trips deleted
+    while they were buffered are dropped.
+
+    Returns:
+        Number of breadcrumbs inserted
+
+    Raises:
+        DatabaseError: When the INSERT fails; the batch is buffered again
+            and retried by the next flush
+    """
+    global _timer
+    with _lock:
+        batch = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not batch:
+        return 0
+
+    try:
+        try:
+            insert(batch)
+        except IntegrityError:
+            # One deleted trip fails the whole statement; keep the points of the others
+            batch = _without_deleted_trips(batch)
+            insert(batch)
+    except DatabaseError:
+        _requeue(batch)
+        raise
+    return len(batch)
+
+
+def _without_deleted_trips(batch):
+    """Breadcrumbs of a batch whose trip still exists"""
+    trip_ids = {str(breadcrumb.trip_id) for breadcrumb in batch}
+    existing = {
+        str(trip_id) for trip_id in
+        Trip.objects.filter(route_plan_id__in=trip_ids).values_list('route_plan_id', flat=True)
+    }
+    kept = [breadcrumb for breadcrumb in batch if str(breadcrumb.trip_id) in existing]
+    metrics.incr('breadcrumbs.orphaned', len(batch) - len(kept))
+    return kept
+
+
+def _requeue(batch):
+    """Buffer a batch that could not be inserted again, ahead of newer points"""
+    global _timer
+    with _lock:
+        _buffer[:0] = batch
+        if _timer is None:
+            _timer = threading.Timer(settings.LIVE_LOCATION_FLUSH_SECONDS, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+
+
+def insert(batch):
+    """
+    Insert breadcrumbs, skipping points a trip already has.
+
+    Args:
+        batch: List of unsaved TripBreadcrumb
+    """
+    TripBreadcrumb.objects.bulk_create(batch, batch_size=INSERT_BATCH_SIZE, ignore_conflicts=True)
+    metrics.incr('breadcrumbs.inserted', len(batch))
+
+
+def _flush_in_background():
+    try:
+        flush()
+    except DatabaseError as e:
+        logger.error(f"Could not write trip breadcrumbs: {e}")
+    finally:
+        # The timer thread ends here; do not leave its connection open
+        connection.close()
+
+
+atexit.register(flush)
+
+
+def active_trip_id(driver_id):
+    """
+    Trip a driver is driving today, for pings that do not name their trip.
+
+    Returns:
+        Trip ID, or None when the driver has no active trip
+    """
+    key = f'routeplan:active_trip:{driver_id}'
+    trip_id = cache.get(key)
+    if trip_id is None:
+        trip_id = (
+            Trip.objects
+            .filter(driver_id=driver_id, trip_date=timezone.localdate(), status='active')
+            .order_by('start_time')
+            .values_list('route_plan_id', flat=True)
+            .first()
+        )
+        # Cache misses too, as an empty string
+        trip_id = str(trip_id) if trip_id else ''
+        cache.set(key, trip_id, ACTIVE_TRIP_TIMEOUT)
+    return trip_id or None
+
+
+def compact(trip_id, tolerance=None):
+    """
+    Store the simplified path of a trip from its breadcrumbs.
+
+    Args:
+        trip_id: Trip to compact
+        tolerance (float): Largest distance in meters a dropped point may lie
+            from the simplified path (default settings.BREADCRUMB_SIMPLIFY_METERS)
+
+    Returns:
+        Tuple of (breadcrumbs read, points kept); (n, 0) when there were too
+        few breadcrumbs for a path
+    """
+    if tolerance is None:
+        tolerance = settings.BREADCRUMB_SIMPLIFY_METERS
+
+    points = [
+        location.coords for location in
+        TripBreadcrumb.objects
+        .filter(trip_id=trip_id)
+        .order_by('recorded_at')
+        .values_list('location', flat=True)
+    ]
+    if len(points) < 2:
+        return len(points), 0
+
+    # Douglas-Peucker (preserve_topology=False); the path only spans a few km,
+    # so a degree is treated as the same distance in every direction
+    line = LineString(points, srid=4326)
+    path = line.simplify(tolerance / METERS_PER_DEGREE, preserve_topology=False)
+    Trip.objects.filter(route_plan_id=trip_id).update(path=path)
+    return len(points), path.num_points
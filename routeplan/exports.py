@@ -0,0 +1,55 @@
+"""
+Trip roster exports (see core.export).
+"""
+from datetime import timedelta
+
+from django.db.models import F
+
+from core.export import CHUNK_SIZE
+from .models import Trip
+
+FIELDS = ['trip_date', 'to_school', 'wave', 'start_time', 'end_time', 'status',
+          'route_plan_id', 'driver_name', 'bus_no', 'student_id', 'student_name', 'class_grade']
+
+
+def roster_rows(start, end):
+    """
+    One row per student on every trip from start to end (inclusive),
+    ordered by date, session, wave, bus and student name.
+
+    Args:
+        start (datetime.date): First date to export
+        end (datetime.date): Last date to export
+
+    Yields:
+        dicts with the keys in FIELDS
+    """
+    # One query per day, so the first rows go out before the whole range has been sorted
+    date = start
+    while date <= end:
+        yield from _day_rows(date)
+        date += timedelta(days=1)
+
+
+def _day_rows(date):
+    """roster_rows() of one day"""
+    return (
+        Trip.student_list.through.objects
+        .filter(trip__trip_date=date)
+        .order_by('-trip__to_school', 'trip__wave', 'trip__driver__bus_no', 'student__name')
+        .values(
+            'student_id',
+            trip_date=F('trip__trip_date'),
+            to_school=F('trip__to_school'),
+            wave=F('trip__wave'),
+            start_time=F('trip__start_time'),
+            end_time=F('trip__end_time'),
+            status=F('trip__status'),
+            route_plan_id=F('trip__route_plan_id'),
+            driver_name=F('trip__driver__name'),
+            bus_no=F('trip__driver__bus_no'),
+            student_name=F('student__name'),
+            class_grade=F('student__class_grade'),
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
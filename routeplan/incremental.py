@@ -0,0 +1,237 @@
+"""
+Incremental plan updates.
+
+Attendance changes made after a plan was built are patched into the
+existing trips instead of re-clustering the whole date: absent students
+are dropped from their trip and newly present students are inserted into
+the trip with a free seat whose route they lengthen the least. Patched
+trips are flagged as stale so only they are re-optimized before the
+session starts.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from attendance import presence_cache
+from attendance.models import Attendance
+from students.models import Student
+from .models import Trip, MAX_STUDENTS_PER_TRIP
+from .routing import route_stops, insertion_costs
+
+logger = logging.getLogger(__name__)
+
+# Attendance.updated_at is the time a row was written, not when it committed, so a
+# transaction committing after a newer row was read would fall behind the watermark.
+# Every pass re-reads this far back; changes the plan already reflects are skipped.
+# Must be longer than the longest transaction writing attendance for a planned date.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def stale_trips(date, to_school=None):
+    """Trips for a date whose route order has to be (re-)optimized"""
+    trips = Trip.objects.filter(trip_date=date, status='pending').filter(
+        Q(route_order__isnull=True) | Q(route_order__stale=True)
+    )
+    if to_school is not None:
+        trips = trips.filter(to_school=to_school)
+    return trips
+
+
+def apply_attendance_changes(date, since):
+    """
+    Patch the pending trips of a date with attendance recorded after `since`.
+    Records up to WATERMARK_OVERLAP older are read again, in case they
+    committed late; applying one twice changes nothing.
+
+    Args:
+        date (datetime.date): Date whose plan should be updated
+        since (datetime): Only attendance updated after this moment is applied
+
+    Returns:
+        Tuple of (ids of the trips that changed, new watermark). Pass the
+        watermark as `since` on the next call.
+    """
+    changes = list(
+        Attendance.objects
+        .filter(date=date, updated_at__gt=since - WATERMARK_OVERLAP)
+        .values_list('student_id', 'presence', 'updated_at')
+    )
+    if not changes:
+        return set(), since
+
+    watermark = max(since, max(updated_at for _, _, updated_at in changes))
+    absent = {student_id for student_id, presence, _ in changes if not presence}
+    present = {student_id for student_id, presence, _ in changes if presence}
+    absent, present = _unapplied(date, absent, present)
+    if not absent and not present:
+        return set(), watermark
+
+    changed = patch_plan(date, absent, present)
+    if changed:
+        logger.info(f"Applied {len(changes)} attendance changes for {date} to {len(changed)} trips")
+    return changed, watermark
+
+
+def _unapplied(date, absent, present):
+    """
+    Drop the changes the pending trips of a date already reflect, so
+    re-reading the overlap does not lock the trips again.
+
+    Returns:
+        Tuple of (absent students still on a trip, present students
+        missing from a session's trips)
+    """
+    sessions = set(Trip.objects.filter(trip_date=date, status='pending')
+                   .order_by().values_list('to_school', flat=True).distinct())
+    on_trip = defaultdict(set)
+    for student_id, to_school in (
+        Trip.student_list.through.objects
+        .filter(trip__trip_date=date, trip__status='pending')
+        .values_list('student_id', 'trip__to_school')
+    ):
+        on_trip[to_school].add(student_id)
+    anywhere = set().union(*on_trip.values())
+    return (absent & anywhere,
+            {student_id for student_id in present
+             if any(student_id not in on_trip[to_school] for to_school in sessions)})
+
+
+def reconcile_plan(date, complete=True):
+    """
+    Bring a provisional (forecast based) plan in line with actual attendance.
+    Planned students who are not present are removed and present students
+    who were not planned are inserted.
+
+    Args:
+        date (datetime.date): Date whose plan should be reconciled
+        complete (bool): Whether the register is complete; when it is not,
+            planned students without a record stay on their trip
+
+    Returns:
+        Set of ids of the trips that changed
+    """
+    present = set(presence_cache.present_ids(date))
+    planned = set(
+        Trip.student_list.through.objects
+        .filter(trip__trip_date=date, trip__status='pending')
+        .values_list('student_id', flat=True)
+    )
+    absent = planned - present
+    if not complete:
+        absent &= set(Attendance.objects.filter(date=date).values_list('student_id', flat=True))
+
+    changed = patch_plan(date, absent, present)
+    Trip.objects.filter(trip_date=date, provisional=True).update(provisional=False)
+    logger.info(f"Reconciled provisional plan for {date}: {len(changed)} trips changed")
+    return changed
+
+
+def patch_plan(date, absent, present):
+    """
+    Remove absent students from the pending trips of a date and insert
+    present students who are not on a trip yet.
+
+    Args:
+        date (datetime.date): Date whose plan should be updated
+        absent: Set of IDs of students who should not be on a trip
+        present: Set of IDs of students who should be on a trip
+
+    Returns:
+        Set of ids of the trips that changed
+    """
+    changed = set()
+
+    with transaction.atomic():
+        trips = list(Trip.objects.select_for_update().filter(trip_date=date, status='pending'))
+        if not trips:
+            return changed
+
+        assigned = defaultdict(set)
+        for trip_id, student_id in (
+            Trip.student_list.through.objects
+            .filter(trip__in=trips)
+            .values_list('trip_id', 'student_id')
+        ):
+            assigned[trip_id].add(student_id)
+
+        all_assigned = set().union(*assigned.values())
+        students = Student.objects.in_bulk(all_assigned | present)
+
+        for to_school in (True, False):
+            session = [trip for trip in trips if trip.to_school == to_school]
+            if not session:
+                continue
+
+            stops = {
+                trip.pk: route_stops(trip, [students[s] for s in assigned[trip.pk] if s in students])
+                for trip in session
+            }
+            removed = defaultdict(list)
+            added = defaultdict(list)
+
+            # Drop students who are now absent
+            for trip in session:
+                leaving = assigned[trip.pk] & absent
+                if not leaving:
+                    continue
+                leaving_ids = {str(student_id) for student_id in leaving}
+                stops[trip.pk] = [
+                    stop for stop in stops[trip.pk]
+                    if stop.get('student_id') not in leaving_ids
+                ]
+                assigned[trip.pk] -= leaving
+                removed[trip.pk].extend(leaving)
+
+            # Insert students who are newly present where the detour is smallest
+            on_bus = set().union(*(assigned[trip.pk] for trip in session))
+            for student_id in present - on_bus:
+                student = students.get(student_id)
+                if not student or not student.is_active or not student.coordinates:
+                    continue
+                point = np.array([[student.coordinates.x, student.coordinates.y]])
+
+                best = None
+                for trip in session:
+                    if len(assigned[trip.pk]) >= MAX_STUDENTS_PER_TRIP:
+                        continue
+                    route = np.array([stop['coordinates'] for stop in stops[trip.pk]], dtype=float)
+                    costs = insertion_costs(route, point)[0]
+                    gap = int(costs.argmin())
+                    if best is None or costs[gap] < best[0]:
+                        best = (costs[gap], trip, gap)
+
+                if best is None:
+                    logger.warning(f"No free seat for {student.name} on {date} "
+                                   f"({'to' if to_school else 'from'} school)")
+                    continue
+
+                _, trip, gap = best
+                stops[trip.pk].insert(gap + 1, {
+                    'type': 'student',
+                    'coordinates': [student.coordinates.x, student.coordinates.y],
+                    'student_name': student.name,
+                    'student_id': str(student.student_id),
+                })
+                assigned[trip.pk].add(student_id)
+                added[trip.pk].append(student_id)
+
+            for trip in session:
+                if not removed[trip.pk] and not added[trip.pk]:
+                    continue
+                if removed[trip.pk]:
+                    trip.student_list.remove(*removed[trip.pk])
+                if added[trip.pk]:
+                    trip.student_list.add(*added[trip.pk])
+
+                route_data = dict(trip.route_order or {})
+                route_data['stops'] = stops[trip.pk]
+                route_data['stale'] = True
+                trip.route_order = route_data
+                trip.save(update_fields=['route_order', 'updated_at'])
+                changed.add(trip.pk)
+
+    return changed
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from routeplan import breadcrumbs
+from routeplan.models import Trip, TripBreadcrumb
+
+
+class Command(BaseCommand):
+    help = (
+        "Simplify the breadcrumbs of finished trips into Trip.path and delete "
+        "raw breadcrumbs older than the retention period. Run nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=settings.BREADCRUMB_RETENTION_DAYS,
+                            help='Days to keep the raw breadcrumbs of compacted trips')
+        parser.add_argument('--tolerance', type=float, default=settings.BREADCRUMB_SIMPLIFY_METERS,
+                            help='Simplification tolerance in meters')
+        parser.add_argument('--recompact', action='store_true',
+                            help='Also recompute paths that were already stored')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        # Trips that finished, plus trips of earlier days nobody closed
+        trips = (
+            Trip.objects
+            .filter(Q(status__in=['completed', 'cancelled']) | Q(trip_date__lt=today))
+            .filter(Exists(TripBreadcrumb.objects.filter(trip=OuterRef('pk'))))
+        )
+        if not options['recompact']:
+            trips = trips.filter(path__isnull=True)
+
+        compacted = read = kept = 0
+        for trip_id in trips.values_list('route_plan_id', flat=True).iterator():
+            points, path_points = breadcrumbs.compact(trip_id, options['tolerance'])
+            read += points
+            kept += path_points
+            compacted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {compacted} trips: {read} breadcrumbs into {kept} path points"
+        ))
+
+        cutoff = today - timedelta(days=options['keep_days'])
+        deleted, _ = TripBreadcrumb.objects.filter(
+            trip__trip_date__lt=cutoff, trip__path__isnull=False
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} breadcrumbs of trips before {cutoff}"))
@@ -0,0 +1,218 @@
+import logging
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from attendance import presence_cache
+from attendance.models import Attendance
+from attendance.school_calendar import is_school_day
+from core.checks import cache_is_shared
+from routeplan.incremental import apply_attendance_changes, reconcile_plan, stale_trips
+from routeplan.models import Trip
+from routeplan.scheduling import parse_time
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest measurement in the running stage duration estimate
+DURATION_SMOOTHING = 0.5
+
+# Final optimization starts this many times its expected duration before the cutoff
+FINAL_STAGE_MARGIN = 2.0
+
+# Expected final stage duration in seconds until one has been measured
+DEFAULT_FINAL_STAGE_SECONDS = 300
+
+
+class Command(BaseCommand):
+    help = (
+        "Long-running trip planner: plans the next school day in the evening, "
+        "patches the plan as attendance comes in and re-optimizes changed trips "
+        "before each session's cutoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the stages that are due now and exit')
+        parser.add_argument('--poll', type=int, default=settings.PLANNER_POLL_SECONDS,
+                            help='Seconds between checks for due stages')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # Its cache invalidations and present-set repairs would never reach the web processes
+            raise CommandError("run_planner needs a cache shared with the web processes; set REDIS_URL")
+        # Attendance watermark per planned date
+        self.planned = {}
+        # (date, to_school) sessions whose final optimization has run
+        self.finalized = set()
+        # Dates planned from forecast attendance that still need reconciling
+        self.provisional = set()
+        # Smoothed duration of each stage in seconds
+        self.durations = {}
+        self.resume(timezone.localdate())
+
+        self.stdout.write(f"Planner started, checking every {options['poll']}s")
+        while True:
+            try:
+                self.tick(timezone.localtime())
+            except Exception as e:
+                logger.exception(f"Planner tick failed: {e}")
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+
+    def resume(self, today):
+        """
+        Pick up the plans made before the planner (re)started: attendance
+        recorded since their trips were created is patched in on the first
+        pass and forecast plans are reconciled, not patched.
+        """
+        for date in (Trip.objects.filter(trip_date__gte=today).order_by()
+                     .values_list('trip_date', flat=True).distinct()):
+            self.adopt(date)
+        self.provisional = set(
+            Trip.objects.filter(trip_date__gte=today, provisional=True).order_by()
+            .values_list('trip_date', flat=True).distinct()
+        )
+        if self.planned:
+            self.stdout.write(f"Resuming {len(self.planned)} planned dates "
+                              f"({len(self.provisional)} provisional)")
+
+    def adopt(self, date):
+        """Track a plan this planner did not make, from the moment its first trip was created"""
+        self.planned[date] = Trip.objects.filter(trip_date=date).aggregate(
+            planned_at=Min('created_at'))['planned_at']
+
+    @contextmanager
+    def stage(self, name, date):
+        """Time a stage, report it and keep a running estimate of its duration"""
+        started = time.perf_counter()
+        report = {}
+        yield report
+        elapsed = time.perf_counter() - started
+        previous = self.durations.get(name)
+        self.durations[name] = elapsed if previous is None else (
+            DURATION_SMOOTHING * elapsed + (1 - DURATION_SMOOTHING) * previous
+        )
+        if not report.get('quiet'):
+            detail = f" ({report['detail']})" if report.get('detail') else ""
+            self.stdout.write(f"[{date}] {name}: {elapsed:.1f}s{detail}")
+
+    def run_script(self, *args):
+        """Run one of the planning scripts the same way the admin buttons do"""
+        result = subprocess.run(
+            ['python', *args], capture_output=True, text=True, cwd=settings.BASE_DIR
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{args[0]} failed: {result.stderr}")
+
+    def cutoff(self, date, to_school):
+        """Moment by which a session's plan must be final"""
+        cutoff = settings.PLANNER_MORNING_CUTOFF if to_school else settings.PLANNER_AFTERNOON_CUTOFF
+        return timezone.make_aware(datetime.combine(date, parse_time(cutoff)))
+
+    def final_stage_start(self, date, to_school):
+        """Moment a session's final optimization starts, early enough to finish by the cutoff"""
+        expected = self.durations.get('final optimization', DEFAULT_FINAL_STAGE_SECONDS)
+        return self.cutoff(date, to_school) - timedelta(seconds=expected * FINAL_STAGE_MARGIN)
+
+    def tick(self, now):
+        today = now.date()
+
+        # Evening: plan the next school day so the morning only needs a delta
+        next_day = today + timedelta(days=1)
+        while not is_school_day(next_day):
+            next_day += timedelta(days=1)
+        if now.time() >= parse_time(settings.PLANNER_EVENING_TIME) and next_day not in self.planned:
+            self.full_plan(next_day, now)
+
+        # Started during the day: make sure today's remaining sessions have a plan
+        if (is_school_day(today) and today not in self.planned
+                and now < self.cutoff(today, to_school=False)):
+            if Trip.objects.filter(trip_date=today).exists():
+                # Planned elsewhere, e.g. from the admin
+                self.adopt(today)
+                if Trip.objects.filter(trip_date=today, provisional=True).exists():
+                    self.provisional.add(today)
+            else:
+                self.full_plan(today, now)
+
+        for date in sorted(self.planned):
+            if date < today:
+                del self.planned[date]
+                continue
+
+            if date in self.provisional:
+                self.reconcile(date, now)
+            else:
+                self.incremental(date)
+
+            for to_school in (True, False):
+                if (date, to_school) in self.finalized:
+                    continue
+                if now >= self.final_stage_start(date, to_school):
+                    self.final_optimization(date, to_school)
+
+        self.finalized = {session for session in self.finalized if session[0] >= today}
+        self.provisional = {date for date in self.provisional if date >= today}
+
+    def full_plan(self, date, now):
+        """
+        Cluster and optimize every trip of a date from scratch.
+        Dates without attendance yet are planned from the attendance forecast.
+        """
+        forecast = not Attendance.is_recorded(date)
+        with self.stage('clustering', date) as report:
+            if forecast:
+                self.run_script('scripts/cluster.py', date.isoformat(), '--forecast')
+                report['detail'] = 'provisional, from forecast attendance'
+            else:
+                self.run_script('scripts/cluster.py', date.isoformat())
+        with self.stage('optimization', date):
+            self.run_script('scripts/optimize.py', date.isoformat())
+        self.planned[date] = now
+        if forecast:
+            self.provisional.add(date)
+
+    def reconcile(self, date, now):
+        """
+        Patch a forecast-based plan once the day's register is complete. A
+        register still partly taken when the morning's final optimization is
+        due is applied as far as it goes; students without a record keep
+        their forecast.
+        """
+        complete = Attendance.is_complete(date)
+        if not complete and (now < self.final_stage_start(date, to_school=True)
+                             or not Attendance.is_recorded(date)):
+            return
+        with self.stage('reconciliation', date) as report:
+            # Everything recorded up to now is covered by the reconciliation
+            self.planned[date] = timezone.now()
+            # The reconciliation reads the cached present set - make sure it is current
+            presence_cache.check(date, repair=True)
+            changed = reconcile_plan(date, complete)
+            report['detail'] = f"{len(changed)} trips changed" + ("" if complete else ", register incomplete")
+        self.provisional.discard(date)
+
+    def incremental(self, date):
+        """Patch the plan with attendance recorded since the last pass"""
+        with self.stage('incremental update', date) as report:
+            changed, self.planned[date] = apply_attendance_changes(date, self.planned[date])
+            # Most passes find nothing to do - only report the ones that did work
+            report['quiet'] = not changed
+            report['detail'] = f"{len(changed)} trips changed"
+
+    def final_optimization(self, date, to_school):
+        """Re-optimize only the trips that changed since they were last optimized"""
+        trip_ids = [str(pk) for pk in stale_trips(date, to_school).values_list('pk', flat=True)]
+        with self.stage('final optimization', date) as report:
+            if trip_ids:
+                self.run_script('scripts/optimize.py', date.isoformat(), *trip_ids)
+            session = 'morning' if to_school else 'afternoon'
+            report['detail'] = f"{session} session, {len(trip_ids)} trips re-optimized"
+        self.finalized.add((date, to_school))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0001_initial'),
+        ('routeplan', '0003_alter_trip_unique_together'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='trip',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='wave',
+            field=models.PositiveSmallIntegerField(default=1, help_text="Order of this trip among the driver's trips for the same date and direction"),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trip',
+            unique_together={('trip_date', 'to_school', 'driver', 'wave')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drivers', '0001_initial'),
+        ('routeplan', '0004_trip_wave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trip_date', models.DateField(help_text='Date the driver is reserved for')),
+                ('to_school', models.BooleanField(default=True, help_text='True for the morning session, False for the afternoon session')),
+                ('planning_run', models.UUIDField(db_index=True, help_text='Planning run that holds this reservation')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('driver', models.ForeignKey(help_text='Driver reserved for the session', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='drivers.driver')),
+            ],
+            options={
+                'verbose_name': 'Driver Reservation',
+                'verbose_name_plural': 'Driver Reservations',
+                'indexes': [models.Index(fields=['trip_date', 'to_school'], name='routeplan_d_trip_da_6e051a_idx')],
+                'unique_together': {('driver', 'trip_date', 'to_school')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplan', '0005_driverreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='provisional',
+            field=models.BooleanField(default=False, help_text='Planned from forecast attendance and not yet reconciled with actual attendance'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-19 06:58
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplan', '0006_trip_provisional'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='path',
+            field=django.contrib.gis.db.models.fields.LineStringField(blank=True, help_text='Simplified path the bus actually drove (see compact_breadcrumbs)', null=True, srid=4326),
+        ),
+        migrations.CreateModel(
+            name='TripBreadcrumb',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recorded_at', models.DateTimeField(help_text='Time the device took the position')),
+                ('location', django.contrib.gis.db.models.fields.PointField(help_text='Position of the bus', srid=4326)),
+                ('speed', models.FloatField(blank=True, help_text='Speed in meters per second, when the device reported it', null=True)),
+                ('heading', models.FloatField(blank=True, help_text='Heading in degrees, when the device reported it', null=True)),
+                ('trip', models.ForeignKey(db_index=False, help_text='Trip the point was recorded on', on_delete=django.db.models.deletion.CASCADE, related_name='breadcrumbs', to='routeplan.trip')),
+            ],
+            options={
+                'verbose_name': 'Trip Breadcrumb',
+                'verbose_name_plural': 'Trip Breadcrumbs',
+                'constraints': [models.UniqueConstraint(fields=('trip', 'recorded_at'), name='unique_trip_breadcrumb')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routeplan', '0007_trip_path_tripbreadcrumb'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='planning_run',
+            field=models.UUIDField(blank=True, editable=False, help_text='Planning run that created this trip', null=True),
+        ),
+    ]
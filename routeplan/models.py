@@ -3,6 +3,9 @@ import uuid
 from django.contrib.gis.db import models as gis_models
 from django.utils import timezone
 
+# Seating capacity of a bus
+MAX_STUDENTS_PER_TRIP = 40
+
 class Trip(models.Model):
     """
     Trip model to store information about trips, including optimization data,
@@ -27,6 +30,12 @@ class Trip(models.Model):
         help_text="Estimated arrival time for this trip"
     )
     
+    # Position of this trip among the driver's trips in the same session
+    wave = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Order of this trip among the driver's trips for the same date and direction"
+    )
+    
     # Trip status
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -41,6 +50,20 @@ class Trip(models.Model):
         help_text="Current status of the trip"
     )
     
+    # Plans built from forecast attendance are reconciled once the day's attendance is known
+    provisional = models.BooleanField(
+        default=False,
+        help_text="Planned from forecast attendance and not yet reconciled with actual attendance"
+    )
+    
+    # Planning run that created the trip; its driver reservations are released on re-planning
+    planning_run = models.UUIDField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Planning run that created this trip"
+    )
+    
     # Trip direction
     to_school = models.BooleanField(
         default=True,
@@ -54,6 +77,13 @@ class Trip(models.Model):
         help_text="Total distance of the route in kilometers"
     )
     
+    # Driven path, simplified from the trip's breadcrumbs once it has finished
+    path = gis_models.LineStringField(
+        null=True,
+        blank=True,
+        help_text="Simplified path the bus actually drove (see compact_breadcrumbs)"
+    )
+    
     # Student list - Many-to-Many relationship
     # This is explicit instead of relying on the reverse relationship
     student_list = models.ManyToManyField(
@@ -96,5 +126,86 @@ class Trip(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['to_school']),
         ]
-        # Ensure unique combination of date, direction and driver
-        unique_together = ['trip_date', 'to_school', 'driver']
+        # A driver can run several waves per direction, but only one of each
+        unique_together = ['trip_date', 'to_school', 'driver', 'wave']
+
+
+class TripBreadcrumb(models.Model):
+    """
+    One GPS point of a trip as the bus drove it. Append only; written in
+    batches by routeplan.breadcrumbs and removed some days after the trip's
+    path has been stored on the Trip.
+    """
+    id = models.BigAutoField(primary_key=True)
+    trip = models.ForeignKey(
+        Trip,
+        on_delete=models.CASCADE,
+        related_name='breadcrumbs',
+        db_index=False,  # Covered by the (trip, recorded_at) constraint
+        help_text="Trip the point was recorded on"
+    )
+    recorded_at = models.DateTimeField(
+        help_text="Time the device took the position"
+    )
+    location = gis_models.PointField(
+        help_text="Position of the bus"
+    )
+    speed = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Speed in meters per second, when the device reported it"
+    )
+    heading = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Heading in degrees, when the device reported it"
+    )
+    
+    def __str__(self):
+        return f"{self.trip_id} @ {self.recorded_at}"
+    
+    class Meta:
+        verbose_name = 'Trip Breadcrumb'
+        verbose_name_plural = 'Trip Breadcrumbs'
+        # A point uploaded twice (retried requests, batch uploads) is stored once
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'recorded_at'], name='unique_trip_breadcrumb'),
+        ]
+
+
+class DriverReservation(models.Model):
+    """
+    Records that a driver has been claimed by a planning run for a date and direction.
+    Concurrent planners skip reserved drivers instead of assigning them twice.
+    """
+    driver = models.ForeignKey(
+        'drivers.Driver',
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text="Driver reserved for the session"
+    )
+    trip_date = models.DateField(
+        help_text="Date the driver is reserved for"
+    )
+    to_school = models.BooleanField(
+        default=True,
+        help_text="True for the morning session, False for the afternoon session"
+    )
+    planning_run = models.UUIDField(
+        db_index=True,
+        help_text="Planning run that holds this reservation"
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.driver} - {self.trip_date} ({'to' if self.to_school else 'from'} school)"
+    
+    class Meta:
+        verbose_name = 'Driver Reservation'
+        verbose_name_plural = 'Driver Reservations'
+        indexes = [
+            models.Index(fields=['trip_date', 'to_school']),
+        ]
+        # A driver can only be held by one planning run per session
+        unique_together = ['driver', 'trip_date', 'to_school']
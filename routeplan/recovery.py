@@ -0,0 +1,246 @@
+"""
+Emergency re-planning for trips that cannot be completed, e.g. after a
+bus breakdown. The stops the failed bus has not reached yet are inserted
+into nearby trips with spare seats using cheapest insertion, and only the
+affected trips are touched.
+"""
+import logging
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.geo import haversine_km
+from core.notifications import notify_drivers, notify_guardians
+from drivers import live
+from .models import Trip, MAX_STUDENTS_PER_TRIP
+from .routing import route_stops, split_route, insertion_costs
+
+logger = logging.getLogger(__name__)
+
+# Trips in these states can still take over stops from a failed trip
+RECOVERABLE_STATUSES = ('pending', 'active')
+
+# Number of closest buses considered when redistributing stops
+MAX_CANDIDATE_TRIPS = 5
+
+# Driver positions older than this are not trusted for progress detection
+LOCATION_MAX_AGE = timedelta(minutes=10)
+
+# Recovery is expected to finish within this many seconds
+RECOVERY_TIME_BUDGET = 1.0
+
+
+class RecoveryError(Exception):
+    """Raised when a trip cannot be recovered."""
+
+
+def _live_position(driver):
+    """Return the driver's [lon, lat] if it was reported recently, else None"""
+    if not driver:
+        return None
+    # The live store is ahead of the drivers table by up to one flush
+    position = live.position(driver.driver_id)
+    if position:
+        if time.time() - position['timestamp'] > LOCATION_MAX_AGE.total_seconds():
+            return None
+        return [position['longitude'], position['latitude']]
+    if not driver.current_location or not driver.location_updated_at:
+        return None
+    if timezone.now() - driver.location_updated_at > LOCATION_MAX_AGE:
+        return None
+    return [driver.current_location.x, driver.current_location.y]
+
+
+def recover_trip(trip):
+    """
+    Redistribute the remaining stops of a failed trip to nearby buses.
+
+    The failed trip is cancelled, its unvisited students are moved to the
+    trips that can absorb them with the smallest detour, and the drivers of
+    every affected trip are notified. Unvisited students no trip can take
+    are taken off the failed trip too and their guardians are notified.
+
+    Args:
+        trip (Trip): The trip that cannot be completed
+
+    Returns:
+        dict with the reassigned and unplaced student counts, the IDs of
+        the unplaced students, the affected trips and the elapsed time in
+        seconds
+
+    Raises:
+        RecoveryError: When the trip is no longer pending or active
+    """
+    started = time.perf_counter()
+
+    with transaction.atomic():
+        # Lock the failed trip so two operators cannot recover it twice: the
+        # second one waits here and then finds the trip cancelled
+        trip = Trip.objects.select_for_update().select_related('driver').get(pk=trip.pk)
+        if trip.status not in RECOVERABLE_STATUSES:
+            raise RecoveryError(f"Trip {trip.route_plan_id} is {trip.status} and cannot be recovered")
+        students = {str(s.student_id): s for s in trip.student_list.all()}
+
+        failed_position = _live_position(trip.driver)
+        _, remaining = split_route(route_stops(trip, students.values()), failed_position)
+        pending = [stop for stop in remaining
+                   if stop['type'] == 'student' and stop.get('student_id') in students]
+
+        if not pending:
+            trip.status = 'cancelled'
+            trip.save(update_fields=['status', 'updated_at'])
+            return {'reassigned': 0, 'unplaced': 0, 'unplaced_students': [], 'trips': [],
+                    'elapsed': time.perf_counter() - started}
+
+        points = np.array([stop['coordinates'] for stop in pending], dtype=float)
+        origin = failed_position or points.mean(axis=0).tolist()
+
+        # Nearby trips in the same session with spare seats, closest bus first
+        candidates = list(
+            Trip.objects
+            .select_for_update(of=('self',))
+            .filter(trip_date=trip.trip_date, to_school=trip.to_school,
+                    status__in=RECOVERABLE_STATUSES)
+            .exclude(pk=trip.pk)
+            .select_related('driver')
+        )
+        seat_counts = dict(
+            Trip.student_list.through.objects
+            .filter(trip_id__in=[candidate.pk for candidate in candidates])
+            .values('trip_id')
+            .annotate(count=Count('id'))
+            .values_list('trip_id', 'count')
+        )
+        ranked = []
+        for candidate in candidates:
+            candidate.student_count = seat_counts.get(candidate.pk, 0)
+            if candidate.student_count >= MAX_STUDENTS_PER_TRIP:
+                continue
+            position = _live_position(candidate.driver)
+            anchor = position or settings.SCHOOL_COORDINATES
+            distance = float(haversine_km(anchor[0], anchor[1], origin[0], origin[1]))
+            ranked.append((distance, candidate, position))
+        ranked.sort(key=lambda item: item[0])
+
+        plans = []
+        for _, candidate, position in ranked[:MAX_CANDIDATE_TRIPS]:
+            candidate_students = list(candidate.student_list.all())
+            visited, ahead = split_route(route_stops(candidate, candidate_students), position)
+            # The route still to be driven starts at the bus itself
+            start = {'type': 'bus', 'coordinates': position} if position else visited[-1]
+            route = [start] + ahead
+            if len(route) < 2:
+                # Bus is past its last stop - it can still go back via the school
+                route.append({'type': 'end', 'coordinates': settings.SCHOOL_COORDINATES,
+                              'location': 'school'})
+            plans.append({
+                'trip': candidate,
+                'visited': visited,
+                'route': route,
+                'coords': np.array([stop['coordinates'] for stop in route], dtype=float),
+                'capacity': MAX_STUDENTS_PER_TRIP - candidate.student_count,
+                'added': [],
+                'added_km': 0.0,
+            })
+
+        # Cheapest insertion: repeatedly take the globally smallest detour
+        unassigned = np.ones(len(pending), dtype=bool)
+        costs = [insertion_costs(plan['coords'], points) for plan in plans]
+        while unassigned.any():
+            best = None
+            for index, plan in enumerate(plans):
+                if plan['capacity'] <= 0:
+                    continue
+                masked = np.where(unassigned[:, None], costs[index], np.inf)
+                flat = int(masked.argmin())
+                stop_index, gap = divmod(flat, masked.shape[1])
+                cost = masked[stop_index, gap]
+                if np.isfinite(cost) and (best is None or cost < best[0]):
+                    best = (cost, index, stop_index, gap)
+            if best is None:
+                break
+
+            cost, index, stop_index, gap = best
+            plan = plans[index]
+            stop = pending[stop_index]
+            plan['route'].insert(gap + 1, stop)
+            plan['coords'] = np.insert(plan['coords'], gap + 1, points[stop_index], axis=0)
+            plan['capacity'] -= 1
+            plan['added'].append(stop)
+            plan['added_km'] += float(cost)
+            unassigned[stop_index] = False
+            costs[index] = insertion_costs(plan['coords'], points)
+
+        # Persist only the trips that received stops
+        affected = []
+        moved_ids = []
+        for plan in plans:
+            if not plan['added']:
+                continue
+            candidate = plan['trip']
+            ahead = [stop for stop in plan['route'] if stop['type'] != 'bus']
+            if plan['route'][0]['type'] != 'bus':
+                ahead = ahead[1:]  # First entry is the last visited stop
+            route_data = dict(candidate.route_order or {})
+            route_data['stops'] = plan['visited'] + ahead
+            route_data['total_distance'] = route_data.get('total_distance', 0) + plan['added_km']
+            route_data['replanned_at'] = timezone.now().isoformat()
+            candidate.route_order = route_data
+            candidate.total_distance = (candidate.total_distance or 0) + plan['added_km']
+            candidate.save(update_fields=['route_order', 'total_distance', 'updated_at'])
+
+            added_ids = [stop['student_id'] for stop in plan['added']]
+            candidate.student_list.add(*[students[student_id] for student_id in added_ids])
+            moved_ids.extend(added_ids)
+            affected.append(candidate)
+
+        unplaced_ids = [stop['student_id'] for stop, left in zip(pending, unassigned) if left]
+        # Students still waiting for the failed bus are not on it any more, placed or not
+        trip.student_list.remove(*[students[student_id] for student_id in moved_ids + unplaced_ids])
+        trip.status = 'cancelled'
+        trip.save(update_fields=['status', 'updated_at'])
+
+        unplaced = len(unplaced_ids)
+
+        # Written to the outbox in this transaction, so they go out only if the plan is saved
+        for plan in plans:
+            if plan['added']:
+                names = ', '.join(stop.get('student_name', '') for stop in plan['added'])
+                notify_drivers(
+                    [plan['trip'].driver],
+                    f"{len(plan['added'])} extra stops added to your route: {names}",
+                    {'trip_id': str(plan['trip'].route_plan_id), 'stops': plan['added']},
+                    kind='stops_added',
+                )
+        notify_drivers(
+            [trip.driver],
+            f"Trip cancelled. {len(moved_ids)} students moved to other buses"
+            + (f", {unplaced} still need a bus" if unplaced else ""),
+            {'trip_id': str(trip.route_plan_id), 'unplaced': unplaced_ids},
+            kind='trip_cancelled',
+        )
+        notify_guardians(
+            unplaced_ids, 'trip_cancelled',
+            "The bus broke down and no other bus has a seat free; the school will arrange transport",
+            {'trip_id': str(trip.route_plan_id)},
+            dedupe_key=f'{trip.route_plan_id}:cancelled',
+        )
+
+    elapsed = time.perf_counter() - started
+    if elapsed > RECOVERY_TIME_BUDGET:
+        logger.warning(f"Recovery of trip {trip.route_plan_id} took {elapsed:.2f}s")
+    logger.info(f"Recovered trip {trip.route_plan_id}: {len(moved_ids)} students moved to "
+                f"{len(affected)} trips, {unplaced} unplaced ({elapsed * 1000:.0f}ms)")
+
+    return {
+        'reassigned': len(moved_ids),
+        'unplaced': unplaced,
+        'unplaced_students': unplaced_ids,
+        'trips': affected,
+        'elapsed': elapsed,
+    }
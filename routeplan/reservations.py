@@ -0,0 +1,134 @@
+"""
+Driver reservations for planning runs.
+
+Planners claim drivers by inserting DriverReservation rows inside their
+transaction. The (driver, trip_date, to_school) unique key decides which
+run gets a driver: an insert that conflicts with another run's reservation
+is skipped. Driver rows are never locked, so runs planning different dates
+or directions do not touch the same rows at all.
+
+Runs planning the same session replace each other's trips, so they are
+serialized with lock_session(): a second run waits until the first
+commits and then re-plans on top of its trips instead of next to them.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+
+from drivers.models import Driver
+from .models import DriverReservation, Trip
+
+
+# First key of the session advisory locks, so they do not collide with other users of pg_advisory locks
+SESSION_LOCK_NAMESPACE = 0x52504C4E
+
+
+def lock_session(date, to_school):
+    """
+    Hold the planning lock of a date and direction until the current
+    transaction ends; waits while another run holds it.
+
+    Args:
+        date (datetime.date): Date being planned
+        to_school (bool): Direction being planned
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("lock_session() must run inside a transaction")
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                       [SESSION_LOCK_NAMESPACE, date.toordinal() * 2 + int(to_school)])
+
+
+def reserve_drivers(date, to_school, planning_run, limit=None):
+    """
+    Reserve available drivers not yet held by another run.
+    Must be called inside transaction.atomic(); the reservations become
+    visible to other runs when the planning transaction commits.
+
+    Args:
+        date (datetime.date): Date being planned
+        to_school (bool): Direction being planned
+        planning_run (uuid.UUID): Identifier of the calling planning run
+        limit (int): Reserve at most this many drivers (default all)
+
+    Returns:
+        List of drivers reserved for this run
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("reserve_drivers() must run inside a transaction")
+
+    held_elsewhere = (
+        DriverReservation.objects
+        .filter(trip_date=date, to_school=to_school)
+        .exclude(planning_run=planning_run)
+        .values('driver_id')
+    )
+    candidates = list(
+        Driver.objects
+        .filter(status='available', is_active=True)
+        .exclude(driver_id__in=held_elsewhere)
+    )
+
+    reserved = []
+    while candidates and (limit is None or len(reserved) < limit):
+        batch = candidates if limit is None else candidates[:limit - len(reserved)]
+        candidates = candidates[len(batch):]
+        # A run that committed after our read may own some of these; its rows win
+        DriverReservation.objects.bulk_create(
+            [
+                DriverReservation(driver=driver, trip_date=date, to_school=to_school,
+                                  planning_run=planning_run)
+                for driver in batch
+            ],
+            ignore_conflicts=True,
+        )
+        owned = set(
+            DriverReservation.objects
+            .filter(trip_date=date, to_school=to_school, planning_run=planning_run,
+                    driver__in=batch)
+            .values_list('driver_id', flat=True)
+        )
+        reserved.extend(driver for driver in batch if driver.pk in owned)
+    return reserved
+
+
+def release_drivers(date, to_school, planning_run, keep=()):
+    """
+    Release a planning run's driver reservations for a date and direction.
+
+    Args:
+        date (datetime.date): Planned date
+        to_school (bool): Planned direction
+        planning_run (uuid.UUID): Run whose reservations are released
+        keep: Drivers whose reservations should be kept
+
+    Returns:
+        Number of reservations released
+    """
+    reservations = DriverReservation.objects.filter(trip_date=date, to_school=to_school,
+                                                     planning_run=planning_run)
+    if keep:
+        reservations = reservations.exclude(driver__in=keep)
+    deleted, _ = reservations.delete()
+    return deleted
+
+
+def release_current_plan(date, to_school):
+    """
+    Release the reservations held by the runs that created the current
+    trips of a date and direction, before they are re-planned. Other runs'
+    reservations are left alone.
+
+    Returns:
+        Number of reservations released
+    """
+    trips = Trip.objects.filter(trip_date=date, to_school=to_school)
+    runs = trips.filter(planning_run__isnull=False).values('planning_run')
+    # Trips planned before runs were recorded on them: release by their drivers
+    unrecorded = trips.filter(planning_run__isnull=True, driver__isnull=False).values('driver_id')
+    deleted, _ = (
+        DriverReservation.objects
+        .filter(trip_date=date, to_school=to_school)
+        .filter(Q(planning_run__in=runs) | Q(driver_id__in=unrecorded))
+        .delete()
+    )
+    return deleted
@@ -0,0 +1,76 @@
+"""
+Helpers for working with the ordered stops stored in Trip.route_order.
+"""
+from django.conf import settings
+
+from core.geo import haversine_km, locate_on_polyline
+
+
+def route_stops(trip, students):
+    """
+    Return the trip's stops in driving order as a list of dicts.
+    Falls back to school -> students -> school when the trip has not been optimized.
+    """
+    school = {'type': 'start', 'coordinates': settings.SCHOOL_COORDINATES, 'location': 'school'}
+    route_data = trip.route_order or {}
+    stops = route_data.get('stops')
+
+    if not stops:
+        stops = [school]
+        for student in students:
+            if student.coordinates:
+                stops.append({
+                    'type': 'student',
+                    'coordinates': [student.coordinates.x, student.coordinates.y],
+                    'student_name': student.name,
+                    'student_id': str(student.student_id),
+                })
+        stops.append(dict(school, type='end'))
+        return stops
+
+    # Older route orders only stored coordinates - match them back to students
+    by_coords = {
+        (s.coordinates.x, s.coordinates.y): s for s in students if s.coordinates
+    }
+    stops = [dict(stop) for stop in stops]
+    for stop in stops:
+        if stop['type'] == 'student' and 'student_id' not in stop:
+            student = by_coords.get(tuple(stop['coordinates']))
+            if student:
+                stop['student_id'] = str(student.student_id)
+    return stops
+
+
+def split_route(stops, position):
+    """
+    Split a route at the bus's current position.
+
+    Returns:
+        Tuple of (visited stops, remaining stops). Stops up to and including
+        the start of the segment the bus is on count as visited.
+    """
+    if position is None or len(stops) < 2:
+        return stops[:1], stops[1:]
+
+    segment, _, _ = locate_on_polyline([stop['coordinates'] for stop in stops], position)
+    return stops[:segment + 1], stops[segment + 1:]
+
+
+def insertion_costs(route, points):
+    """
+    Cost in km of inserting each point into each gap of the route.
+
+    Args:
+        route: numpy array (n, 2) of the route still to be driven
+        points: numpy array (m, 2) of stops to insert
+
+    Returns:
+        numpy array (m, n - 1); entry [i, j] is the detour for inserting
+        point i between route[j] and route[j + 1]
+    """
+    a = route[:-1]
+    b = route[1:]
+    base = haversine_km(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+    to_point = haversine_km(a[None, :, 0], a[None, :, 1], points[:, None, 0], points[:, None, 1])
+    from_point = haversine_km(points[:, None, 0], points[:, None, 1], b[None, :, 0], b[None, :, 1])
+    return to_point + from_point - base[None, :]
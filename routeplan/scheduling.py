@@ -0,0 +1,128 @@
+"""
+Multi-wave trip scheduling.
+
+A driver can run several trips (waves) in the same session. Routes are
+packed onto as few buses as possible without a driver's session exceeding
+the time budget. Morning waves are timed backwards from the school arrival
+deadline, afternoon waves forwards from dismissal.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+
+from core.geo import haversine_km
+
+# Road distance is longer than the straight line between stops
+ROAD_DETOUR_FACTOR = 1.3
+
+
+def parse_time(value):
+    """Accept either a datetime.time or an 'HH:MM' string from settings"""
+    if isinstance(value, time):
+        return value
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def estimate_route_duration(coords):
+    """
+    Estimate how long a school -> stops -> school loop takes, in seconds.
+    Uses a nearest-neighbour tour, so it is only meant for scheduling
+    before the route has been optimized.
+
+    Args:
+        coords: Array-like of shape (n, 2) with [longitude, latitude] stops
+    """
+    remaining = np.asarray(coords, dtype=float)
+    current = np.asarray(settings.SCHOOL_COORDINATES, dtype=float)
+    distance = 0.0
+
+    while len(remaining):
+        legs = haversine_km(current[0], current[1], remaining[:, 0], remaining[:, 1])
+        nearest = int(legs.argmin())
+        distance += float(legs[nearest])
+        current = remaining[nearest]
+        remaining = np.delete(remaining, nearest, axis=0)
+
+    school = settings.SCHOOL_COORDINATES
+    distance += float(haversine_km(current[0], current[1], school[0], school[1]))
+
+    driving = distance * ROAD_DETOUR_FACTOR / settings.BUS_AVERAGE_SPEED_KMH * 3600
+    return driving + len(coords) * settings.STOP_DWELL_SECONDS
+
+
+def schedule_waves(durations, drivers, date, to_school):
+    """
+    Assign routes to drivers as chained waves.
+
+    Routes are placed longest first onto the busiest driver that can still
+    fit them within the session time budget (best-fit decreasing), so a new
+    bus is only brought in when no scheduled bus has room left. A route
+    longer than the budget on its own gets a bus to itself.
+
+    Args:
+        durations: List of route durations in seconds, indexed by route
+        drivers: List of available drivers, in order of preference
+        date (datetime.date): Date of the trips
+        to_school (bool): Direction of the trips
+
+    Returns:
+        Tuple of (assignments, unassigned). Each assignment is a dict with
+        'route', 'driver', 'wave', 'start_time' and 'end_time'; unassigned
+        is a list of route indexes left over when every driver is scheduled.
+    """
+    budget = settings.WAVE_TIME_BUDGET_MINUTES * 60
+    turnaround = settings.WAVE_TURNAROUND_MINUTES * 60
+
+    # Each entry holds a driver's routes and how much of the budget they use
+    schedules = []
+    unassigned = []
+    unused_drivers = list(drivers)
+
+    for route in sorted(range(len(durations)), key=lambda r: durations[r], reverse=True):
+        duration = durations[route]
+        best = None
+        for schedule in schedules:
+            needed = schedule['used'] + turnaround + duration
+            if needed <= budget and (best is None or needed > best[0]):
+                best = (needed, schedule)
+
+        if best:
+            best[1]['used'] = best[0]
+            best[1]['routes'].append(route)
+        elif unused_drivers:
+            # A route longer than the budget still gets a bus, which then runs only that route
+            schedules.append({'driver': unused_drivers.pop(0), 'used': duration, 'routes': [route]})
+        else:
+            unassigned.append(route)
+
+    assignments = []
+    for schedule in schedules:
+        if to_school:
+            # Last wave arrives at the deadline; earlier waves are timed backwards
+            end = datetime.combine(date, parse_time(settings.SCHOOL_START_TIME))
+            timed = []
+            for route in reversed(schedule['routes']):
+                start = end - timedelta(seconds=durations[route])
+                timed.append((route, start, end))
+                end = start - timedelta(seconds=turnaround)
+            timed.reverse()
+        else:
+            # First wave leaves at dismissal; later waves follow once the bus is back
+            start = datetime.combine(date, parse_time(settings.SCHOOL_END_TIME))
+            timed = []
+            for route in schedule['routes']:
+                end = start + timedelta(seconds=durations[route])
+                timed.append((route, start, end))
+                start = end + timedelta(seconds=turnaround)
+
+        for wave, (route, start, end) in enumerate(timed, start=1):
+            assignments.append({
+                'route': route,
+                'driver': schedule['driver'],
+                'wave': wave,
+                'start_time': start.time().replace(microsecond=0),
+                'end_time': end.time().replace(microsecond=0),
+            })
+
+    return assignments, unassigned
@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import Trip
+from . import student_trips
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def invalidate_student_trips(sender, instance, **kwargs):
+    """A trip was planned, changed or removed - its date's student -> trip lookup is out of date"""
+    date = instance.trip_date
+    transaction.on_commit(lambda: student_trips.invalidate(date))
+
+@receiver(m2m_changed, sender=Trip.student_list.through)
+def invalidate_student_trips_for_roster(sender, instance, action, pk_set, **kwargs):
+    """Students were added to or removed from a trip"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, Trip):
+        dates = {instance.trip_date}
+    elif action == 'pre_clear':
+        # Changed from the student side; a clear has to be looked at before it happens
+        dates = set(instance.trip_assignments.values_list('trip_date', flat=True))
+    else:
+        dates = set(Trip.objects.filter(pk__in=pk_set).values_list('trip_date', flat=True))
+    for date in dates:
+        transaction.on_commit(lambda date=date: student_trips.invalidate(date))
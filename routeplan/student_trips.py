@@ -0,0 +1,137 @@
+"""
+Per-day student -> trip lookup.
+
+The trips of every student on a date, with the driver and bus of each, are
+kept in the Django cache under one key per student, so a guardian's app
+finds the student's bus with a single cache read instead of walking
+Trip.student_list, the trip and the driver. The whole date is built with
+one query on first use and dropped (by bumping the date's generation)
+whenever a trip of that date or its student list changes; see
+routeplan.signals.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+from core import singleflight
+from .models import Trip
+
+# Entries are rebuilt at least this often even without changes
+CACHE_TIMEOUT = 60 * 10
+
+# Trip fields in an entry, read with one query
+FIELDS = ['route_plan_id', 'to_school', 'start_time', 'end_time', 'status',
+          'driver_id', 'driver__name', 'driver__bus_no']
+
+
+def _entry(values):
+    """Cached form of a trip from the FIELDS of a row"""
+    trip_id, to_school, start, end, status, driver_id, driver_name, bus_no = values
+    return {
+        'trip_id': str(trip_id),
+        'to_school': to_school,
+        'start_time': start.isoformat(),
+        'end_time': end.isoformat(),
+        'status': status,
+        'driver_id': str(driver_id) if driver_id else None,
+        'driver_name': driver_name,
+        'bus_no': bus_no,
+    }
+
+
+def describe(trip_id):
+    """
+    A single trip in the form of trips_for_student() entries.
+
+    Returns:
+        dict, or None for an unknown trip
+    """
+    values = Trip.objects.filter(route_plan_id=trip_id).values_list(*FIELDS).first()
+    return _entry(values) if values else None
+
+
+def _generation_key(date):
+    return f'routeplan:student_trips:generation:{date.isoformat()}'
+
+
+def _key(date, generation, student_id):
+    return f'routeplan:student_trips:{date.isoformat()}:{generation}:{student_id}'
+
+
+def _built_key(date, generation):
+    return f'routeplan:student_trips:{date.isoformat()}:{generation}:built'
+
+
+def build(date, generation=None):
+    """
+    Cache the trips of every student on a date.
+
+    Returns:
+        dict mapping student ID (str) to the list of their trips
+    """
+    if generation is None:
+        generation = cache.get_or_set(_generation_key(date), 1, timeout=None)
+
+    rows = (
+        Trip.student_list.through.objects
+        .filter(trip__trip_date=date)
+        .order_by('trip__start_time')
+        .values_list('student_id', *[f'trip__{field}' for field in FIELDS])
+    )
+    trips = {}
+    for student_id, *values in rows:
+        trips.setdefault(str(student_id), []).append(_entry(values))
+
+    entries = {_key(date, generation, student_id): value for student_id, value in trips.items()}
+    entries[_built_key(date, generation)] = True
+    cache.set_many(entries, CACHE_TIMEOUT)
+    return trips
+
+
+def trips_for_student(student_id, date=None):
+    """
+    Trips of a student on a date (default today), ordered by start time.
+
+    Returns:
+        List of dicts with trip_id, to_school, start_time, end_time, status,
+        driver_id, driver_name and bus_no
+    """
+    date = date or timezone.localdate()
+    generation = cache.get_or_set(_generation_key(date), 1, timeout=None)
+    key = _key(date, generation, student_id)
+    built = _built_key(date, generation)
+    found = cache.get_many([key, built])
+    if key in found:
+        return found[key]
+    if built in found:
+        # The date is cached and the student has no trips
+        return []
+    # The first guardians after an invalidation all miss; only one of them rebuilds
+    trips = singleflight.do('student_trips', (date, generation), lambda: build(date, generation))
+    return trips.get(str(student_id), [])
+
+
+def current_trip(trips):
+    """
+    The trip a student's guardian is interested in now: the one being
+    driven, else the next one still to start.
+
+    Returns:
+        Trip dict from trips_for_student(), or None when all are over
+    """
+    upcoming = None
+    for trip in trips:
+        if trip['status'] == 'active':
+            return trip
+        if trip['status'] == 'pending' and upcoming is None:
+            upcoming = trip
+    return upcoming
+
+
+def invalidate(date):
+    """Drop the cached trips of a date"""
+    key = _generation_key(date)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Nothing was cached for the date
+        pass
@@ -1,3 +1,269 @@
-from django.test import TestCase
+import uuid
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from attendance.models import Attendance
+
+from core.models import Notification
+from drivers.models import Driver
+from students.models import Student
+from . import breadcrumbs
+from .incremental import WATERMARK_OVERLAP, apply_attendance_changes, reconcile_plan
+from .management.commands.run_planner import Command as PlannerCommand
+from .models import DriverReservation, Trip, TripBreadcrumb
+from .recovery import RecoveryError, recover_trip
+from .reservations import lock_session, release_current_plan, release_drivers, reserve_drivers
+from .scheduling import schedule_waves
+
+DAY = date(2025, 3, 3)
+
+
+@override_settings(WAVE_TIME_BUDGET_MINUTES=90, WAVE_TURNAROUND_MINUTES=10,
+                   SCHOOL_START_TIME='08:30', SCHOOL_END_TIME='15:30')
+class ScheduleWavesTests(SimpleTestCase):
+    def test_short_routes_share_a_bus(self):
+        assignments, unassigned = schedule_waves([30 * 60, 40 * 60], ['a', 'b'], DAY, True)
+        self.assertEqual(unassigned, [])
+        self.assertEqual({assignment['driver'] for assignment in assignments}, {'a'})
+        self.assertEqual(sorted(assignment['wave'] for assignment in assignments), [1, 2])
+
+    def test_morning_waves_end_at_school_start(self):
+        assignments, _ = schedule_waves([30 * 60, 40 * 60], ['a'], DAY, True)
+        first, last = sorted(assignments, key=lambda assignment: assignment['wave'])
+        self.assertEqual(last['end_time'], time(8, 30))
+        # The bus turns around for 10 minutes between waves
+        self.assertEqual(last['start_time'], time(8, 0))
+        self.assertEqual(first['end_time'], time(7, 50))
+        self.assertEqual(first['start_time'], time(7, 10))
+
+    def test_afternoon_waves_start_at_dismissal(self):
+        assignments, _ = schedule_waves([30 * 60, 40 * 60], ['a'], DAY, False)
+        first, last = sorted(assignments, key=lambda assignment: assignment['wave'])
+        self.assertEqual(first['start_time'], time(15, 30))
+        self.assertEqual(first['end_time'], time(16, 10))
+        self.assertEqual(last['start_time'], time(16, 20))
+
+    def test_routes_over_budget_get_their_own_bus(self):
+        assignments, unassigned = schedule_waves([120 * 60, 20 * 60], ['a', 'b'], DAY, True)
+        self.assertEqual(unassigned, [])
+        drivers = {assignment['route']: assignment['driver'] for assignment in assignments}
+        self.assertNotEqual(drivers[0], drivers[1])
+
+    def test_routes_left_over_without_drivers(self):
+        assignments, unassigned = schedule_waves([80 * 60, 80 * 60, 80 * 60], ['a', 'b'], DAY, True)
+        self.assertEqual(len(assignments), 2)
+        self.assertEqual(len(unassigned), 1)
+
+    def test_no_driver_exceeds_budget_with_several_routes(self):
+        durations = [25 * 60, 35 * 60, 45 * 60, 20 * 60, 50 * 60, 15 * 60]
+        assignments, unassigned = schedule_waves(durations, list('abcdef'), DAY, False)
+        self.assertEqual(unassigned, [])
+        used = {}
+        for assignment in assignments:
+            used.setdefault(assignment['driver'], []).append(durations[assignment['route']])
+        for routes in used.values():
+            self.assertLessEqual(sum(routes) + 10 * 60 * (len(routes) - 1), 90 * 60)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.drivers = [
+            Driver.objects.create(name=f'Driver {i}', licence_no=f'L{i}', phone_number='0',
+                                  email=f'driver{i}@example.com', bus_no=f'B{i}')
+            for i in range(3)
+        ]
+
+    def test_runs_for_different_dates_get_every_driver(self):
+        first = reserve_drivers(DAY, True, uuid.uuid4())
+        second = reserve_drivers(date(2025, 3, 4), True, uuid.uuid4())
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 3)
+
+    def test_runs_for_the_same_session_get_disjoint_drivers(self):
+        first = reserve_drivers(DAY, True, uuid.uuid4(), limit=2)
+        second = reserve_drivers(DAY, True, uuid.uuid4())
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({driver.pk for driver in first} & {driver.pk for driver in second})
+
+    def test_unavailable_drivers_are_not_reserved(self):
+        Driver.objects.filter(pk=self.drivers[0].pk).update(status='on_leave')
+        reserved = reserve_drivers(DAY, True, uuid.uuid4())
+        self.assertNotIn(self.drivers[0].pk, {driver.pk for driver in reserved})
+
+    def test_release_keeps_drivers_in_use(self):
+        run = uuid.uuid4()
+        reserve_drivers(DAY, True, run)
+        self.assertEqual(release_drivers(DAY, True, run, keep=self.drivers[:1]), 2)
+        self.assertEqual(list(DriverReservation.objects.values_list('driver_id', flat=True)),
+                         [self.drivers[0].pk])
+
+    def test_release_current_plan_leaves_other_runs_alone(self):
+        planned, other = uuid.uuid4(), uuid.uuid4()
+        reserve_drivers(DAY, True, planned, limit=1)
+        reserve_drivers(DAY, True, other)
+        Trip.objects.create(trip_date=DAY, to_school=True, start_time=time(8), end_time=time(8, 30),
+                            driver=self.drivers[0], planning_run=planned)
+        self.assertEqual(release_current_plan(DAY, True), 1)
+        self.assertFalse(DriverReservation.objects.filter(planning_run=planned).exists())
+        self.assertEqual(DriverReservation.objects.filter(planning_run=other).count(), 2)
+
+    def test_session_lock_is_held_by_the_transaction(self):
+        # Re-entrant for the transaction holding it; other runs wait until it ends
+        lock_session(DAY, True)
+        lock_session(DAY, True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class RecoveryTests(TestCase):
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Driver', licence_no='L0', phone_number='0',
+                                            email='driver@example.com', bus_no='B0')
+        self.trip = self.make_trip(self.driver)
+        self.students = [
+            Student.objects.create(name=f'Student {i}', class_grade='5', address_text='-',
+                                   guardian_name='-', coordinates=Point(76.33 + i / 100, 10.05))
+            for i in range(3)
+        ]
+        self.trip.student_list.set(self.students)
+
+    def make_trip(self, driver):
+        return Trip.objects.create(trip_date=DAY, to_school=True, start_time=time(8),
+                                   end_time=time(8, 30), driver=driver)
+
+    def test_cancelled_trip_cannot_be_recovered(self):
+        Trip.objects.filter(pk=self.trip.pk).update(status='cancelled')
+        with self.assertRaises(RecoveryError):
+            recover_trip(self.trip)
+
+    def test_status_is_checked_on_the_locked_row(self):
+        # Another operator recovered the trip after this instance was loaded
+        stale = Trip.objects.get(pk=self.trip.pk)
+        recover_trip(self.trip)
+        self.assertEqual(stale.status, 'pending')
+        with self.assertRaises(RecoveryError):
+            recover_trip(stale)
+
+    def test_students_are_moved_to_a_nearby_trip(self):
+        other = self.make_trip(Driver.objects.create(name='Other', licence_no='L1', phone_number='0',
+                                                     email='other@example.com', bus_no='B1'))
+        result = recover_trip(self.trip)
+        self.assertEqual(result['reassigned'], 3)
+        self.assertEqual(result['unplaced_students'], [])
+        self.assertEqual(set(other.student_list.all()), set(self.students))
+        self.assertFalse(self.trip.student_list.exists())
+
+    def test_unplaced_students_leave_the_cancelled_trip(self):
+        result = recover_trip(self.trip)
+        self.assertEqual(result['unplaced'], 3)
+        self.assertEqual(set(result['unplaced_students']),
+                         {str(student.student_id) for student in self.students})
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.status, 'cancelled')
+        self.assertFalse(self.trip.student_list.exists())
+        self.assertEqual(
+            Notification.objects.filter(recipient_type='guardian', kind='trip_cancelled').count(), 3)
+
+
+class AttendanceChangesTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(name='Student', class_grade='5', address_text='-',
+                                              guardian_name='-', coordinates=Point(76.33, 10.05))
+        self.trips = [
+            Trip.objects.create(trip_date=DAY, to_school=to_school, start_time=time(8),
+                                end_time=time(8, 30))
+            for to_school in (True, False)
+        ]
+        for trip in self.trips:
+            trip.student_list.add(self.student)
+
+    def mark(self, presence, updated_at):
+        attendance = Attendance.objects.create(student=self.student, date=DAY, presence=presence)
+        Attendance.objects.filter(pk=attendance.pk).update(updated_at=updated_at)
+
+    def test_late_commit_within_the_overlap_is_applied(self):
+        since = timezone.now()
+        # Written before the watermark, committed after it was read
+        self.mark(False, since - WATERMARK_OVERLAP / 2)
+        changed, watermark = apply_attendance_changes(DAY, since)
+        self.assertEqual(changed, {trip.pk for trip in self.trips})
+        self.assertEqual(watermark, since)
+        self.assertFalse(Trip.student_list.through.objects.filter(student=self.student).exists())
+
+    def test_changes_already_in_the_plan_are_skipped(self):
+        since = timezone.now() - timedelta(minutes=1)
+        self.mark(True, since + timedelta(seconds=30))
+        changed, watermark = apply_attendance_changes(DAY, since)
+        self.assertEqual(changed, set())
+        self.assertEqual(watermark, since + timedelta(seconds=30))
+
+    @override_settings(ATTENDANCE_MODE='full')
+    def test_incomplete_register_keeps_unrecorded_students(self):
+        recorded = Student.objects.create(name='Recorded', class_grade='5', address_text='-',
+                                          guardian_name='-', coordinates=Point(76.34, 10.05))
+        self.trips[0].student_list.add(recorded)
+        Attendance.objects.create(student=recorded, date=DAY, presence=False)
+        reconcile_plan(DAY, complete=False)
+        self.assertEqual(list(self.trips[0].student_list.all()), [self.student])
+
+    def test_planner_resumes_plans_after_a_restart(self):
+        Trip.objects.filter(pk=self.trips[0].pk).update(provisional=True)
+        planner = PlannerCommand()
+        planner.planned, planner.provisional = {}, set()
+        planner.resume(DAY)
+        self.assertEqual(planner.planned, {DAY: min(trip.created_at for trip in self.trips)})
+        self.assertEqual(planner.provisional, {DAY})
+
+
+class BreadcrumbFlushTests(TransactionTestCase):
+    def setUp(self):
+        self.trips = [
+            Trip.objects.create(trip_date=DAY, to_school=True, start_time=time(8), end_time=time(8, 30), wave=wave)
+            for wave in (1, 2)
+        ]
+        self.addCleanup(breadcrumbs._buffer.clear)
+
+    def buffer(self, trip, timestamp):
+        breadcrumbs._buffer.append(breadcrumbs.build(trip.pk, 76.33, 10.05, timestamp))
+
+    def test_points_of_a_deleted_trip_are_dropped(self):
+        now = timezone.now().timestamp()
+        for trip in self.trips:
+            self.buffer(trip, now)
+        self.trips[1].delete()
+        self.assertEqual(breadcrumbs.flush(), 1)
+        self.assertEqual(list(TripBreadcrumb.objects.values_list('trip_id', flat=True)), [self.trips[0].pk])
+        self.assertEqual(breadcrumbs._buffer, [])
+
+
+class CompactTests(TestCase):
+    def setUp(self):
+        self.trip = Trip.objects.create(trip_date=DAY, to_school=True, start_time=time(8), end_time=time(8, 30))
+        self.started = timezone.now().timestamp()
+
+    def drive(self, points):
+        breadcrumbs.insert([breadcrumbs.build(self.trip.pk, longitude, latitude, self.started + i)
+                            for i, (longitude, latitude) in enumerate(points)])
+
+    def test_straight_drive_keeps_its_ends(self):
+        # About 10 m apart with sub-meter jitter
+        self.drive([(76.33 + i / 10_000, 10.05 + (i % 2) / 1_000_000) for i in range(20)])
+        self.assertEqual(breadcrumbs.compact(self.trip.pk, tolerance=5), (20, 2))
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.path.coords[0], (76.33, 10.05))
+
+    def test_turns_wider_than_the_tolerance_are_kept(self):
+        self.drive([(76.33, 10.05), (76.335, 10.05), (76.335, 10.055)])
+        self.assertEqual(breadcrumbs.compact(self.trip.pk, tolerance=5), (3, 3))
+
+    def test_one_point_makes_no_path(self):
+        self.drive([(76.33, 10.05)])
+        self.assertEqual(breadcrumbs.compact(self.trip.pk), (1, 0))
+        self.trip.refresh_from_db()
+        self.assertIsNone(self.trip.path)
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('export/', views.TripRosterExportView.as_view(), name='trip-roster-export'),
+]
@@ -1,3 +1,15 @@
-from django.shortcuts import render
+from rest_framework import generics
+from rest_framework.permissions import IsAdminUser
+from core.export import export_params, streaming_export
+from .exports import FIELDS as EXPORT_FIELDS, roster_rows
 
-# Create your views here.
+class TripRosterExportView(generics.GenericAPIView):
+    """
+    Stream the student roster of every trip in a month or date range
+    as CSV or NDJSON. Only accessible to admins.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        start, end, fmt = export_params(request)
+        return streaming_export(request, roster_rows(start, end), EXPORT_FIELDS, fmt, f"trip_rosters_{start}_{end}")
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import argparse
+import django
+
+# Set up Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+import numpy as np
+from django.conf import settings
+from core.geo import haversine_km, KM_PER_DEGREE
+from live_tracking.spatial import GridIndex
+
+def random_points(rng, count, center, radius_km):
+    """[lon, lat] points spread uniformly over a square around center"""
+    lat_spread = radius_km / KM_PER_DEGREE
+    lon_spread = lat_spread / np.cos(np.radians(center[1]))
+    return np.column_stack((
+        center[0] + rng.uniform(-lon_spread, lon_spread, count),
+        center[1] + rng.uniform(-lat_spread, lat_spread, count),
+    ))
+
+def brute_force(points, longitude, latitude, k):
+    """The k closest points by computing every distance"""
+    distances = haversine_km(longitude, latitude, points[:, 0], points[:, 1])
+    closest = np.argpartition(distances, k - 1)[:k] if k < len(points) else np.arange(len(points))
+    return sorted((float(distances[i]), int(i)) for i in closest)
+
+def microseconds(seconds, count):
+    return seconds / count * 1e6
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    center = settings.SCHOOL_COORDINATES
+    points = random_points(rng, args.buses, center, args.radius)
+    queries = random_points(rng, args.queries, center, args.radius)
+    moves = random_points(rng, args.pings, center, args.radius)
+
+    index = GridIndex(center[1], args.cell)
+    started = time.perf_counter()
+    for i, (longitude, latitude) in enumerate(points):
+        index.update(i, longitude, latitude)
+    load = time.perf_counter() - started
+
+    # Pings move random buses to new positions
+    movers = rng.integers(0, args.buses, args.pings)
+    started = time.perf_counter()
+    for i, (longitude, latitude) in zip(movers, moves):
+        index.update(int(i), longitude, latitude)
+        points[i] = (longitude, latitude)
+    updates = time.perf_counter() - started
+
+    started = time.perf_counter()
+    grid_results = [index.nearest(longitude, latitude, args.k) for longitude, latitude in queries]
+    grid = time.perf_counter() - started
+
+    started = time.perf_counter()
+    exact_results = [brute_force(points, longitude, latitude, args.k) for longitude, latitude in queries]
+    exact = time.perf_counter() - started
+
+    mismatches = sum(
+        1 for found, expected in zip(grid_results, exact_results)
+        if [key for _, key in found] != [key for _, key in expected]
+        and not np.allclose([d for d, _ in found], [d for d, _ in expected])
+    )
+
+    print(f"{args.buses} buses within {args.radius:g} km, {args.cell:g} km cells, k={args.k}")
+    print(f"Index load:            {microseconds(load, args.buses):.2f} us per bus")
+    print(f"Ping update:           {microseconds(updates, args.pings):.2f} us per ping")
+    print(f"Nearest (grid):        {microseconds(grid, args.queries):.1f} us per query")
+    print(f"Nearest (brute force): {microseconds(exact, args.queries):.1f} us per query")
+    print(f"Speed-up:              {exact / grid:.1f}x")
+    print(f"Mismatched queries:    {mismatches}/{args.queries}")
+    return mismatches
+
+if __name__ == "__main__":
+    # Synthetic positions only; nothing is read from or written to the database
+    parser = argparse.ArgumentParser(description="Benchmark nearest-bus queries on the live position grid")
+    parser.add_argument('--buses', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--pings', type=int, default=100000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--radius', type=float, default=25.0, help='Half-width in km of the area buses are spread over')
+    parser.add_argument('--cell', type=float, default=1.0, help='Grid cell edge in km')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.exit(1 if run(args) else 0)
@@ -6,6 +6,7 @@ from sklearn.cluster import KMeans
 from datetime import datetime
 import math
 import logging
+import uuid
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,13 +17,16 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
 from students.models import Student
-from routeplan.models import Trip
+from routeplan.models import Trip, MAX_STUDENTS_PER_TRIP
 from drivers.models import Driver
-from attendance.models import Attendance
+from attendance import presence_cache
+from attendance.forecast import predicted_present_ids
+from routeplan.scheduling import estimate_route_duration, schedule_waves
+from routeplan.reservations import lock_session, reserve_drivers, release_drivers, release_current_plan
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
-MAX_STUDENTS_PER_TRIP = 40
-
 def get_student_coordinates(students):
     """
     Extract coordinates from student objects
@@ -44,7 +48,7 @@ def get_student_coordinates(students):
     
     return np.array(coords), coord_to_student
 
-def optimize_routes(date, direction='to_school'):
+def optimize_routes(date, direction='to_school', forecast=False):
     """
     Optimize routes for a specific date using K-means clustering.
     Only includes students who are marked present for that date.
@@ -53,16 +57,23 @@ def optimize_routes(date, direction='to_school'):
     Args:
         date (datetime.date): Date to optimize routes for
         direction (str): 'to_school' or 'from_school'
+        forecast (bool): Plan with the students predicted to be present instead
+            of recorded attendance. Trips are marked provisional.
     """
     logging.info(f"Optimizing routes for {date} ({direction})...")
     
     try:
-        # Get all students who are marked present for this date
-        present_students = Student.objects.filter(
-            attendance_records__date=date,
-            attendance_records__presence=True,
-            coordinates__isnull=False  # Only include students with coordinates
-        ).distinct()
+        if forecast:
+            # Attendance is not known yet - plan with the students expected to come
+            active_students = Student.objects.filter(is_active=True, coordinates__isnull=False)
+            expected_ids = predicted_present_ids(date, active_students.values_list('student_id', flat=True))
+            present_students = active_students.filter(student_id__in=expected_ids)
+        else:
+            # Get all students who are marked present for this date
+            present_students = Student.objects.filter(
+                student_id__in=presence_cache.present_ids(date),
+                coordinates__isnull=False  # Only include students with coordinates
+            )
         
         total_students = present_students.count()
         if not total_students:
@@ -75,13 +86,6 @@ def optimize_routes(date, direction='to_school'):
         num_clusters = (total_students + MAX_STUDENTS_PER_TRIP - 1) // MAX_STUDENTS_PER_TRIP
         logging.info(f"Creating {num_clusters} optimized routes")
         
-        # Get available drivers
-        available_drivers = list(Driver.objects.filter(status='available', is_active=True))
-        if len(available_drivers) < num_clusters:
-            logging.warning(f"Warning: Need {num_clusters} drivers but only {len(available_drivers)} available")
-            num_clusters = len(available_drivers)
-            logging.info(f"Reducing to {num_clusters} routes due to driver availability")
-        
         # Get coordinates for clustering
         coords, coord_to_student = get_student_coordinates(present_students)
         
@@ -112,38 +116,86 @@ def optimize_routes(date, direction='to_school'):
             if end_idx >= len(all_students):
                 break
         
-        # Delete existing trips for this date and direction
-        Trip.objects.filter(trip_date=date, to_school=direction=='to_school').delete()
+        # Drop empty clusters so route indexes line up with the schedule
+        balanced_clusters = [students for students in balanced_clusters if students]
         
-        # Create new optimized trips
-        for cluster_id, cluster_students in enumerate(balanced_clusters):
-            if not cluster_students:
-                continue
-                
-            driver = available_drivers[cluster_id]
-            
-            # Calculate cluster center
-            cluster_coords = np.array([(s.coordinates.x, s.coordinates.y) for s in cluster_students])
-            center = cluster_coords.mean(axis=0)
+        to_school = direction == 'to_school'
+        
+        # Reserve drivers, schedule and write trips in one transaction so
+        # parallel planning runs never hand out the same driver
+        with transaction.atomic():
+            # A concurrent run for this session would keep its trips next to ours
+            lock_session(date, to_school)
+            # Re-planning replaces the previous plan for this session, including its reservations
+            release_current_plan(date, to_school)
+            planning_run = uuid.uuid4()
+            # A bus runs at least one route, so no run needs more drivers than routes
+            available_drivers = reserve_drivers(date, to_school, planning_run, limit=len(balanced_clusters))
+            if not available_drivers:
+                # Roll back so the current plan keeps its trips and its reservations
+                raise RuntimeError("No drivers available - all are reserved by other planning runs or unavailable")
             
-            # Create new trip
-            trip = Trip.objects.create(
-                trip_date=date,
-                to_school=(direction == 'to_school'),
-                start_time='07:30:00' if direction == 'to_school' else '15:30:00',
-                end_time='08:30:00' if direction == 'to_school' else '16:30:00',
-                status='pending',
-                driver=driver
+            # Chain clusters into waves so one bus can serve several routes
+            durations = [
+                estimate_route_duration([(s.coordinates.x, s.coordinates.y) for s in cluster_students])
+                for cluster_students in balanced_clusters
+            ]
+            assignments, unassigned = schedule_waves(
+                durations, available_drivers, date, to_school
             )
+            over_budget = [route for route, duration in enumerate(durations)
+                           if duration > settings.WAVE_TIME_BUDGET_MINUTES * 60]
+            if over_budget:
+                logging.warning(f"Warning: {len(over_budget)} routes take longer than the "
+                                f"{settings.WAVE_TIME_BUDGET_MINUTES} minute time budget and run on a bus of their own")
+            if unassigned:
+                skipped = sum(len(balanced_clusters[route]) for route in unassigned)
+                logging.warning(f"Warning: {len(unassigned)} routes ({skipped} students) were not scheduled - "
+                                f"not enough drivers available")
+
+            # Delete existing trips for this date and direction
+            Trip.objects.filter(trip_date=date, to_school=to_school).delete()
+
+            # Create new optimized trips
+            for assignment in assignments:
+                cluster_students = balanced_clusters[assignment['route']]
+                driver = assignment['driver']
+
+                # Calculate cluster center
+                cluster_coords = np.array([(s.coordinates.x, s.coordinates.y) for s in cluster_students])
+                center = cluster_coords.mean(axis=0)
+
+                # Create new trip
+                trip = Trip.objects.create(
+                    trip_date=date,
+                    to_school=to_school,
+                    start_time=assignment['start_time'],
+                    end_time=assignment['end_time'],
+                    wave=assignment['wave'],
+                    provisional=forecast,
+                    status='pending',
+                    driver=driver,
+                    planning_run=planning_run
+                )
+
+                # Assign students to trip
+                trip.student_list.set(cluster_students)
+
+                logging.info(f"✓ Created optimized trip for {len(cluster_students)} students with driver "
+                             f"{driver.name} (wave {assignment['wave']}, "
+                             f"{assignment['start_time']:%H:%M}-{assignment['end_time']:%H:%M})")
+                logging.info(f"  Cluster center: ({center[0]:.6f}, {center[1]:.6f})")
+
+            buses = len({assignment['driver'].pk for assignment in assignments})
+            logging.info(f"Scheduled {len(assignments)} trips on {buses} buses")
             
-            # Assign students to trip
-            trip.student_list.set(cluster_students)
-            
-            logging.info(f"✓ Created optimized trip for {len(cluster_students)} students with driver {driver.name}")
-            logging.info(f"  Cluster center: ({center[0]:.6f}, {center[1]:.6f})")
+            # Free the reserved drivers that did not get a trip
+            used_drivers = [assignment['driver'] for assignment in assignments]
+            release_drivers(date, to_school, planning_run, keep=used_drivers)
     
     except Exception as e:
         logging.error(f"Error optimizing routes: {str(e)}")
+        raise
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -152,12 +204,23 @@ if __name__ == "__main__":
         
     try:
         date = datetime.strptime(sys.argv[1], '%Y-%m-%d').date()
-        logging.info(f"Optimizing routes for date: {date}")
+        # --forecast plans from predicted attendance before the day's records exist
+        forecast = '--forecast' in sys.argv[2:]
+        logging.info(f"Optimizing routes for date: {date}" + (" (forecast)" if forecast else ""))
         
-        # Optimize both morning and afternoon routes
-        optimize_routes(date, 'to_school')
-        optimize_routes(date, 'from_school')
+        # Optimize both morning and afternoon routes; one failing does not stop the other
+        failed = []
+        for direction in ('to_school', 'from_school'):
+            try:
+                optimize_routes(date, direction, forecast)
+            except Exception:
+                failed.append(direction)
+        if failed:
+            # Non-zero exit so run_planner and the admin report the stage as failed
+            logging.error(f"Route optimization failed for {', '.join(failed)}")
+            sys.exit(1)
         
         logging.info("\nRoute optimization completed!")
     except Exception as e:
         logging.error(f"Error: {str(e)}")
+        sys.exit(1)
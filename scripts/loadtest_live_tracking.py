@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import django
+
+# Set up Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+import numpy as np
+import websockets
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from routeplan.models import Trip
+
+def make_token(user, user_type, associated_id):
+    """Access token with the same claims the Google login issues"""
+    token = AccessToken.for_user(user)
+    token['user_type'] = user_type
+    token['associated_id'] = str(associated_id)
+    return str(token)
+
+def load_fleet(date, buses):
+    """
+    Trips of a date with a driver and students, limited to `buses` trips.
+
+    Returns:
+        List of (trip_id, driver_id, [student_id, ...])
+    """
+    trips = (
+        Trip.objects
+        .filter(trip_date=date, driver__isnull=False, status__in=['pending', 'active'])
+        .prefetch_related('student_list')[:buses]
+    )
+    return [
+        (str(trip.route_plan_id), trip.driver_id, [s.student_id for s in trip.student_list.all()])
+        for trip in trips
+    ]
+
+async def drive(url, trip_id, token, rate, duration, start_point, stats):
+    """Stream points for one bus at `rate` points per second"""
+    lon, lat = start_point
+    async with websockets.connect(f"{url}/ws/driver-location/{trip_id}/?token={token}") as ws:
+        stats['drivers'] += 1
+        deadline = time.monotonic() + duration
+        # Spread the buses over the send interval
+        await asyncio.sleep(random.random() / rate)
+        while time.monotonic() < deadline:
+            lon += random.uniform(-0.0005, 0.0005)
+            lat += random.uniform(-0.0005, 0.0005)
+            await ws.send(json.dumps({
+                'longitude': lon, 'latitude': lat, 'speed': 8.0, 'timestamp': time.time(),
+            }))
+            stats['sent'] += 1
+            await asyncio.sleep(1 / rate)
+
+async def subscribe(url, student_id, token, duration, stats, latencies):
+    """Follow one student's bus and record the delivery latency of every point"""
+    async with websockets.connect(f"{url}/ws/parent-subscribe/{student_id}/?token={token}") as ws:
+        stats['subscribers'] += 1
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = json.loads(await asyncio.wait_for(ws.recv(), remaining))
+            except asyncio.TimeoutError:
+                break
+            if message.get('type') == 'location':
+                latencies.append(time.time() - message['timestamp'])
+                stats['received'] += 1
+
+def prepare(args):
+    """
+    Pick the buses and students to simulate and mint their tokens.
+    Done before the event loop starts since it uses the ORM.
+
+    Returns:
+        Tuple of ([(trip_id, driver token)], [(student_id, guardian token)])
+    """
+    user, _ = User.objects.get_or_create(
+        username='loadtest@edurider.local', defaults={'email': 'loadtest@edurider.local'}
+    )
+    fleet = load_fleet(args.date, args.buses)
+    buses = [(trip_id, make_token(user, 'driver', driver_id)) for trip_id, driver_id, _ in fleet]
+    students = [(student_id, make_token(user, 'guardian', student_id))
+                for _, _, ids in fleet for student_id in ids]
+    return buses, students
+
+async def run(args, buses, students):
+    stats = {'drivers': 0, 'subscribers': 0, 'sent': 0, 'received': 0}
+    latencies = []
+
+    # Connect the subscribers first so they see the whole stream
+    listeners = []
+    for i in range(args.subscribers):
+        student_id, token = students[i % len(students)]
+        listeners.append(asyncio.create_task(
+            subscribe(args.url, student_id, token, args.duration + args.warmup, stats, latencies)
+        ))
+        if i % 200 == 199:
+            await asyncio.sleep(0.1)
+    await asyncio.sleep(args.warmup)
+
+    print(f"Streaming {len(buses)} buses at {args.rate}/s to {stats['subscribers']} subscribers "
+          f"for {args.duration}s...")
+    school = (76.328898, 10.0482921)
+    started = time.perf_counter()
+    drivers = [
+        asyncio.create_task(drive(args.url, trip_id, token, args.rate, args.duration, school, stats))
+        for trip_id, token in buses
+    ]
+    results = await asyncio.gather(*drivers, *listeners, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    print(f"Drivers connected:     {stats['drivers']}/{len(buses)}")
+    print(f"Subscribers connected: {stats['subscribers']}/{args.subscribers}")
+    print(f"Points sent:           {stats['sent']} ({stats['sent'] / elapsed:.0f}/s)")
+    print(f"Points delivered:      {stats['received']} ({stats['received'] / elapsed:.0f}/s)")
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        print(f"Delivery latency:      p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+    if errors:
+        print(f"{len(errors)} connections failed, e.g. {errors[0]!r}")
+
+if __name__ == "__main__":
+    # Load test against a running ASGI server, e.g.:
+    # python scripts/loadtest_live_tracking.py --buses 300 --subscribers 5000
+    # Raise the open file limit first (ulimit -n 20000)
+    parser = argparse.ArgumentParser(description="Load test live location fan-out over WebSockets")
+    parser.add_argument('--url', default='ws://localhost:8000')
+    parser.add_argument('--date', type=lambda s: timezone.datetime.strptime(s, '%Y-%m-%d').date(),
+                        default=timezone.localdate(), help='Trip date (YYYY-MM-DD, default today)')
+    parser.add_argument('--buses', type=int, default=300)
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=1.0, help='Points per second per bus')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to stream')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds to wait for subscribers')
+    args = parser.parse_args()
+
+    buses, students = prepare(args)
+    if not buses:
+        print(f"No trips with drivers found for {args.date} - run cluster.py first")
+        sys.exit(1)
+    if not students:
+        print("The selected trips have no students")
+        sys.exit(1)
+    asyncio.run(run(args, buses, students))
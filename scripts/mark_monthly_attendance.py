@@ -1,69 +1,90 @@
 import os
 import sys
+import time
 import django
 import calendar
-from datetime import datetime
 
 # Set up Django environment
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
+from django.db import transaction
 from django.utils import timezone
-from students.models import Student
-from attendance.models import Attendance
+from attendance.generation import generate_monthly_attendance
+from attendance.models import Attendance, AttendanceJob
+from attendance.school_calendar import school_days
 
 def mark_monthly_attendance(year, month):
     """
     Mark attendance for all students for a given month.
-    Creates attendance records for each day.
-    Skips weekends (Saturday and Sunday).
-    
+    Creates attendance records for each school day.
+    Skips weekends and school holidays.
+
     Args:
         year (int): Year to mark attendance for
         month (int): Month to mark attendance for (1-12)
     """
-    # Get all active students
-    students = list(Student.objects.filter(is_active=True))
-    if not students:
+    started = time.perf_counter()
+    # Seed the whole month in one transaction
+    with transaction.atomic():
+        total_students, total_days, written = generate_monthly_attendance(year, month)
+    if not total_students:
         print("No active students found!")
         return
 
-    total_students = len(students)
     print(f"Found {total_students} active students")
-    
-    # Get the number of days in the month
-    num_days = calendar.monthrange(year, month)[1]
-    
-    # Process each day
-    for day in range(1, num_days + 1):
-        date = datetime(year, month, day).date()
-        
-        # Skip weekends
-        if date.weekday() >= 5:  # 5 is Saturday, 6 is Sunday
-            continue
-            
-        print(f"\nProcessing attendance for {date}...")
-        
-        # Mark attendance for each student
-        for student in students:
-            Attendance.mark_student_present(
-                student_id=student.student_id,
-                date=date
-            )
-        
-        print(f"✓ Marked {total_students} students present for {date}")
+    if Attendance.is_sparse():
+        print("Sparse attendance mode - students are present unless marked absent, nothing to write")
+        return
+    print(f"✓ Marked {total_students} students present on {total_days} school days "
+          f"({written} records in {time.perf_counter() - started:.1f}s)")
+
+def run_attendance_job(job_id):
+    """
+    Generate attendance for an AttendanceJob started from the admin.
+    Existing records are kept and progress is saved after every chunk.
+
+    Args:
+        job_id (str): ID of the AttendanceJob to run
+    """
+    job = AttendanceJob.objects.get(job_id=job_id)
+    jobs = AttendanceJob.objects.filter(job_id=job_id)
+
+    def report_progress(processed, total):
+        jobs.update(processed_students=processed, total_students=total, updated_at=timezone.now())
+        print(f"Processed {processed}/{total} students")
+
+    # Any failure is recorded on the job; one that dies silently is caught by AttendanceJob.fail_stale()
+    try:
+        jobs.update(status='running', school_days=len(school_days(job.year, job.month)),
+                    updated_at=timezone.now())
+        generate_monthly_attendance(
+            job.year, job.month,
+            user=job.created_by,
+            overwrite=False,
+            progress=report_progress,
+        )
+    except Exception as e:
+        jobs.update(status='failed', error=str(e), updated_at=timezone.now())
+        raise
+    jobs.update(status='completed', updated_at=timezone.now())
 
 if __name__ == "__main__":
+    # Started from the admin: python mark_monthly_attendance.py <year> <month> --job <job_id>
+    if '--job' in sys.argv:
+        run_attendance_job(sys.argv[sys.argv.index('--job') + 1])
+        sys.exit(0)
+
     # Get current year and month if not provided
     current_date = timezone.now()
     year = current_date.year
     month = current_date.month
-    
+
     if len(sys.argv) > 2:
         year = int(sys.argv[1])
         month = int(sys.argv[2])
-    
+
     print(f"Marking attendance for {calendar.month_name[month]} {year}")
     mark_monthly_attendance(year, month)
     print("\nCompleted marking attendance for all students!")
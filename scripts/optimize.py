@@ -101,6 +101,7 @@ def update_trip_order(trip, solution):
         route = solution["routes"][0]  # We only have one route
         stops = []
         student_order = []
+        started = datetime.fromisoformat(route["stops"][0]["eta"])
         
         for stop in route["stops"]:
             if stop["type"] == "service":
@@ -113,7 +114,8 @@ def update_trip_order(trip, solution):
                 stops.append({
                     "type": "student",
                     "coordinates": [student.coordinates.x, student.coordinates.y],
-                    "student_name": student.name
+                    "student_name": student.name,
+                    "student_id": str(student.student_id)
                 })
             elif stop["type"] in ["start", "end"]:
                 stops.append({
@@ -121,6 +123,12 @@ def update_trip_order(trip, solution):
                     "coordinates": SCHOOL_COORDINATES,
                     "location": "school"
                 })
+            else:
+                continue
+            
+            # Planned seconds from departure and meters driven, used for live ETAs
+            stops[-1]["eta_offset"] = (datetime.fromisoformat(stop["eta"]) - started).total_seconds()
+            stops[-1]["odometer"] = stop["odometer"]
         
         # Calculate total distance (in km) and duration
         total_distance = route["stops"][-1]["odometer"] / 1000  # Convert to kilometers
@@ -156,14 +164,22 @@ def update_trip_order(trip, solution):
         logging.error(f"Error updating trip order: {str(e)}")
         raise
 
-def optimize_routes(date_str):
-    """Optimize the order of students in each existing trip."""
+def optimize_routes(date_str, trip_ids=None):
+    """
+    Optimize the order of students in each existing trip.
+    
+    Args:
+        date_str (str): Date in YYYY-MM-DD format
+        trip_ids (list): Only optimize these trips (all trips of the date if empty)
+    """
     try:
         # Convert date string to date object
         date = datetime.strptime(date_str, '%Y-%m-%d').date()
         
         # Get all trips for the date
         trips = Trip.objects.filter(trip_date=date)
+        if trip_ids:
+            trips = trips.filter(route_plan_id__in=trip_ids)
         
         if not trips:
             logging.info(f"No trips found for {date}")
@@ -202,4 +218,5 @@ if __name__ == "__main__":
         sys.exit(1)
     
     date_str = sys.argv[1]
-    optimize_routes(date_str)
\ No newline at end of file
+    # Optional trip IDs after the date limit the run to those trips
+    optimize_routes(date_str, sys.argv[2:])
\ No newline at end of file
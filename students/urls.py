@@ -1,7 +1,9 @@
 from django.urls import path
 from . import views
+from attendance.views import AttendanceBatchView
 
 urlpatterns = [
+    path('presence/', AttendanceBatchView.as_view(), name='student-presence'),
     path('<uuid:student_id>/', views.StudentDetailView.as_view(), name='student-detail'),
     path('<uuid:student_id>/location/', views.StudentLocationUpdateView.as_view(), name='student-location'),
     path('<uuid:student_id>/location/coordinates/', views.StudentLocationCoordinatesUpdateView.as_view(), name='student-location-coordinates'),